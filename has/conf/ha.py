@@ -21,6 +21,360 @@ ha_period_interval = [
                help='The period interval of the hastack service'
                     ' to check the compute power status.')
 ]
+probe_scheduler_opts = [
+    cfg.IntOpt('ha_probe_tick_interval',
+               default=5,
+               min=1,
+               help='The period interval of the hastack service to reload '
+                    'the heartbeats of the compute services and probe the '
+                    'hypervisors whose probe is due; the hypervisors whose '
+                    'heartbeats are on time are checked every '
+                    'ha_period_interval seconds on average, without probing '
+                    'their BMC.'),
+    cfg.IntOpt('ha_probe_suspect_interval',
+               default=5,
+               min=1,
+               help='The period interval of the hastack service to probe a '
+                    'suspect hypervisor, i.e. one whose compute service is '
+                    'down, whose BMC could not be probed or which is not '
+                    'powered on.'),
+    cfg.FloatOpt('ha_probe_jitter',
+                 default=0.2,
+                 min=0,
+                 max=0.9,
+                 help='The fraction of ha_period_interval by which the probe '
+                      'deadline of a healthy hypervisor is randomly moved '
+                      'to spread the probes evenly over time.')
+]
+failure_detector_opts = [
+    cfg.FloatOpt('ha_phi_threshold',
+                 default=8.0,
+                 min=0,
+                 help='The suspicion level (phi) of the heartbeats of a '
+                      'compute service above which the hastack service '
+                      'probes the power status of its host; the BMCs of the '
+                      'hosts below it are left alone. 0 probes all hosts.'),
+    cfg.IntOpt('ha_phi_window_size',
+               default=100,
+               min=2,
+               help='The number of heartbeat inter-arrival times per host '
+                    'the suspicion level is computed from.'),
+    cfg.IntOpt('ha_phi_min_samples',
+               default=3,
+               min=1,
+               help='The number of heartbeat inter-arrival times needed '
+                    'before a host may be left unprobed.'),
+    cfg.FloatOpt('ha_phi_min_std',
+                 default=2.0,
+                 min=0.1,
+                 help='The minimum standard deviation (in seconds) of the '
+                      'heartbeat inter-arrival times, so that very regular '
+                      'heartbeats do not make a host suspect on the first '
+                      'late one.')
+]
+power_probe_opts = [
+    cfg.IntOpt('ha_power_probe_concurrency',
+               default=64,
+               min=1,
+               help='The maximum number of BMCs the hastack service probes '
+                    'in parallel for their power status in one cycle.'),
+    cfg.IntOpt('ha_power_probe_timeout',
+               default=10,
+               min=1,
+               help='The length of time (in seconds) a single BMC power '
+                    'probe may take before it is given up for this cycle.'),
+    cfg.IntOpt('ha_ipmi_max_sessions_per_bmc',
+               default=2,
+               min=1,
+               help='The maximum number of IPMI sessions the hastack '
+                    'service keeps open to the same BMC at a time.'),
+    cfg.IntOpt('ha_ipmi_session_idle_timeout',
+               default=300,
+               min=0,
+               help='The length of time (in seconds) after which an unused '
+                    'pooled IPMI session is logged out instead of reused.'),
+    cfg.IntOpt('ha_power_cache_ttl',
+               default=10,
+               min=0,
+               help='The length of time (in seconds) the power status '
+                    'returned by a BMC is reused instead of probing it '
+                    'again; 0 disables the cache.'),
+    cfg.IntOpt('ha_bmc_breaker_threshold',
+               default=3,
+               min=1,
+               help='The number of failed probes in a row after which the '
+                    'hastack service stops probing a BMC for a while.'),
+    cfg.IntOpt('ha_bmc_breaker_backoff',
+               default=30,
+               min=1,
+               help='The length of time (in seconds) a failing BMC is not '
+                    'probed after its breaker opened the first time; it '
+                    'doubles each time the trial probe fails again.'),
+    cfg.IntOpt('ha_bmc_breaker_max_backoff',
+               default=600,
+               min=1,
+               help='The maximum length of time (in seconds) a failing BMC '
+                    'is not probed.')
+]
+node_cache_opts = [
+    cfg.IntOpt('ha_node_cache_full_sync_interval',
+               default=600,
+               min=0,
+               help='The period (in seconds) after which the hastack '
+                    'service reloads all compute nodes instead of only the '
+                    'ones changed since its last refresh.')
+]
+verify_migration_opts = [
+    cfg.IntOpt('ha_confirm_resize_concurrency',
+               default=8,
+               min=1,
+               help='The maximum number of resizes of automatically '
+                    'migrated instances the hastack service confirms in '
+                    'parallel.')
+]
+placement_opts = [
+    cfg.IntOpt('ha_placement_batch_size',
+               default=32,
+               min=1,
+               help='The maximum number of instances of a failed hypervisor '
+                    'the hastack service asks the scheduler to place in a '
+                    'single request.'),
+    cfg.IntOpt('ha_evacuate_concurrency',
+               default=16,
+               min=1,
+               help='The maximum number of evacuate calls the hastack '
+                    'service makes in parallel across all failed '
+                    'hypervisors; the has:max_parallel_rebuilds and '
+                    'has:max_parallel_dest_rebuilds limits still apply.'),
+    cfg.FloatOpt('ha_evacuate_rate',
+                 default=5.0,
+                 min=0,
+                 help='The average number of evacuate calls per second the '
+                      'hastack service starts across all failed '
+                      'hypervisors, which are served in turn; 0 disables '
+                      'the limit.'),
+    cfg.IntOpt('ha_evacuate_burst',
+               default=20,
+               min=1,
+               help='The number of evacuate calls the hastack service may '
+                    'start at once, above ha_evacuate_rate, after it has '
+                    'been idle.')
+]
+aimd_opts = [
+    cfg.IntOpt('ha_aimd_initial_window',
+               default=5,
+               min=1,
+               help='The number of rebuilds a host may have in flight, as a '
+                    'source or destination, before the hastack service has '
+                    'observed how fast they are handled; the window then '
+                    'adapts up to has:max_parallel_rebuilds or '
+                    'has:max_parallel_dest_rebuilds. The default is the '
+                    'default has:max_parallel_rebuilds, so that the hosts '
+                    'start at their full parallelism.'),
+    cfg.FloatOpt('ha_aimd_decrease_factor',
+                 default=0.5,
+                 min=0.1,
+                 max=0.9,
+                 help='The factor the rebuild window of a host is multiplied '
+                      'by when a call times out, finds no valid host or is '
+                      'slow.'),
+    cfg.IntOpt('ha_aimd_latency_threshold',
+               default=10,
+               min=1,
+               help='The length of time (in seconds) after which a '
+                    'select_destinations or evacuate call is deemed slow.')
+]
+context_opts = [
+    cfg.IntOpt('ha_token_refresh_margin',
+               default=300,
+               min=0,
+               help='The length of time (in seconds) before its expiry at '
+                    'which the cached keystone token of the hastack service '
+                    'is refreshed.')
+]
+detection_opts = [
+    cfg.ListOpt('ha_detection_drivers',
+                default=[],
+                help='The drivers checking the hosts which are powered on, '
+                     'in order; each one only checks the hosts which passed '
+                     'the ones before it, so cheaper checks come first. None '
+                     'is run unless it is listed here: '
+                     'hastack.has.stack.haservice.detection_driver.driver.'
+                     'ComputeProcessDetectionDriver raises an alarm for the '
+                     'hosts whose compute heartbeat file is missing from '
+                     'heartbeat_file_path, so it needs the heartbeat files '
+                     'of the compute hosts to be shared onto the HA node; '
+                     'hastack.has.stack.haservice.detection_driver.driver.'
+                     'NetworkDetectionDriver fences and evacuates the hosts '
+                     'which do not answer on ha_network_probe_ports.'),
+    cfg.IntOpt('ha_detection_timeout',
+               default=10,
+               min=1,
+               help='The length of time (in seconds) a detection driver may '
+                    'take to check a single host before its result is deemed '
+                    'inconclusive, unless the driver sets its own.'),
+    cfg.IntOpt('ha_detection_concurrency',
+               default=32,
+               min=1,
+               help='The maximum number of hosts a detection driver checks '
+                    'in parallel, unless the driver sets its own.'),
+    cfg.ListOpt('ha_network_probe_ports',
+                default=['22'],
+                help='The TCP ports on the host_ip of a compute node the '
+                     'hastack service connects to in order to check the '
+                     'network of the host; a refused connection still '
+                     'proves the host is reachable.'),
+    cfg.IntOpt('ha_network_probe_timeout',
+               default=3,
+               min=1,
+               help='The length of time (in seconds) after which a TCP '
+                    'connection to a port of a host is deemed unanswered.'),
+    cfg.StrOpt('ha_compute_heartbeat_file',
+               default='nova-compute-%(host)s.heartbeat',
+               help='The name of the heartbeat file of the compute process '
+                    'of a host in heartbeat_file_path; %(host)s is replaced '
+                    'by the service host.'),
+    cfg.IntOpt('ha_compute_heartbeat_max_age',
+               default=0,
+               min=0,
+               help='The length of time (in seconds) after which the '
+                    'heartbeat file of a compute process is deemed stale; '
+                    '0 only checks that it exists.')
+]
+host_suspect_opts = [
+    cfg.StrOpt('haservice_topic',
+               default='haservice',
+               help='The topic the HA service listens on.'),
+    cfg.FloatOpt('ha_host_suspect_rate',
+                 default=1.0,
+                 min=0,
+                 help='The average number of host_suspect reports per second '
+                      'the hastack service evaluates at once; the others '
+                      'are dropped and the hosts are left to the periodic '
+                      'probes. 0 disables the limit.'),
+    cfg.IntOpt('ha_host_suspect_burst',
+               default=5,
+               min=1,
+               help='The number of host_suspect reports the hastack service '
+                    'may evaluate at once, above ha_host_suspect_rate, after '
+                    'it has been idle.'),
+    cfg.IntOpt('ha_host_suspect_min_interval',
+               default=30,
+               min=0,
+               help='The length of time (in seconds) during which further '
+                    'host_suspect reports of a host which was evaluated are '
+                    'dropped.')
+]
+checkpoint_opts = [
+    cfg.BoolOpt('ha_checkpoint_state',
+                default=False,
+                help='Whether the hastack service checkpoints the state of '
+                     'its evacuations to has_compute_status_file and '
+                     'restores it when it starts.'),
+    cfg.IntOpt('ha_checkpoint_interval',
+               default=5,
+               min=0,
+               help='The minimum length of time (in seconds) between two '
+                    'checkpoints of the HA state; all the changes made in '
+                    'between are written and synced to disk at once.'),
+    cfg.IntOpt('ha_checkpoint_compact_records',
+               default=10000,
+               min=1,
+               help='The number of changes in the journal of the HA state '
+                    'after which the state is written to a new snapshot and '
+                    'the journal is truncated.')
+]
+tracking_opts = [
+    cfg.IntOpt('ha_action_ttl',
+               default=86400,
+               min=1,
+               help='The length of time (in seconds) after which an HA '
+                    'action whose end notification was not received is '
+                    'forgotten.'),
+    cfg.IntOpt('ha_action_max_entries',
+               default=10000,
+               min=1,
+               help='The maximum number of HA actions in flight tracked by '
+                    'the hastack service; the oldest ones are forgotten '
+                    'first.'),
+    cfg.IntOpt('ha_error_inst_ttl',
+               default=604800,
+               min=1,
+               help='The length of time (in seconds) after which the retry '
+                    'count of an instance which failed to be moved is '
+                    'forgotten, e.g. once the instance has been deleted.'),
+    cfg.IntOpt('ha_error_inst_max_entries',
+               default=1000,
+               min=1,
+               help='The maximum number of retry counts of instances kept '
+                    'per hypervisor; the oldest ones are forgotten first.')
+]
+notification_opts = [
+    cfg.BoolOpt('ha_notification_listener',
+                default=False,
+                help='Whether the hastack service consumes the notifications '
+                     'of nova to track the evacuations it started, instead '
+                     'of polling the database for them every cycle.'),
+    cfg.ListOpt('ha_notification_topics',
+                default=['notifications'],
+                help='The topics the notifications of nova are sent on.'),
+    cfg.StrOpt('ha_notification_pool',
+               default='hastack-haservice',
+               help='The listener pool of the hastack service, so that it '
+                    'gets a copy of the notifications consumed by others.'),
+    cfg.IntOpt('ha_notification_batch_size',
+               default=100,
+               min=1,
+               help='The maximum number of notifications handed to the HA '
+                    'engine at once.'),
+    cfg.IntOpt('ha_notification_batch_timeout',
+               default=1,
+               min=1,
+               help='The length of time (in seconds) the listener waits for '
+                    'a batch of notifications to fill up.'),
+    cfg.IntOpt('ha_notification_workers',
+               default=4,
+               min=1,
+               help='The number of workers handling the notifications; the '
+                    'notifications of an instance are always handled by the '
+                    'same worker, in order.'),
+    cfg.IntOpt('ha_notification_queue_size',
+               default=1000,
+               min=1,
+               help='The maximum number of notifications queued per worker; '
+                    'the listener stops consuming while a queue is full.'),
+    cfg.IntOpt('ha_notification_reconcile_interval',
+               default=300,
+               min=0,
+               help='The length of time (in seconds) between two '
+                    'reconciliations of the evacuations in flight with the '
+                    'database while the notification listener is running.')
+]
+instance_index_opts = [
+    cfg.BoolOpt('ha_instance_index',
+                default=False,
+                help='Whether the hastack service selects the instances of a '
+                     'failed host from an index kept in memory instead of '
+                     'the database; the index is kept current from the '
+                     'notifications of nova, so it is only used while '
+                     'ha_notification_listener is set. nova must send the '
+                     'compute.instance.update notifications of all state '
+                     'changes, i.e. notify_on_state_change must be set to '
+                     'vm_and_task_state in nova.conf, or the index misses '
+                     'the changes of the vm_state and task_state of the '
+                     'instances until it is reloaded.'),
+    cfg.IntOpt('ha_instance_index_page_size',
+               default=1000,
+               min=1,
+               help='The number of instances loaded per query when the '
+                    'instance index is loaded from the database.'),
+    cfg.IntOpt('ha_instance_index_reconcile_interval',
+               default=600,
+               min=1,
+               help='The length of time (in seconds) after which the '
+                    'instance index is loaded from the database again, to '
+                    'catch the notifications which were lost.')
+]
 heartbeat_ha_opts = [
     cfg.StrOpt('heartbeat_file_path',
                default='/etc/watchdog/zombie/',
@@ -96,6 +450,20 @@ has_driver_options = [
 
 
 ALL_OPTS = (ha_period_interval +
+            probe_scheduler_opts +
+            failure_detector_opts +
+            power_probe_opts +
+            node_cache_opts +
+            verify_migration_opts +
+            placement_opts +
+            aimd_opts +
+            context_opts +
+            detection_opts +
+            host_suspect_opts +
+            checkpoint_opts +
+            tracking_opts +
+            notification_opts +
+            instance_index_opts +
             heartbeat_ha_opts +
             driver_opts +
             maintenance_migrate_retry +
@@ -0,0 +1,135 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Power status cache and circuit breakers for the BMC probes."""
+
+import time
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import constants as ha_constants
+
+from oslo_log import log as logging
+
+_LI = has_gettextutils._LI
+_LW = has_gettextutils._LW
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class _Breaker(object):
+    __slots__ = ('state', 'failures', 'opened', 'retry_at')
+
+    def __init__(self):
+        self.state = ha_constants.BREAKER_CLOSED
+        self.failures = 0
+        # number of times in a row the breaker has been opened
+        self.opened = 0
+        self.retry_at = 0
+
+
+class PowerProbeGuard(object):
+    """Caches the power status of the BMCs and trips on broken ones.
+
+    A successful probe result is reused for CONF.ha_power_cache_ttl
+    seconds. After CONF.ha_bmc_breaker_threshold failed probes in a row the
+    breaker of the BMC opens and its probes are skipped; once the backoff
+    (doubled each time the breaker opens again, up to
+    CONF.ha_bmc_breaker_max_backoff) has elapsed, a single trial probe is
+    let through (half-open) which either closes or re-opens the breaker.
+    """
+    def __init__(self):
+        # {bmc: (status, probed at)}
+        self._results = {}
+        self._breakers = {}
+
+    def _breaker(self, bmc):
+        breaker = self._breakers.get(bmc)
+        if breaker is None:
+            breaker = self._breakers[bmc] = _Breaker()
+        return breaker
+
+    def get_cached(self, bmc):
+        """Get the cached power status of a BMC; None if expired."""
+        result = self._results.get(bmc)
+        if result is None:
+            return None
+        status, probed_at = result
+        if time.time() - probed_at >= CONF.ha_power_cache_ttl:
+            self._results.pop(bmc, None)
+            return None
+        return status
+
+    def allow(self, bmc):
+        """Determine if the BMC may be probed now."""
+        breaker = self._breaker(bmc)
+        if breaker.state == ha_constants.BREAKER_CLOSED:
+            return True
+        if (breaker.state == ha_constants.BREAKER_OPEN and
+                time.time() >= breaker.retry_at):
+            breaker.state = ha_constants.BREAKER_HALF_OPEN
+            LOG.info(_LI("Probing the BMC %(bmc)s once to find out whether "
+                         "it answers again.") % {'bmc': bmc})
+            return True
+        return False
+
+    def retry_in(self, bmc):
+        """Get the seconds left until the BMC may be probed again."""
+        return max(0, self._breaker(bmc).retry_at - time.time())
+
+    def record_success(self, bmc, status):
+        self._results[bmc] = (status, time.time())
+        breaker = self._breaker(bmc)
+        if breaker.state != ha_constants.BREAKER_CLOSED:
+            LOG.info(_LI("The BMC %(bmc)s answered again; its probes are "
+                         "resumed.") % {'bmc': bmc})
+        self._breakers[bmc] = _Breaker()
+
+    def record_failure(self, bmc):
+        """Count a failed probe.
+
+        :returns: True if the breaker of the BMC has just opened
+        """
+        self._results.pop(bmc, None)
+        breaker = self._breaker(bmc)
+        breaker.failures += 1
+        if (breaker.state != ha_constants.BREAKER_HALF_OPEN and
+                breaker.failures < CONF.ha_bmc_breaker_threshold):
+            return False
+        breaker.opened += 1
+        backoff = min(CONF.ha_bmc_breaker_backoff *
+                      2 ** (breaker.opened - 1),
+                      CONF.ha_bmc_breaker_max_backoff)
+        breaker.state = ha_constants.BREAKER_OPEN
+        breaker.retry_at = time.time() + backoff
+        LOG.warning(_LW("The BMC %(bmc)s failed %(failures)d probe(s) in a "
+                        "row; it will not be probed again for %(backoff)d "
+                        "seconds.")
+                    % {'bmc': bmc, 'failures': breaker.failures,
+                       'backoff': backoff})
+        return True
+
+    def get_states(self):
+        """Get the breaker state of every BMC which ever failed a probe.
+
+        :returns: {bmc: {'state': xx, 'failures': xx, 'retry_at': xx}}
+        """
+        return dict((bmc, {'state': breaker.state,
+                           'failures': breaker.failures,
+                           'retry_at': breaker.retry_at})
+                    for bmc, breaker in self._breakers.items()
+                    if breaker.failures)
@@ -0,0 +1,79 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Checkpoint of the HA engine state in the has_compute_status_file."""
+
+import time
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack.haservice import utils as ha_utils
+from hastack.has.stack import hv_journal
+
+CONF = ha_conf.CONF
+
+
+class StatusCheckpoint(object):
+    """Journaled checkpoint of a HypervisorStatus on the local disk.
+
+    The changes of the status are appended to the journal of
+    CONF.has_compute_status_file at most once every
+    CONF.ha_checkpoint_interval seconds, so all the changes made in between
+    share one fsync. Once the journal holds
+    CONF.ha_checkpoint_compact_records changes, the status is compacted
+    into a new snapshot instead.
+    """
+    def __init__(self, path=None):
+        self.journal = hv_journal.StatusJournal(
+            path or CONF.has_compute_status_file)
+        self.path = self.journal.path
+        self._last_write = None
+
+    def load(self):
+        """Load the status checkpointed last.
+
+        :returns: a HypervisorStatus recording its changes for the next
+                  checkpoint; it is empty if there was no valid checkpoint
+        """
+        status, intact = self.journal.load()
+        doc = status.get_json()
+        doc['maintenance'] = {}
+        ha_utils.check_hv_status_json_keys(doc)
+        for hv_name in set(status.ha_hvs) - set(doc['ha']):
+            # corrupted
+            del status.ha_hvs[hv_name]
+        if not intact:
+            # start over from what could be read
+            self.journal.compact(status)
+        return status
+
+    def save(self, status, force=False):
+        """Write the changes of the status if it is due.
+
+        :param status: the HypervisorStatus returned by load
+        :param force: True to write them even if the last write is recent
+        :returns: True if anything was written
+        """
+        now = time.time()
+        if (not force and self._last_write is not None and
+                now - self._last_write < CONF.ha_checkpoint_interval):
+            return False
+        if self.journal.records >= CONF.ha_checkpoint_compact_records:
+            self.journal.compact(status)
+            written = True
+        else:
+            written = self.journal.flush()
+        if written:
+            self._last_write = now
+        return written
@@ -0,0 +1,105 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Adaptive concurrency of the rebuilds driven by the observed latency."""
+
+import time
+
+import eventlet
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+import hastack.openstack.openstack_constants as openstack_constants
+
+from oslo_log import log as logging
+import oslo_messaging as messaging
+
+_LI = has_gettextutils._LI
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+# errors meaning the control plane or the cloud is saturated
+CONGESTION_ERRORS = (openstack_constants.NoValidHost,
+                     messaging.MessagingTimeout,
+                     eventlet.Timeout)
+
+
+class AIMDLimiter(object):
+    """Additive-increase/multiplicative-decrease windows per host.
+
+    The window of a host is the number of rebuilds it may have in flight.
+    It starts at CONF.ha_aimd_initial_window and grows by one for every
+    window's worth of calls which succeeded within
+    CONF.ha_aimd_latency_threshold seconds; a call which failed with one of
+    CONGESTION_ERRORS or took longer multiplies it by
+    CONF.ha_aimd_decrease_factor. The calls which were in flight when the
+    window was cut report the same congestion, so only a call started after
+    the last cut may cut it again. It never drops below 1 nor exceeds the
+    has:max_parallel_* limit it was last read with.
+    """
+    def __init__(self):
+        self._windows = {}
+        self._limits = {}
+        # {host: time the window was last cut}
+        self._cut_at = {}
+
+    def window(self, host, limit):
+        """Get the number of rebuilds the host may have in flight."""
+        self._limits[host] = limit
+        window = self._windows.setdefault(
+            host, float(min(CONF.ha_aimd_initial_window, limit)))
+        return max(1, min(int(window), limit))
+
+    def record(self, host, latency, exc=None):
+        """Adjust the window of a host after a call.
+
+        :param latency: the seconds the call took
+        :param exc: the exception the call raised, if any
+        """
+        limit = self._limits.get(host)
+        window = self._windows.get(host)
+        if limit is None or window is None:
+            return
+        now = time.time()
+        if (isinstance(exc, CONGESTION_ERRORS) or
+                latency > CONF.ha_aimd_latency_threshold):
+            if now - latency < self._cut_at.get(host, 0):
+                # the window was cut while the call was in flight
+                return
+            self._cut_at[host] = now
+            new_window = max(1.0, window * CONF.ha_aimd_decrease_factor)
+            if int(new_window) < int(window):
+                LOG.info(_LI("Reduced the rebuild window of %(host)s to "
+                             "%(window)d after a call took %(latency).1f "
+                             "seconds: %(error)s")
+                         % {'host': host, 'window': int(new_window),
+                            'latency': latency, 'error': exc})
+        elif exc is None:
+            new_window = min(float(limit), window + 1.0 / window)
+            if int(new_window) > int(window):
+                LOG.info(_LI("Raised the rebuild window of %(host)s to "
+                             "%(window)d.")
+                         % {'host': host, 'window': int(new_window)})
+        else:
+            # other errors say nothing about the load
+            return
+        self._windows[host] = new_window
+
+    def windows(self):
+        """Get the current window of every host."""
+        return dict((host, self.window(host, self._limits[host]))
+                    for host in self._windows)
@@ -55,6 +55,49 @@ DEFAULT_PARALLEL_REBUILD = 5
 # default number of max parallel rebuild instances on the destination host
 DEFAULT_PARALLEL_DEST_REBUILD = 0x7FFFFFFF
 
+# margin (in seconds) subtracted from the compute node cache watermark to
+# tolerate clock skew between the hosts updating the compute_nodes rows
+NODE_CACHE_WATERMARK_MARGIN = 60
+
+# margin (in seconds) subtracted from the watermark of the finished
+# migrations, as their updated_at is set by the clock of the nova service
+# which wrote them and they may commit out of order
+MIGRATION_WATERMARK_MARGIN = 60
+
+# states of the BMC probe circuit breakers
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half-open'
+
+# results of the checks of the detection pipeline; a host which passed a
+# stage is checked by the next one, the others get an action verdict
+DETECTION_PASS = 'pass'
+VERDICT_EVACUATE = 'evacuate'
+VERDICT_ALARM = 'alarm'
+VERDICT_NOOP = 'noop'
+
+# notifications of nova ending the moves started by HA; the failures map
+# to whether the move was a live migration
+NOTIFY_MOVE_SUCCESS = ('compute.instance.rebuild.end',
+                       'compute.instance.live_migration.post.dest.end',
+                       'compute.instance.finish_resize.end')
+NOTIFY_MOVE_FAIL = {'compute.instance.live_migration._rollback.end': True,
+                    'compute_task.rebuild_server': False,
+                    'compute_task.migrate_server': False}
+# fails the move when the instance goes into the error state
+NOTIFY_INSTANCE_UPDATE = 'compute.instance.update'
+# notifications of nova updating the instance index
+NOTIFY_INSTANCE_DELETE = 'compute.instance.delete.end'
+NOTIFY_INSTANCE_INDEX = (NOTIFY_INSTANCE_UPDATE,
+                         NOTIFY_INSTANCE_DELETE,
+                         'compute.instance.create.end',
+                         'compute.instance.rebuild.end',
+                         'compute.instance.finish_resize.end',
+                         'compute.instance.resize.revert.end',
+                         'compute.instance.live_migration.post.dest.end',
+                         'compute.instance.unshelve.end',
+                         'compute.instance.shelve_offload.end')
+
 # prefix for request_id that HA did
 PREFIX_HAS_HA = 'has-ha-'
 
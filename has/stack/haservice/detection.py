@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Staged detection of the failures of the hosts which are powered on."""
+
+import eventlet
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import constants as ha_constants
+
+from oslo_log import log as logging
+from oslo_utils import importutils
+import six
+
+_LW = has_gettextutils._LW
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class DetectionPipeline(object):
+    """Run the detection drivers stage by stage.
+
+    Each stage checks its hosts concurrently, at most driver.concurrency at a
+    time and each within driver.timeout seconds, and only the hosts which
+    passed it are checked by the next one. A check which times out or fails
+    is inconclusive and lets the host pass, so that no action is taken on a
+    host because of a flaky check.
+    """
+    def __init__(self, drivers=None):
+        if drivers is None:
+            drivers = [importutils.import_object(driver)
+                       for driver in CONF.ha_detection_drivers]
+        self.drivers = drivers
+
+    def _run_stage(self, driver, context, nodes, services):
+        timeout = driver.timeout
+        pool = eventlet.GreenPool(driver.concurrency)
+
+        def _check(node):
+            try:
+                with eventlet.Timeout(timeout):
+                    return node, driver.check_host(context, node,
+                                                   services=services)
+            except eventlet.Timeout:
+                reason = 'timed out after %s seconds' % timeout
+            except Exception as e:
+                reason = six.text_type(e)
+            LOG.warning(_LW("The check of %(node)s by %(driver)s is "
+                            "inconclusive: %(reason)s")
+                        % {'node': node['hypervisor_hostname'],
+                           'driver': driver.__class__.__name__,
+                           'reason': reason})
+            return node, ha_constants.DETECTION_PASS
+
+        return pool.imap(_check, nodes)
+
+    def run(self, context, nodes, services=None):
+        """Check the hosts.
+
+        :param context: nova context
+        :param nodes: the compute nodes which are powered on
+        :param services: ServiceSnapshot of the current cycle
+        :returns: dict of hypervisor_hostname -> verdict
+        """
+        verdicts = {}
+        for driver in self.drivers:
+            if not nodes:
+                break
+            passed = []
+            for node, result in self._run_stage(driver, context, nodes,
+                                                services):
+                if result == ha_constants.DETECTION_PASS:
+                    passed.append(node)
+                else:
+                    verdicts[node['hypervisor_hostname']] = result
+            nodes = passed
+        for node in nodes:
+            verdicts[node['hypervisor_hostname']] = ha_constants.VERDICT_NOOP
+        return verdicts
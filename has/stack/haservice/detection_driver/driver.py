@@ -0,0 +1,123 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import os
+import socket
+import time
+
+from oslo_log import log as logging
+import six
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import constants as ha_constants
+from hastack.has.stack.haservice import driver
+
+_LW = has_gettextutils._LW
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class NetworkDetectionDriver(driver.HADetectionBaseDriver):
+    """Check the network of a host by TCP.
+
+    A connection is opened to each port of CONF.ha_network_probe_ports on
+    the host_ip of the node until one of them answers. A host none of them
+    answers is fenced and evacuated unless its compute service is up, so
+    the driver is not in CONF.ha_detection_drivers by default.
+    """
+    # seconds the check is given on top of its connection attempts, so that
+    # a host which answers none of them gets a verdict instead of timing out
+    timeout_margin = 2
+
+    @property
+    def timeout(self):
+        return (CONF.ha_network_probe_timeout *
+                max(len(CONF.ha_network_probe_ports), 1) +
+                self.timeout_margin)
+
+    @staticmethod
+    def _reachable(address, port):
+        try:
+            sock = socket.create_connection((address, port),
+                                            CONF.ha_network_probe_timeout)
+        except socket.error as e:
+            # a reset is sent by the host itself
+            return e.errno == errno.ECONNREFUSED
+        sock.close()
+        return True
+
+    def check_host(self, context, node, services=None):
+        try:
+            address = node['host_ip']
+        except Exception:
+            # unset fields of ComputeNode objects cannot be lazy-loaded
+            address = None
+        if not address or not CONF.ha_network_probe_ports:
+            return ha_constants.DETECTION_PASS
+        address = six.text_type(address)
+        for port in CONF.ha_network_probe_ports:
+            if self._reachable(address, int(port)):
+                return ha_constants.DETECTION_PASS
+
+        if services is not None and services.is_up(node['host']):
+            # the compute service still reports through another network
+            LOG.warning(_LW("%(node)s is powered on but %(address)s does not "
+                            "answer while its compute service is up.")
+                        % {'node': node['hypervisor_hostname'],
+                           'address': address})
+            return ha_constants.VERDICT_ALARM
+        LOG.warning(_LW("%(node)s is powered on but %(address)s does not "
+                        "answer.")
+                    % {'node': node['hypervisor_hostname'],
+                       'address': address})
+        return ha_constants.VERDICT_EVACUATE
+
+
+class ComputeProcessDetectionDriver(driver.HADetectionBaseDriver):
+    """Check the compute process of a host by its heartbeat file.
+
+    The heartbeat files of the compute hosts must be shared onto the HA node
+    in CONF.heartbeat_file_path; the directory itself always exists there, as
+    the HA service writes its own heartbeat file into it, so a host whose file
+    is missing gets an alarm. The hosts are not checked if the directory does
+    not exist.
+    """
+
+    def check_host(self, context, node, services=None):
+        if not os.path.isdir(CONF.heartbeat_file_path):
+            return ha_constants.DETECTION_PASS
+        path = os.path.join(CONF.heartbeat_file_path,
+                            CONF.ha_compute_heartbeat_file %
+                            {'host': node['host']})
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            LOG.warning(_LW("The heartbeat file %(path)s of the compute "
+                            "process of %(node)s does not exist.")
+                        % {'path': path, 'node': node['hypervisor_hostname']})
+            return ha_constants.VERDICT_ALARM
+        max_age = CONF.ha_compute_heartbeat_max_age
+        if max_age and age > max_age:
+            LOG.warning(_LW("The heartbeat file %(path)s of the compute "
+                            "process of %(node)s was not updated for "
+                            "%(age)d seconds.")
+                        % {'path': path, 'node': node['hypervisor_hostname'],
+                           'age': age})
+            return ha_constants.VERDICT_ALARM
+        return ha_constants.DETECTION_PASS
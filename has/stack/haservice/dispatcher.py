@@ -0,0 +1,137 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Concurrent dispatching of the evacuations of a cycle."""
+
+import eventlet
+from eventlet import event
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import rate_limiter
+
+from oslo_log import log as logging
+
+_LE = has_gettextutils._LE
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class _Batch(object):
+    """The evacuations of a hypervisor dispatched together."""
+    def __init__(self, size, on_done):
+        self.results = [None] * size
+        self.pending = size
+        self.on_done = on_done
+        self.done = event.Event()
+
+
+class EvacuationDispatcher(object):
+    """Runs the evacuate calls of all failed hypervisors on one pool.
+
+    At most CONF.ha_evacuate_concurrency calls run at the same time, shared
+    by all the hypervisors, so the evacuations of a host start back-to-back
+    and several hosts are evacuated at once. The callers keep admitting the
+    evacuations against the parallel rebuild limits before dispatching them.
+
+    The calls are started at no more than CONF.ha_evacuate_rate per second
+    (with bursts of CONF.ha_evacuate_burst), so that a correlated failure of
+    many hosts does not hit the scheduler, the conductors and the storage
+    all at once; the calls waiting for their turn are queued per hypervisor
+    and the hypervisors are served round-robin.
+    """
+    def __init__(self):
+        self._pool = eventlet.GreenPool(CONF.ha_evacuate_concurrency)
+        self._bucket = rate_limiter.TokenBucket(CONF.ha_evacuate_rate,
+                                                CONF.ha_evacuate_burst)
+        self._queue = rate_limiter.FairQueue()
+        self._pump = None
+        self._batches = set()
+
+    def dispatch(self, jobs, func, on_done, key=None):
+        """Run func(*job) for each job concurrently.
+
+        :param jobs: the arguments of each call
+        :param func: the evacuate function; it returns True on success and
+                     handles its own errors
+        :param on_done: called with the list of results once all of the
+                        calls returned; called at once if there are no jobs
+        :param key: the hypervisor the jobs belong to, which they are
+                    queued under
+        """
+        if not jobs:
+            on_done([])
+            return
+        batch = _Batch(len(jobs), on_done)
+        self._batches.add(batch)
+        for index, job in enumerate(jobs):
+            self._queue.put(key, (batch, index, func, job))
+        if self._pump is None:
+            self._pump = eventlet.spawn(self._run_pump)
+
+    def _run_pump(self):
+        try:
+            while self._queue:
+                delay = self._bucket.consume()
+                if delay:
+                    eventlet.sleep(delay)
+                    continue
+                # wait for a free slot before taking the call off the queue,
+                # so that it is counted as queued meanwhile; the pump is the
+                # only one spawning, so the slot is still free below
+                self._pool.sem.acquire()
+                self._pool.sem.release()
+                self._pool.spawn_n(self._run, *self._queue.get())
+        finally:
+            self._pump = None
+
+    def _run(self, batch, index, func, job):
+        try:
+            result = func(*job)
+        except Exception:
+            LOG.exception(_LE("Unexpected error while dispatching an "
+                              "evacuation."))
+            result = False
+        batch.results[index] = result
+        batch.pending -= 1
+        if batch.pending:
+            return
+        self._batches.discard(batch)
+        try:
+            batch.on_done(batch.results)
+        except Exception:
+            LOG.exception(_LE("Failed to handle the results of %d "
+                              "evacuation(s).") % len(batch.results))
+        finally:
+            batch.done.send()
+
+    def queue_depth(self):
+        """Number of evacuate calls waiting to be started."""
+        return len(self._queue)
+
+    def queue_depths(self):
+        """Number of evacuate calls waiting to be started per hypervisor."""
+        return self._queue.depths()
+
+    def running(self):
+        """Number of evacuate calls in progress."""
+        return self._pool.running()
+
+    def wait(self):
+        """Wait until all the dispatched evacuations have returned."""
+        while self._batches:
+            next(iter(self._batches)).done.wait()
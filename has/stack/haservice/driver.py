@@ -13,6 +13,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hastack.has.conf as ha_conf
+
+CONF = ha_conf.CONF
+
 
 class HAHypervisorBaseDriver(object):
     """Driver for HA service to load hypervisors and instances
@@ -46,6 +50,20 @@ class HAHypervisorBaseDriver(object):
         """
         raise NotImplementedError()
 
+    def hypervisors_are_up(self, context, hv_names, **kwargs):
+        """Determine which of the hypervisors are up.
+
+        Drivers that can check all hypervisors at once should override this
+        method; the default one falls back to hypervisor_is_up.
+
+        :param context: nova context
+        :param hv_names: names of the hypervisors
+        :return: {hv_name: True if the hypervisor is deemed up}
+        """
+        return dict((hv_name, self.hypervisor_is_up(context, hv_name,
+                                                    **kwargs))
+                    for hv_name in hv_names)
+
     def get_target_service_host(self, context, ha_action, hv_name):
         """Get target host
 
@@ -111,3 +129,35 @@ class HAFencingBaseDriver(object):
         :return: [(instance, action)]
         """
         raise NotImplementedError()
+
+
+class HADetectionBaseDriver(object):
+    """Driver for one stage of the HA detection pipeline
+
+    Only the hosts which are powered on and passed the drivers before it are
+    checked; exploiters should implement this to write their own driver.
+    """
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @property
+    def timeout(self):
+        """The length of time (in seconds) a check of a host may take."""
+        return CONF.ha_detection_timeout
+
+    @property
+    def concurrency(self):
+        """The maximum number of hosts checked in parallel."""
+        return CONF.ha_detection_concurrency
+
+    def check_host(self, context, node, services=None):
+        """Check a host
+
+        :param context: nova context
+        :param node: compute node of the host
+        :param services: ServiceSnapshot of the current cycle
+        :return: constants.DETECTION_PASS if the next driver should check the
+                 host, or the verdict on it: constants.VERDICT_EVACUATE,
+                 constants.VERDICT_ALARM or constants.VERDICT_NOOP
+        """
+        raise NotImplementedError()
@@ -15,15 +15,36 @@
 
 """Base engine for HA and maintenance."""
 
-import ast
+import collections
+import copy
+import datetime
+import functools
+import time
+
 import eventlet
 
 import hastack.has.conf as ha_conf
 from hastack.has.stack import constants
 from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import bmc_breaker
+from hastack.has.stack.haservice import checkpoint
+from hastack.has.stack.haservice import concurrency
 from hastack.has.stack.haservice import constants as ha_constants
+from hastack.has.stack.haservice import detection
+from hastack.has.stack.haservice import dispatcher
+from hastack.has.stack.haservice import exception as service_exception
+from hastack.has.stack.haservice import expiring_map
+from hastack.has.stack.haservice import failure_detector
+from hastack.has.stack.haservice import instance_index
 from hastack.has.stack.haservice import ipmi_utils
-from hastack.has.stack.haservice import utils as ha_utils
+from hastack.has.stack.haservice import move_deadlines
+from hastack.has.stack.haservice import node_cache
+from hastack.has.stack.haservice import placement
+from hastack.has.stack.haservice import probe_scheduler
+from hastack.has.stack.haservice import rate_limiter
+from hastack.has.stack.haservice import rebuild_ledger
+from hastack.has.stack.haservice import service_snapshot
+from hastack.has.stack import hv_status
 from hastack.has.stack import utils
 from hastack.openstack.openstack_api.api import ComputeAPI
 from hastack.openstack.openstack_api.api import ComputeRpcAPI
@@ -34,6 +55,7 @@ import hastack.openstack.openstack_utils as openstack_utils
 
 from oslo_log import log as logging
 from oslo_utils import importutils
+from oslo_utils import uuidutils
 import six
 
 _ = has_gettextutils._
@@ -54,6 +76,12 @@ class BasePolicyEngine(object):
         self.compute_rpcapi = ComputeRpcAPI()
         self.event_types = {}
         self.scheduler_rpcapi = SchedulerRpcAPI()
+        self.placement = placement.PlacementPlanner(self.compute_api,
+                                                    self.scheduler_rpcapi)
+        self.dispatcher = dispatcher.EvacuationDispatcher()
+        # adaptive number of rebuilds in flight per source and destination
+        self.source_limiter = concurrency.AIMDLimiter()
+        self.dest_limiter = concurrency.AIMDLimiter()
         self.notifier = self.compute_api.get_notifier('haservice')
         self.host_driver = importutils.import_object(
                                     CONF.ha_service_hypervisor_driver)
@@ -61,7 +89,47 @@ class BasePolicyEngine(object):
                                     CONF.ha_service_instance_driver)
         self.fencing_driver = importutils.import_object(
                                     CONF.ha_service_fencing_driver)
+        # the checks of the hosts which are powered on
+        self.detection_pipeline = detection.DetectionPipeline()
         self.host_status = {}
+        self.node_cache = node_cache.ComputeNodeCache()
+        self.power_probe_guard = bmc_breaker.PowerProbeGuard()
+        # the BMCs whose breaker was open after the last sweep
+        self.open_bmcs = []
+        # updated_at of the newest finished migration verified so far, and
+        # {migration id: updated_at} of those verified within
+        # MIGRATION_WATERMARK_MARGIN of it
+        self.migration_watermark = None
+        self.migration_watermark_ids = {}
+        # {instance_uuid: failed confirm attempts}
+        self.unconfirmed_migrations = {}
+        self.rebuild_ledger = rebuild_ledger.RebuildLedger()
+        # has_ha_timeout_seconds deadlines of the rebuilds in flight
+        self.move_deadlines = move_deadlines.MoveDeadlines()
+        # True while the notifications of nova update the rebuilds in
+        # flight, see NotificationConsumer
+        self.notification_driven = False
+        # time of the last reconciliation of the ledger with the database
+        self.last_ledger_seed = None
+        # the HA-enabled instances by host, kept current by the
+        # notifications; used while notification_driven only
+        self.instance_index = None
+        if CONF.ha_instance_index:
+            self.instance_index = instance_index.InstanceIndex()
+        # liveness of the compute services, reloaded once per cycle
+        self.service_snapshot = None
+        self.managed_nodes = []
+        self.probe_scheduler = probe_scheduler.ProbeScheduler()
+        self.failure_detector = failure_detector.PhiAccrualDetector()
+        # time of the last reload of the nodes and services
+        self.last_refresh = None
+        # hosts whose probes and detection checks are running
+        self.evaluating_hvs = set()
+        # {hv_name: time of the last accepted host_suspect report}
+        self.suspect_reports = {}
+        self.suspect_bucket = rate_limiter.TokenBucket(
+            CONF.ha_host_suspect_rate, CONF.ha_host_suspect_burst)
+        self.ha_enabled = False
         self.reset()
         self._configure_hv_status()
 
@@ -82,7 +150,26 @@ class BasePolicyEngine(object):
         self.violated_hvs = set()
         self.in_action_hvs = set()
         self.idle_hvs = set()
+        # {hv_name: {instance_uuid: failed attempts to move it}}
         self.error_insts = {}
+        # the hypervisors whose HA state changed since it was checkpointed
+        self.changed_hvs = set()
+
+    def _error_counts(self, hv_name):
+        """Get the failed attempts per instance moved away from hv_name.
+
+        The counts of the instances which did not fail again within
+        CONF.ha_error_inst_ttl seconds, e.g. which have been deleted since,
+        are forgotten.
+        """
+        counts = self.error_insts.get(hv_name)
+        if counts is None:
+            counts = expiring_map.ExpiringLRU(
+                CONF.ha_error_inst_ttl, CONF.ha_error_inst_max_entries,
+                on_evict=lambda inst_uuid, count: self.changed_hvs.add(
+                    hv_name))
+            self.error_insts[hv_name] = counts
+        return counts
 
     def _configure_hv_status(self):
         self.start_status = None
@@ -117,39 +204,96 @@ class BasePolicyEngine(object):
 
         To make sure HA just verify instances we migrated, the HA service needs
         to perform the following tasks:
-        1. Get all resized finished migrations
-        2. Iterate over migrations
-        3. Get actions of an instance
-        4. Check request_id of instance action
-        5. If it starts with 'prs-ha-' and it is migrated by HA
+        1. Get the finished migrations updated since the last watermark,
+           less MIGRATION_WATERMARK_MARGIN
+        2. Get the latest actions of their instances in one query
+        3. Check request_id of instance action
+        4. If it starts with 'has-ha-' and it is migrated by HA, confirm the
+           resize; the confirmations run on a bounded green-thread pool
+
+        Confirmations that failed are retried in the following cycles up to
+        MAX_RETRY_TIMES, so the cost of a cycle only depends on the new
+        migrations.
         """
-        filters = {'status': 'finished'}
-        migrations = self.compute_api.query_migration_instances(context,
-                                                                filters)
+        since = self.migration_watermark
+        if since is not None:
+            since -= datetime.timedelta(
+                seconds=ha_constants.MIGRATION_WATERMARK_MARGIN)
+        migrations = db_api.migration_get_finished_since(context, since)
+        inst_uuids = set(self.unconfirmed_migrations.keys())
         for mig in migrations:
+            if mig['id'] in self.migration_watermark_ids:
+                continue
             if mig['old_instance_type_id'] == mig['new_instance_type_id']:
-                actions = self.compute_api.query_instances_actions_by_uuid(
-                            context, mig['instance_uuid'])
-                if len(actions) > 0:
-                    request_id = actions[0]['request_id']
-                    if not request_id.startswith(ha_constants.PREFIX_HAS_HA):
-                        continue
-                inst = self.compute_api.get_instance_by_uuid(
-                        context, mig['instance_uuid'],
-                        expected_attrs=openstack_constants.
-                        INSTANCE_DEFAULT_FIELDS)
-                try:
-                    self.compute_api.confirm_resize(context, inst)
-                    LOG.info(_LI("Successfully confirmed resize of instance "
-                                 "%(name)s (%(instance)s).")
-                             % {'name': inst.name,
-                                'instance': inst.uuid})
-                except Exception as ex:
-                    LOG.warning(_LW("Failed to confirm resize of instance "
-                                "%(name)s (%(instance)s) due to: %(reason)s")
-                                % {'name': inst.name,
-                                   'instance': inst.uuid,
-                                   'reason': six.text_type(ex.message)})
+                inst_uuids.add(mig['instance_uuid'])
+        self._advance_migration_watermark(migrations)
+        if not inst_uuids:
+            return
+
+        request_ids = db_api.instance_action_get_latest_request_ids(
+            context, inst_uuids)
+        inst_uuids = [inst_uuid for inst_uuid in inst_uuids
+                      if request_ids.get(inst_uuid) is None or
+                      request_ids[inst_uuid].startswith(
+                          ha_constants.PREFIX_HAS_HA)]
+        if not inst_uuids:
+            return
+        insts = self.compute_api.get_instances_by_uuids(
+            context, inst_uuids,
+            expected_attrs=openstack_constants.INSTANCE_DEFAULT_FIELDS)
+        # the instances deleted since are not retried
+        found = set(inst.uuid for inst in insts)
+        for inst_uuid in inst_uuids:
+            if inst_uuid not in found:
+                self.unconfirmed_migrations.pop(inst_uuid, None)
+
+        def _confirm(inst):
+            try:
+                self.compute_api.confirm_resize(context, inst)
+                return inst, None
+            except Exception as ex:
+                return inst, ex
+
+        pool = eventlet.GreenPool(CONF.ha_confirm_resize_concurrency)
+        for inst, ex in pool.imap(_confirm, insts):
+            if ex is None:
+                self.unconfirmed_migrations.pop(inst.uuid, None)
+                LOG.info(_LI("Successfully confirmed resize of instance "
+                             "%(name)s (%(instance)s).")
+                         % {'name': inst.name,
+                            'instance': inst.uuid})
+                continue
+            LOG.warning(_LW("Failed to confirm resize of instance "
+                        "%(name)s (%(instance)s) due to: %(reason)s")
+                        % {'name': inst.name,
+                           'instance': inst.uuid,
+                           'reason': six.text_type(ex)})
+            attempts = self.unconfirmed_migrations.get(inst.uuid, 0) + 1
+            if attempts >= ha_constants.MAX_RETRY_TIMES:
+                self.unconfirmed_migrations.pop(inst.uuid, None)
+            else:
+                self.unconfirmed_migrations[inst.uuid] = attempts
+
+    def _advance_migration_watermark(self, migrations):
+        """Move the watermark past the migrations just verified.
+
+        The migrations updated within the margin of the watermark are
+        remembered since the next query includes them again.
+        """
+        if not migrations:
+            return
+        for mig in migrations:
+            self.migration_watermark_ids[mig['id']] = mig['updated_at']
+        latest = migrations[-1]['updated_at']
+        if (self.migration_watermark is None or
+                latest > self.migration_watermark):
+            self.migration_watermark = latest
+        horizon = self.migration_watermark - datetime.timedelta(
+            seconds=ha_constants.MIGRATION_WATERMARK_MARGIN)
+        self.migration_watermark_ids = dict(
+            (mig_id, updated_at)
+            for mig_id, updated_at in self.migration_watermark_ids.items()
+            if updated_at >= horizon)
 
     def select_nodes(self, context):
         """Select nodes that need to evacuate instances.
@@ -160,14 +304,8 @@ class BasePolicyEngine(object):
               4,select host in a region
         Return all host now.
         """
-        all_nodes = self.compute_api.get_all_compute_node(context)
-
-        selected_nodes = all_nodes[:]
-        for node in all_nodes:
-            if node['hypervisor_type'] == 'ironic':
-                selected_nodes.remove(node)
-
-        return selected_nodes
+        # ironic and deleted nodes are filtered out by the query already
+        return self.node_cache.refresh(context)
 
     def fencing_and_evacuate(self, context, node):
         """Fencing and evacuate
@@ -183,8 +321,10 @@ class BasePolicyEngine(object):
                 self.fencing_driver.fencing_host(context, bmc, user, password)
 
             # investigate the force down API seems not force the service down.
-            if self.host_driver.hypervisor_is_up(context,
-                                                 node['hypervisor_hostname']):
+            # The service is queried again, as the snapshot of the cycle
+            # predates the fencing.
+            if self.host_driver.hypervisor_is_up(
+                    context, node['hypervisor_hostname']):
                 result = True
                 LOG.warning('The host has been shutdown but the service'
                             ' status has not changed to off.')
@@ -221,7 +361,9 @@ class BasePolicyEngine(object):
     def ha_alarm(self, context, node):
         """Just the management network is down, send an alarm."""
         result = False
-        LOG.warning('The management network failure.')
+        LOG.warning(_LW('The management network or the compute process of '
+                        '%(node)s failed.')
+                    % {'node': node['hypervisor_hostname']})
         return result
 
     def noop(self, context, node):
@@ -230,25 +372,106 @@ class BasePolicyEngine(object):
         LOG.info('HAService is working.....')
         return result
 
-    def check_host_power_status(self, context, node):
+    def _probe_power_states(self, nodes):
+        """Probe the power status of the nodes' BMCs concurrently.
+
+        At most CONF.ha_power_probe_concurrency probes run at the same time
+        and each of them is given up after CONF.ha_power_probe_timeout
+        seconds, so the whole sweep is bounded by the slowest BMC rather than
+        by the sum of all of them. A power status probed less than
+        CONF.ha_power_cache_ttl seconds ago is reused, and the BMCs whose
+        circuit breaker is open are not probed at all.
+
+        :param nodes: the compute nodes to probe
+        :returns: dict of hypervisor_hostname -> (status, exception)
+        """
+        timeout = CONF.ha_power_probe_timeout
+        pool = eventlet.GreenPool(CONF.ha_power_probe_concurrency)
+        guard = self.power_probe_guard
+
+        def _probe(node):
+            hv_name = node['hypervisor_hostname']
+            try:
+                # nodes without a BMC each get a breaker of their own
+                bmc = ipmi_utils.get_bmc(node)[0] or hv_name
+            except Exception as ipmi_exc:
+                # malformed metrics or stats fail the probe of this node only
+                return node, None, ipmi_exc
+            status = guard.get_cached(bmc)
+            if status is not None:
+                return node, status, None
+            if not guard.allow(bmc):
+                return node, None, service_exception.BMCCircuitOpen(
+                    bmc=bmc, node=hv_name,
+                    retry_in=guard.retry_in(bmc))
+            try:
+                with eventlet.Timeout(timeout):
+                    status = ipmi_utils.get_power(node)
+            except eventlet.Timeout:
+                guard.record_failure(bmc)
+                return node, None, service_exception.PowerProbeTimeout(
+                    timeout=timeout, node=hv_name)
+            except Exception as ipmi_exc:
+                guard.record_failure(bmc)
+                return node, None, ipmi_exc
+            guard.record_success(bmc, status)
+            return node, status, None
+
+        probes = {}
+        for node, status, ipmi_exc in pool.imap(_probe, nodes):
+            probes[node['hypervisor_hostname']] = (status, ipmi_exc)
+        open_bmcs = sorted(
+            bmc for bmc, breaker in self.get_bmc_breaker_states().items()
+            if breaker['state'] == ha_constants.BREAKER_OPEN)
+        # the sweeps run every tick; only report when a breaker changed
+        report = open_bmcs and open_bmcs != self.open_bmcs
+        self.open_bmcs = open_bmcs
+        if report:
+            LOG.warning(_LW("The probes of %(count)d BMC(s) are suspended "
+                            "by their circuit breaker: %(bmcs)s")
+                        % {'count': len(open_bmcs),
+                           'bmcs': ', '.join(open_bmcs)})
+        return probes
+
+    def get_rebuild_windows(self):
+        """Get the adaptive rebuild windows of the sources and destinations.
+
+        :returns: {'source': {host: window}, 'dest': {host: window}}
+        """
+        return {'source': self.source_limiter.windows(),
+                'dest': self.dest_limiter.windows()}
+
+    def get_bmc_breaker_states(self):
+        """Get the circuit breaker state of the failing BMCs."""
+        return self.power_probe_guard.get_states()
+
+    def check_host_power_status(self, context, node, probe=None):
         """check the host power status and take actions
 
+        :param probe: an already collected (status, exception) tuple for the
+                      node; the BMC is queried directly if it is None
         :returns: true, has handled, false, need to check in the follow steps
         """
         result = False
-        try:
-            status = ipmi_utils.get_power(node)
-            LOG.info(_LI("IPMI Successful : %(node)s getting IPMI status : %(status)s")
-                         % {'node': node['hypervisor_hostname'],
-                            'status': status}
-                         )
-        except Exception as ipmi_exc:
+        if probe is None:
+            probe = self._probe_power_states([node])[
+                node['hypervisor_hostname']]
+        status, ipmi_exc = probe
+        if isinstance(ipmi_exc, service_exception.BMCCircuitOpen):
+            # the breaker already logged why the BMC is skipped
+            LOG.debug(six.text_type(ipmi_exc))
+            return True
+        if ipmi_exc is not None:
             LOG.warning(_LW("Get IPMI exception for %(node)s "
                             "with reason: %(reason)s")
                         % {'node': node['hypervisor_hostname'],
                            'reason': six.text_type(ipmi_exc)})
             result = True
             return result
+        LOG.info(_LI("IPMI Successful : %(node)s getting IPMI status : %(status)s")
+                     % {'node': node['hypervisor_hostname'],
+                        'status': status}
+                     )
         if status != 'on':
             self.evacuate_instance(context, node)
             result = True
@@ -270,21 +493,71 @@ class BasePolicyEngine(object):
         4, Check the instances status as all the above is OK. Restart the
         instance and try to recover.
 
-        :param all_nodes: the detailed info dict of all the nodes in the
-                          system
-        :param update_hvs_state: update the hypervisors' state if true
-        :param do_action: do moving instance action based on hypervisors'
-                          state if true
+        The nodes and the rebuilds in flight are reloaded every
+        CONF.ha_period_interval seconds and the services on every call; each
+        call only probes the hypervisors whose probe deadline has passed, see
+        ProbeScheduler.
 
+        :param context: nova context
         :returns: None
         """
+        now = time.time()
+        if (self.last_refresh is None or
+                now - self.last_refresh >= CONF.ha_period_interval):
+            self.last_refresh = now
+            self.ha_enabled = self.__refresh(context)
+        elif self.ha_enabled:
+            self.__load_services(context)
+        self.__expire_moves(context)
+        if self.ha_enabled:
+            self.__probe_due_hosts(context)
+        self._checkpoint_state()
+
+    def _checkpoint_state(self):
+        """Persist the state of the engine; engines may override this."""
+        pass
+
+    def __expire_moves(self, context):
+        """Fail the rebuilds not finished within has_ha_timeout_seconds.
+
+        The instance is no longer counted as in flight and is not retried,
+        and the moving instance failed notification is sent for it.
+        """
+        for inst_uuid, hv_name, name in self.move_deadlines.pop_expired():
+            if not self.rebuild_ledger.remove(inst_uuid):
+                # the rebuild has finished in the meantime
+                continue
+            msg = (_LW("Automated rebuild of instance %(name)s "
+                       "(%(instance)s) did not finish within %(timeout)d "
+                       "seconds.")
+                   % {'name': name or inst_uuid, 'instance': inst_uuid,
+                      'timeout': CONF.has_ha_timeout_seconds})
+            LOG.warning(msg)
+            self.changed_hvs.add(hv_name)
+            self._error_counts(hv_name)[inst_uuid] = (
+                ha_constants.MAX_RETRY_TIMES)
+            self.__move_inst_failed(context, hv_name,
+                                    {'uuid': inst_uuid,
+                                     'name': name or inst_uuid}, msg)
+
+    def __refresh(self, context):
+        """Reload the state of the nodes and services.
+
+        :returns: True if the hypervisors should be probed
+        """
         # 1) confirm resize the instances which were migrated automatically
         #    by HA/Maintenance
         self.__verify_migration(context)
 
         selected = self.select_nodes(context)
+        self.update_managed_hvs(context, selected)
+        self.managed_nodes = selected
+        self.probe_scheduler.sync(node['hypervisor_hostname']
+                                  for node in selected)
         ha_service = db_api.get_service_by_host_and_binary(context,
                                                 self.host, 'nova-haservice')
+        self.__load_services(context)
+        self.__seed_instance_index(context)
 
         # 2) do HA periodic task
         if not ha_service['disabled']:
@@ -294,9 +567,7 @@ class BasePolicyEngine(object):
             # a, check if we need to do migrate
             service_up_count = 0
             for node in selected:
-                service = self.compute_api.get_service_by_compute_host(context,
-                                                               node['host'])
-                if self.compute_api.service_is_up(service):
+                if self.service_snapshot.is_up(node['host']):
                     service_up_count = service_up_count + 1
 
             if service_up_count < CONF.min_active_compute_percent \
@@ -307,22 +578,18 @@ class BasePolicyEngine(object):
                 db_api.db_update_service(context,
                                          ha_service['id'],
                                          {'disabled': True})
-                return
+                return False
 
-            # a, monitor the hypervisor and instances
-            for node in selected:
-                # 1, check the host power status by IPMI and take action
-                if self.check_host_power_status(context, node):
-                    continue
+            # a, count the rebuilds in flight on every host
+            self.__seed_ledger(context)
+            return True
 
         else:
             # if service is disabled
             # a, check if all hosts are up
             for node in selected:
-                service = self.compute_api.get_service_by_compute_host(context,
-                                                               node['host'])
-                if not self.compute_api.service_is_up(service):
-                    return
+                if not self.service_snapshot.is_up(node['host']):
+                    return False
 
             LOG.info("All compute nodes are up, enabling HA service...")
 
@@ -330,7 +597,185 @@ class BasePolicyEngine(object):
             db_api.db_update_service(context,
                                      ha_service['id'],
                                      {'disabled': False})
+            return False
+
+    def __load_services(self, context):
+        """Reload the liveness of the compute services and their heartbeats.
+
+        All the services are loaded with one query, and the drivers reuse
+        the snapshot until the next call. The hosts whose heartbeats
+        stopped are probed at once.
+        """
+        self.service_snapshot = service_snapshot.ServiceSnapshot.load(
+            context, self.compute_api, self.managed_nodes)
+        for host, heartbeat in self.service_snapshot.heartbeats():
+            self.failure_detector.heartbeat(host, heartbeat)
+        for node in self.managed_nodes:
+            if self.__is_suspect(node):
+                self.probe_scheduler.expedite(node['hypervisor_hostname'])
+
+    def __seed_ledger(self, context):
+        """Reconcile the rebuilds in flight with the database.
+
+        This is done every cycle, unless the notifications keep the ledger
+        up to date; then only every CONF.ha_notification_reconcile_interval
+        seconds, to catch the notifications which were lost and the
+        rebuilds not started by HA.
+        """
+        now = time.time()
+        if (self.notification_driven and self.last_ledger_seed is not None
+                and now - self.last_ledger_seed <
+                CONF.ha_notification_reconcile_interval):
+            return
+        self.last_ledger_seed = now
+        self.rebuild_ledger.seed(context)
+
+    def __seed_instance_index(self, context):
+        """Load the instance index when it is due."""
+        if (self.instance_index is None or not self.notification_driven or
+                not self.instance_index.seed_due()):
             return
+        try:
+            self.instance_index.seed(context)
+        except Exception as e:
+            # the instances are selected from the database until it is
+            # loaded, or from the previous load
+            LOG.warning(_LW("Failed to load the instance index: %(reason)s")
+                        % {'reason': six.text_type(e)})
+
+    def _usable_instance_index(self):
+        """Get the instance index if the instances can be selected by it."""
+        if (self.instance_index is not None and self.notification_driven and
+                self.instance_index.seeded):
+            return self.instance_index
+        return None
+
+    def __is_suspect(self, node):
+        """Determine if the power status of a host should be probed."""
+        return (not self.service_snapshot.is_up(node['host']) or
+                self.failure_detector.is_suspect(node['host']))
+
+    def __take_action(self, context, node, verdict):
+        """Take the action the detection pipeline decided on for a host."""
+        if verdict == ha_constants.VERDICT_EVACUATE:
+            # the host is still powered on
+            return self.fencing_and_evacuate(context, node)
+        if verdict == ha_constants.VERDICT_ALARM:
+            return self.ha_alarm(context, node)
+        return self.noop(context, node)
+
+    def __probe_due_hosts(self, context):
+        """Probe the hypervisors which are due and take actions."""
+        due = set(self.probe_scheduler.pop_due())
+        nodes = []
+        for node in self.managed_nodes:
+            hv_name = node['hypervisor_hostname']
+            if hv_name not in due:
+                continue
+            if hv_name in self.evaluating_hvs:
+                # a host_suspect report is being handled for the host
+                self.probe_scheduler.schedule(hv_name, suspect=True)
+            elif self.__is_suspect(node):
+                nodes.append(node)
+            else:
+                # the heartbeats of the host are on time; leave its BMC alone
+                self.probe_scheduler.schedule(hv_name)
+        if nodes:
+            try:
+                self.__evaluate_hosts(context, nodes)
+            finally:
+                # hosts whose evaluation raised before they were scheduled
+                # again would never be probed again otherwise
+                self.probe_scheduler.schedule_popped(
+                    [node['hypervisor_hostname'] for node in nodes],
+                    suspect=True)
+
+    def host_suspect(self, context, hv_name, reason=None):
+        """Evaluate a host reported as failed by an external monitor now.
+
+        The report is dropped if the HA service is disabled, the host is
+        already being evacuated or evaluated, the same host was reported less
+        than CONF.ha_host_suspect_min_interval seconds ago, or more reports
+        arrive than CONF.ha_host_suspect_rate allows.
+
+        :param context: nova context
+        :param hv_name: name of the hypervisor
+        :param reason: why the monitor deems the host failed
+        :returns: True if the host was evaluated
+        """
+        node = self.hv_map.get(hv_name)
+        if node is None or not self.ha_enabled:
+            LOG.info(_LI("The report that %(hv_name)s failed is ignored "
+                         "because the HA service does not manage it now.")
+                     % {'hv_name': hv_name})
+            return False
+        if hv_name in self.in_action_hvs or hv_name in self.evaluating_hvs:
+            LOG.debug("The report that %s failed is ignored because it is "
+                      "already being handled.", hv_name)
+            return False
+        now = time.time()
+        last = self.suspect_reports.get(hv_name)
+        if ((last is not None and
+                now - last < CONF.ha_host_suspect_min_interval) or
+                self.suspect_bucket.consume()):
+            LOG.warning(_LW("The report that %(hv_name)s failed is dropped "
+                            "by the rate limit of the host_suspect reports.")
+                        % {'hv_name': hv_name})
+            return False
+        self.suspect_reports[hv_name] = now
+        LOG.info(_LI("Evaluating %(hv_name)s at once as it was reported "
+                     "failed: %(reason)s")
+                 % {'hv_name': hv_name, 'reason': reason})
+        self.__evaluate_hosts(context, [node])
+        return True
+
+    def __evaluate_hosts(self, context, nodes):
+        """Check the hypervisors stage by stage and take actions."""
+        hv_names = set(node['hypervisor_hostname'] for node in nodes)
+        self.evaluating_hvs.update(hv_names)
+        try:
+            self.__check_hosts(context, nodes)
+        finally:
+            self.evaluating_hvs.difference_update(hv_names)
+
+    def __check_hosts(self, context, nodes):
+        # a, monitor the hypervisor and instances; the due BMCs are probed
+        #    all at once before deciding which hosts to evacuate
+        probes = self._probe_power_states(nodes)
+        powered_on = []
+        for node in nodes:
+            hv_name = node['hypervisor_hostname']
+            status, ipmi_exc = probes[hv_name]
+            # hosts which may be failing, or are being evacuated, are
+            # probed again sooner
+            self.probe_scheduler.schedule(
+                hv_name,
+                suspect=(ipmi_exc is not None or status != 'on' or
+                         not self.service_snapshot.is_up(node['host'])))
+            # 1, check the host power status by IPMI and take action
+            if self.check_host_power_status(context, node, probes[hv_name]):
+                continue
+            powered_on.append(node)
+
+        # 2, 3, check the network and then the compute process of the hosts
+        #    which are powered on, and take action
+        if powered_on:
+            verdicts = self.detection_pipeline.run(
+                context, powered_on, services=self.service_snapshot)
+            for node in powered_on:
+                self.__take_action(context, node,
+                                   verdicts[node['hypervisor_hostname']])
+
+        # b, the evacuations of all hosts run concurrently in the
+        #    background; the hosts are looked at again while they drain
+        queue_depth = self.dispatcher.queue_depth()
+        if queue_depth:
+            LOG.info(_LI("%(depth)d evacuation(s) are queued by the "
+                         "evacuation rate limit: %(depths)s; the rebuild "
+                         "windows are %(windows)s")
+                     % {'depth': queue_depth,
+                        'depths': self.dispatcher.queue_depths(),
+                        'windows': self.get_rebuild_windows()})
 
     def _rebuild_instances(self, context, hv_name):
         """Rebuilds instances on a failed hypervisor."""
@@ -360,24 +805,24 @@ class BasePolicyEngine(object):
         if hv_name not in self.in_action_hvs:
             self.in_action_hvs.add(hv_name)
             utils.safe_remove(self.idle_hvs, hv_name)
+            self.changed_hvs.add(hv_name)
 
         is_finished = True
 
-        rebuild_states = [openstack_constants.REBUILDING,
-                          openstack_constants.REBUILD_SPAWNING,
-                          openstack_constants.REBUILD_BLOCK_DEVICE_MAPPING]
-        filters = {'task_state': rebuild_states,
-                   'host': self.hv_map[hv_name]['host']}
+        rebuild_states = openstack_constants.REBUILD_TASK_STATES
+        svc_host = compute_node['host']
+        candidates = []
         for inst, action in inst_tuples:
-            if hv_name in self.idle_hvs:
-                return
-
             # if the VM is being rebuilt, then we shouldn't try to call rebuild
             # again; otherwise, let's try our best to rebuild it regardless of
             # its task state since the host is dead.
             if inst['task_state'] in rebuild_states:
                 is_finished = False
                 continue
+            if inst['uuid'] in self.rebuild_ledger:
+                # the rebuild is still queued by the dispatcher
+                is_finished = False
+                continue
 
             # This active/stopped/error state check is imposed
             # by OpenStack, so we check it here to avoid problems calling the
@@ -394,28 +839,68 @@ class BasePolicyEngine(object):
                                'instance_uuid': inst['uuid'],
                                'state': inst['vm_state']})
                 continue
+            candidates.append(inst)
+
+        # only place as many instances as the source host may rebuild now
+        window = self.source_limiter.window(
+            svc_host, self.__get_parallel_rebuild(compute_node))
+        slots = window - self.rebuild_ledger.count_source(svc_host)
+        if len(candidates) > slots:
+            is_finished = False
+            candidates = candidates[:max(slots, 0)]
+
+        jobs = []
+        if candidates:
+            # the selected instances may only hold the fields of the
+            # instance index; load the candidates in full to place them
+            insts = self.compute_api.get_instances_by_uuids(
+                context, [inst['uuid'] for inst in candidates],
+                expected_attrs=openstack_constants.INSTANCE_DEFAULT_FIELDS)
+            insts = dict((inst['uuid'], inst) for inst in insts)
+            index = self._usable_instance_index()
+            moved = [inst for inst in insts.values()
+                     if inst['host'] != svc_host]
+            for inst in moved:
+                # the notification of its move was lost
+                LOG.info(_LI("Instance %(name)s (%(instance)s) is no longer "
+                             "on %(host)s; it is not rebuilt.")
+                         % {'name': inst['display_name'],
+                            'instance': inst['uuid'], 'host': svc_host})
+                if index is not None:
+                    index.refresh(inst)
+            # skip the instances deleted or moved since they were selected
+            candidates = [insts[inst['uuid']] for inst in candidates
+                          if inst['uuid'] in insts and
+                          insts[inst['uuid']]['host'] == svc_host]
+        if candidates:
+            plan = self.__place(context, hv_name, candidates)
+            for inst, destination, ex in plan:
+                if hv_name in self.idle_hvs:
+                    # the admitted rebuilds are reserved; dispatch them
+                    break
+                if ex is not None:
+                    is_finished = False
+                    self.__rebuild_failed(context, hv_name, inst, ex)
+                    continue
+                try:
+                    if self.__admit_rebuild(context, hv_name, inst,
+                                            destination):
+                        jobs.append((inst, destination['host']))
+                    else:
+                        is_finished = False
+                except Exception:
+                    is_finished = False
 
-            rebuild_num = len(self.compute_api.query_db_instances(
-                              context, filters))
-            if rebuild_num >= self.__get_parallel_rebuild(compute_node):
-                is_finished = False
-                # hit max; no need to look at any more instances this time
-                break
+        def _rebuilds_done(results):
+            if is_finished and all(results):
+                self._action_finished(context, hv_name)
 
-            try:
-                success = self.__rebuild(context, hv_name, inst)
-                if not success:
-                    is_finished = False
-            except Exception:
-                is_finished = False
-        if is_finished:
-            self._action_finished(context, hv_name)
+        self.dispatcher.dispatch(
+            jobs, functools.partial(self.__rebuild, context, hv_name),
+            _rebuilds_done, key=hv_name)
 
-    def __rebuild(self, context, hv_name, inst):
-        """Rebuilds an instance."""
-        img = ha_utils.get_image_from_inst(inst)
-        request_spec = openstack_utils.build_request_spec(context, img, [inst])
-        # set filer working scope
+    def __place(self, context, hv_name, insts):
+        """Selects the destinations of the instances to rebuild."""
         svc_host = self.hv_map[hv_name]['host']
         filter_properties = {'ignore_hosts': [svc_host]}
 
@@ -426,34 +911,31 @@ class BasePolicyEngine(object):
             filter_properties['force_hosts'] = target_hosts
         # filter_properties[constants.HA_MAINTENANCE_STATUS] = (
         #                                        self.status.get_json())
-        scope = constants.FILTER_WORKING_SCOPE_EVACUATE
-        request_spec['operation_type'] = scope
+        return self.placement.place(
+            context, insts, filter_properties,
+            observer=functools.partial(self.source_limiter.record, svc_host))
 
-        try:
-            openstack_utils.setup_instance_group(context, request_spec,
-                                                 filter_properties)
-            spec_obj = self.compute_api.create_request_spec(context,
-                                                            request_spec,
-                                                            filter_properties)
-            destinations = self.scheduler_rpcapi.select_destinations(
-                context, spec_obj)
-            host = destinations[0]['host']
-            target_hv_name = destinations[0]['nodename']
+    def __admit_rebuild(self, context, hv_name, inst, destination):
+        """Reserves a rebuild of an instance on its destination host.
 
+        The rebuild is recorded in the ledger before it is dispatched, so the
+        rebuilds which are still being dispatched count against the limits.
+        """
+        svc_host = self.hv_map[hv_name]['host']
+        host = destination['host']
+        target_hv_name = destination['nodename']
+        try:
             # check if the parallel rebuild instances number on the destination
             # host have exceeded the max number; if yes, skip this rebuild
-            rebuild_states = [openstack_constants.REBUILDING,
-                              openstack_constants.REBUILD_SPAWNING,
-                              openstack_constants.REBUILD_BLOCK_DEVICE_MAPPING]
-            filters = {'task_state': rebuild_states, 'host': host}
             compute_node = self.hv_map.get(target_hv_name)
             if not compute_node:
                 compute_node = self.compute_api.\
                     get_compute_node_by_host_and_nodename(context, host,
                                                           target_hv_name)
-            rebuild_num = len(self.compute_api.query_db_instances(
-                              context, filters))
-            if rebuild_num >= self.__get_parallel_dest_rebuild(compute_node):
+            rebuild_num = self.rebuild_ledger.count_dest(host)
+            window = self.dest_limiter.window(
+                host, self.__get_parallel_dest_rebuild(compute_node))
+            if rebuild_num >= window:
                 # skip this rebuild and recover ego allocation
                 LOG.info(_LI("The HA engine selected destination host "
                              "%(host)s to rebuild %(vm_name)s (%(uuid)s), "
@@ -465,49 +947,79 @@ class BasePolicyEngine(object):
                          % {'host': host, 'vm_name': inst['display_name'],
                             'uuid': inst['uuid'], 'rebuild_num': rebuild_num})
                 return False
-
-            inst = self.compute_api.get_instance_by_uuid(
-                    context, inst['uuid'],
-                    expected_attrs=openstack_constants.INSTANCE_DEFAULT_FIELDS)
-            self.compute_api.evacuate(context.elevated(), inst, host, True)
-            # if self.get_status(hv_name) != self.rebuilding_status:
-            #    self.update_hv_state(context, hv_name, self.rebuilding_status)
-
-            action_info = {'vm_name': inst['display_name'],
-                           'vm_uuid': inst['uuid'],
-                           'action_name': 'evacuate',
-                           'target_host': host}
-            self._store_action_info(context, hv_name, action_info)
-            LOG.info(_LI("Successfully initiated the rebuild processing for "
-                         "instance %(name)s (%(instance)s) on host %(host)s.")
-                     % {'name': inst['display_name'],
-                        'instance': inst['uuid'],
-                        'host': host})
-            # Give instance.host a moment to update via RPC for accurate counts
-            eventlet.sleep(1)
+            self.rebuild_ledger.add(inst['uuid'], svc_host, host, queued=True)
             return True
         except Exception as ex:
-            if isinstance(ex, openstack_constants.NoValidHost):
-                # give a more friendly message for NoValidHost cases
-                msg = (_LW("Automated rebuild of instance %(name)s "
-                         "(%(instance)s) failed because no valid destination "
-                         "host(s) could be found. Make sure you have enough "
-                         "resources in your relocation domain and try again.")
-                       % {'name': inst['display_name'],
-                          'instance': inst['uuid']})
-            else:
-                msg = (_LW("Automated rebuild of instance %(name)s "
-                         "(%(instance)s) failed with the following error: "
-                         "%(reason)s")
-                       % {'name': inst['display_name'],
-                          'instance': inst['uuid'],
-                          'reason': six.text_type(ex)})
-            LOG.warning(msg)
-            self.__handle_error(context, hv_name,
-                                {'uuid': inst['uuid'],
-                                 'name': inst['display_name']}, msg)
+            self.__rebuild_failed(context, hv_name, inst, ex)
             raise
 
+    def __rebuild(self, context, hv_name, inst, host):
+        """Rebuilds an instance on a host it was admitted to.
+
+        Each rebuild is made with a context of its own whose request_id
+        identifies it as started by HA, so that its notifications can be
+        matched with it and its migration is verified by HA.
+
+        :returns: True if the rebuild has been started
+        """
+        inst_ctxt = copy.copy(context)
+        inst_ctxt.request_id = (ha_constants.PREFIX_HAS_HA +
+                                uuidutils.generate_uuid())
+        svc_host = self.hv_map[hv_name]['host']
+        start = time.time()
+        try:
+            self.compute_api.evacuate(inst_ctxt.elevated(), inst, host, True)
+        except Exception as ex:
+            latency = time.time() - start
+            self.source_limiter.record(svc_host, latency, ex)
+            self.dest_limiter.record(host, latency, ex)
+            self.rebuild_ledger.remove(inst['uuid'])
+            self.__rebuild_failed(context, hv_name, inst, ex)
+            return False
+        latency = time.time() - start
+        # the deadline runs from the start of the rebuild, as the dispatcher
+        # cannot drop a rebuild it has queued
+        self.rebuild_ledger.start(inst['uuid'])
+        self.move_deadlines.add(inst['uuid'], hv_name,
+                                name=inst['display_name'])
+        self.source_limiter.record(svc_host, latency)
+        self.dest_limiter.record(host, latency)
+        # if self.get_status(hv_name) != self.rebuilding_status:
+        #    self.update_hv_state(context, hv_name, self.rebuilding_status)
+
+        action_info = {'vm_name': inst['display_name'],
+                       'vm_uuid': inst['uuid'],
+                       'action_name': 'evacuate',
+                       'target_host': host}
+        self._store_action_info(inst_ctxt, hv_name, action_info)
+        LOG.info(_LI("Successfully initiated the rebuild processing for "
+                     "instance %(name)s (%(instance)s) on host %(host)s.")
+                 % {'name': inst['display_name'],
+                    'instance': inst['uuid'],
+                    'host': host})
+        return True
+
+    def __rebuild_failed(self, context, hv_name, inst, ex):
+        if isinstance(ex, openstack_constants.NoValidHost):
+            # give a more friendly message for NoValidHost cases
+            msg = (_LW("Automated rebuild of instance %(name)s "
+                     "(%(instance)s) failed because no valid destination "
+                     "host(s) could be found. Make sure you have enough "
+                     "resources in your relocation domain and try again.")
+                   % {'name': inst['display_name'],
+                      'instance': inst['uuid']})
+        else:
+            msg = (_LW("Automated rebuild of instance %(name)s "
+                     "(%(instance)s) failed with the following error: "
+                     "%(reason)s")
+                   % {'name': inst['display_name'],
+                      'instance': inst['uuid'],
+                      'reason': six.text_type(ex)})
+        LOG.warning(msg)
+        self.__handle_error(context, hv_name,
+                            {'uuid': inst['uuid'],
+                             'name': inst['display_name']}, msg)
+
     def _store_event(self, context, hv_name, event_type, extra_msg=None):
         raise NotImplementedError()
 
@@ -517,34 +1029,35 @@ class BasePolicyEngine(object):
     def __handle_error(self, context, hv_name, inst_dict, err_msg):
         """Common error handler for the engine to handle retries, etc."""
         inst_uuid = inst_dict['uuid']
-        if hv_name not in self.error_insts:
-            self.error_insts[hv_name] = {}
-        self.error_insts[hv_name].update({inst_uuid:
-                 self.error_insts.get(hv_name, {}).get(inst_uuid, 0) + 1})
-        if (self.error_insts[hv_name][inst_uuid] >=
-                ha_constants.MAX_RETRY_TIMES):
-            payload = {'hypervisor_hostname': hv_name,
-                       'hypervisor_id': self.hv_map[hv_name]['id'],
-                       'instance_uuid': inst_uuid,
-                       'error_msg': err_msg}
-            self.notifier.info(context,
-                               ha_constants.ETYPE_MOVING_INSTANCE_FAILED,
-                               payload)
-            LOG.warning(_LW('Failed to automatically move instance '
-                           '%(name)s (%(inst_uuid)s) away from '
-                           '%(hv_name)s; please move it manually.')
-                        % {'hv_name': hv_name, 'inst_uuid': inst_uuid,
-                           'name': inst_dict['name']})
+        self.changed_hvs.add(hv_name)
+        counts = self._error_counts(hv_name)
+        counts[inst_uuid] = counts.get(inst_uuid, 0) + 1
+        if counts[inst_uuid] >= ha_constants.MAX_RETRY_TIMES:
+            self.__move_inst_failed(context, hv_name, inst_dict, err_msg)
+
+    def __move_inst_failed(self, context, hv_name, inst_dict, err_msg):
+        """Give up moving an instance and notify it."""
+        inst_uuid = inst_dict['uuid']
+        node = self.hv_map.get(hv_name) or {}
+        payload = {'hypervisor_hostname': hv_name,
+                   'hypervisor_id': node.get('id'),
+                   'instance_uuid': inst_uuid,
+                   'error_msg': err_msg}
+        self.notifier.info(context,
+                           ha_constants.ETYPE_MOVING_INSTANCE_FAILED,
+                           payload)
+        LOG.warning(_LW('Failed to automatically move instance '
+                       '%(name)s (%(inst_uuid)s) away from '
+                       '%(hv_name)s; please move it manually.')
+                    % {'hv_name': hv_name, 'inst_uuid': inst_uuid,
+                       'name': inst_dict['name']})
 
     def __get_parallel_rebuild(self, compute_node):
-        stats = ast.literal_eval(compute_node['stats'] or {})
-        return int(stats.get(ha_constants.PARALLEL_REBUILD,
-                             ha_constants.DEFAULT_PARALLEL_REBUILD))
+        return node_cache.get_node_attributes(compute_node).parallel_rebuild
 
     def __get_parallel_dest_rebuild(self, compute_node):
-        stats = ast.literal_eval(compute_node['stats'] or {})
-        return int(stats.get(ha_constants.PARALLEL_DEST_REBUILD,
-                             ha_constants.DEFAULT_PARALLEL_DEST_REBUILD))
+        return node_cache.get_node_attributes(
+            compute_node).parallel_dest_rebuild
 
     def _should_stop_move(self, context, hv_name):
         raise NotImplementedError()
@@ -568,6 +1081,9 @@ class BasePolicyEngine(object):
         :return: None
         """
         inst_id = payload.get('instance_id')
+        self.rebuild_ledger.remove(inst_id)
+        self.move_deadlines.discard(inst_id)
+        self.changed_hvs.add(hv_name)
         if (self.error_insts.get(hv_name, {}).get(inst_id, 0) >=
                 ha_constants.MAX_RETRY_TIMES):
             # for the rebuild/cold migrate fail case, if sync up logic has
@@ -593,8 +1109,7 @@ class BasePolicyEngine(object):
             utils.safe_remove(inst_hosts, inst_id)
             self.in_action_hvs.add(hv_name)
         else:
-            if hv_name not in self.error_insts:
-                self.error_insts[hv_name] = {}
+            counts = self._error_counts(hv_name)
             # if the VM has been automatically cold migrated or evacuated
             # away, even if something wrong occurred on the target host
             # to make the VM enter error state, just log a warnning message
@@ -612,7 +1127,7 @@ class BasePolicyEngine(object):
                 is_away = True
             if is_away:
                 utils.safe_remove(inst_hosts, inst_id)
-                self.error_insts[hv_name].pop(inst_id, None)
+                counts.pop(inst_id, None)
                 LOG.warning(_LW("The instance %(vmname)s (%(inst_uuid)s) "
                                 "is no longer on hypervisor %(hv_name)s, "
                                 "so the engine will not do any action on "
@@ -624,8 +1139,7 @@ class BasePolicyEngine(object):
                 return
             # for rebuild/cold migrate error, the VM has errored out;
             # we should mark the hypervisor as 'error' immediately.
-            self.error_insts[hv_name].update({inst_id:
-                              ha_constants.MAX_RETRY_TIMES})
+            counts[inst_id] = ha_constants.MAX_RETRY_TIMES
 
         self.__handle_error(context, hv_name,
                  {'uuid': inst_id, 'name': vmname}, msg)
@@ -654,11 +1168,133 @@ class HAEngine(BasePolicyEngine):
         # Format: {request_id1: {action_name: xx, vm_name: xx, vm_uuid: xx,
         #                        target_host: xx},
         #          request_id12: {}, ...}
-        self.haservice_action = {}
-
-        self.update_managed_hvs(self.ctxt,
-                            self.compute_api.get_all_compute_node(self.ctxt))
-        # self.__load_hv_state_from_file()
+        # the actions whose end notification is lost expire
+        self.haservice_action = expiring_map.ExpiringLRU(
+            CONF.ha_action_ttl, CONF.ha_action_max_entries,
+            on_evict=self.__action_lost)
+        self.status = hv_status.HypervisorStatus(
+            {'version': hv_status.VERSION, 'ha': {}})
+        self.checkpoint = checkpoint.StatusCheckpoint()
+
+        self.update_managed_hvs(self.ctxt, self.select_nodes(self.ctxt))
+        if CONF.ha_checkpoint_state:
+            self.__load_hv_state_from_file()
+
+    def __action_lost(self, request_id, action_info):
+        self.changed_hvs.add(action_info.get('hypervisor_hostname'))
+        LOG.warning(_LW("No end notification of the %(action)s of instance "
+                        "%(name)s (%(uuid)s) away from %(hv_name)s was "
+                        "received; forgetting request %(request_id)s after "
+                        "%(evictions)d lost action(s) in total.")
+                    % {'action': action_info.get('action_name'),
+                       'name': action_info.get('vm_name'),
+                       'uuid': action_info.get('vm_uuid'),
+                       'hv_name': action_info.get('hypervisor_hostname'),
+                       'request_id': request_id,
+                       'evictions': self.haservice_action.evictions})
+
+    def __load_hv_state_from_file(self):
+        """Restore the state checkpointed before the service stopped.
+
+        The evacuations in flight are recorded in the rebuild ledger again,
+        so they keep counting against the limits until they are reconciled
+        with the instances being rebuilt.
+        """
+        status = self.checkpoint.load()
+        self.status = status
+        for hv_name in list(status.ha_hvs):
+            node = self.hv_map.get(hv_name)
+            if node is None:
+                continue
+            state = status.get_ha(hv_name)
+            if state in (self.start_status, self.migrating_status,
+                         self.rebuilding_status):
+                self.in_action_hvs.add(hv_name)
+            elif state == self.end_status:
+                self.idle_hvs.add(hv_name)
+            retries = status.get_ha_retries(hv_name)
+            if retries:
+                self._error_counts(hv_name).update(retries)
+            moving_insts = status.get_ha_moving_insts(hv_name) or {}
+            for inst_uuid, dest_host in moving_insts.items():
+                started_at = status.get_ha_moving_inst_start(hv_name,
+                                                             inst_uuid)
+                self.rebuild_ledger.add(inst_uuid, node['host'], dest_host,
+                                        started_at=started_at)
+                self.move_deadlines.add(inst_uuid, hv_name,
+                                        started_at=started_at)
+            self.haservice_action.update(status.get_ha_actions(hv_name))
+        self.changed_hvs.update(status.ha_hvs)
+        LOG.info(_LI("Restored the HA state of %(count)d hypervisor(s) from "
+                     "%(path)s.")
+                 % {'count': len(status.ha_hvs),
+                    'path': self.checkpoint.path})
+
+    def __sync_status(self):
+        """Mirror the state of the engine into self.status.
+
+        Only the hypervisors whose state changed since the last sync, or
+        which have actions in flight, are synced.
+        """
+        for counts in self.error_insts.values():
+            # the evicted retries mark their hypervisor as changed
+            counts.expire()
+        actions = collections.defaultdict(dict)
+        moving_insts = collections.defaultdict(dict)
+        inst_start = collections.defaultdict(dict)
+        inflight = self.rebuild_ledger.inflight()
+        for request_id, action in self.haservice_action.items():
+            hv_name = action.get('hypervisor_hostname')
+            actions[hv_name][request_id] = action
+            inst_uuid = action.get('vm_uuid')
+            if inst_uuid in inflight:
+                _source, dest_host, started_at = inflight[inst_uuid]
+                moving_insts[hv_name][inst_uuid] = dest_host
+                inst_start[hv_name][inst_uuid] = started_at
+
+        hv_names = self.changed_hvs | set(actions)
+        hv_names.update(hv_name
+                        for hv_name, record in self.status.ha_hvs.items()
+                        if record.actions)
+        self.changed_hvs = set()
+        for hv_name in hv_names:
+            retries = self.error_insts.get(hv_name) or {}
+            if hv_name not in self.hv_map:
+                state = ha_constants.STATE_OK
+            elif hv_name in self.in_action_hvs:
+                state = (self.rebuilding_status if moving_insts[hv_name]
+                         else self.start_status)
+            elif hv_name in self.idle_hvs:
+                state = self.end_status
+            elif retries:
+                state = self.error_status
+            else:
+                state = ha_constants.STATE_OK
+            if self.status.get_ha(hv_name) != state:
+                self.status.set_ha(hv_name, state)
+            if state == ha_constants.STATE_OK:
+                continue
+            self.status.set_ha_moving_insts(hv_name, moving_insts[hv_name])
+            self.status.set_ha_moving_inst_starts(hv_name,
+                                                  inst_start[hv_name])
+            self.status.set_ha_retries(hv_name, dict(retries))
+            self.status.set_ha_failed_instances(
+                hv_name, sorted(inst_uuid
+                                for inst_uuid, count in retries.items()
+                                if count >= ha_constants.MAX_RETRY_TIMES))
+            self.status.set_ha_actions(hv_name, actions[hv_name])
+
+    def _checkpoint_state(self):
+        if not CONF.ha_checkpoint_state:
+            return
+        self.__sync_status()
+        try:
+            self.checkpoint.save(self.status)
+        except Exception as e:
+            LOG.warning(_LW("Failed to checkpoint the HA state to %(path)s: "
+                            "%(reason)s")
+                        % {'path': self.checkpoint.path,
+                           'reason': six.text_type(e)})
 
     def reset(self):
         super(HAEngine, self).reset()
@@ -696,10 +1332,16 @@ class HAEngine(BasePolicyEngine):
             utils.safe_remove(self.violated_count, hv_name)
             utils.safe_remove(self.in_action_hvs, hv_name)
             utils.safe_remove(self.idle_hvs, hv_name)
+            self.changed_hvs.add(hv_name)
         self.hv_map = hv_map
 
     def select_instances(self, context, hv_name):
-        inst_tuples = self.inst_driver.select_instances(context, hv_name)
+        kwargs = {}
+        index = self._usable_instance_index()
+        if index is not None:
+            kwargs['index'] = index
+        inst_tuples = self.inst_driver.select_instances(
+            context, hv_name, services=self.service_snapshot, **kwargs)
         return inst_tuples
 
     def move_inst_fail(self, context, hv_name, payload, is_live_migration):
@@ -711,6 +1353,53 @@ class HAEngine(BasePolicyEngine):
             self._store_event(context, hv_name,
                               ha_constants.ETYPE_HA_ACTION_END, action_info)
 
+    def handle_notifications(self, events):
+        """Update the moves in flight from the notifications of nova.
+
+        :param events: list of (context, event_type, payload) of the
+                       notifications of the moves started by HA, and of the
+                       lifecycle of all instances if the instance index is
+                       used, in the order they were received per instance
+        """
+        for context, event_type, payload in events:
+            if (self.instance_index is not None and
+                    event_type in ha_constants.NOTIFY_INSTANCE_INDEX):
+                self.instance_index.update(event_type, payload)
+            action_info = self.haservice_action.get(context.request_id)
+            if action_info is None:
+                # the move has ended already
+                continue
+            if event_type in ha_constants.NOTIFY_MOVE_SUCCESS:
+                self.move_inst_success(context)
+                continue
+            if event_type in ha_constants.NOTIFY_MOVE_FAIL:
+                is_live_migration = ha_constants.NOTIFY_MOVE_FAIL[event_type]
+            elif (event_type == ha_constants.NOTIFY_INSTANCE_UPDATE and
+                    self.__moved_into_error(payload)):
+                is_live_migration = False
+            else:
+                continue
+            payload = dict(payload)
+            payload.setdefault('instance_id', action_info.get('vm_uuid'))
+            payload.setdefault('name', action_info.get('vm_name'))
+            self.move_inst_fail(context,
+                                action_info.get('hypervisor_hostname'),
+                                payload, is_live_migration)
+
+    @staticmethod
+    def __moved_into_error(payload):
+        """Determine if an update notification tells a move failed.
+
+        An instance in error stays in error while it is rebuilt, so only an
+        update into error, or one ending the task of an instance in error,
+        fails its move.
+        """
+        if payload.get('state') != openstack_constants.ERROR:
+            return False
+        # empty strings stand for None in the notification payloads
+        return (payload.get('old_state') != openstack_constants.ERROR or
+                not payload.get('new_task_state'))
+
     def _store_event(self, context, hv_name, event_type, extra_msg=None):
         extra_msg = extra_msg or {}
         payload = {}
@@ -735,10 +1424,13 @@ class HAEngine(BasePolicyEngine):
     def _action_finished(self, context, hv_name):
         utils.safe_remove(self.in_action_hvs, hv_name)
         self.idle_hvs.add(hv_name)
+        self.changed_hvs.add(hv_name)
 
     def move_inst_success(self, context):
         action_info = self.haservice_action.pop(context.request_id, None)
         if action_info:
+            self.rebuild_ledger.remove(action_info.get('vm_uuid'))
+            self.move_deadlines.discard(action_info.get('vm_uuid'))
             action_info['action_result'] = 'success'
             self._store_event(context, action_info.get('hypervisor_hostname'),
                               ha_constants.ETYPE_HA_ACTION_END,
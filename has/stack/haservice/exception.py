@@ -46,3 +46,13 @@ class InvalidHAServiceInput(exception.Invalid):
 
 class HostMaintenanceError(exception.Invalid):
     msg_fmt = _("%(reason)s")
+
+
+class PowerProbeTimeout(exception.NovaException):
+    msg_fmt = _("Timed out after %(timeout)d seconds while probing the power "
+                "status of %(node)s.")
+
+
+class BMCCircuitOpen(exception.NovaException):
+    msg_fmt = _("The BMC %(bmc)s of %(node)s is not probed for another "
+                "%(retry_in)d seconds because its previous probes failed.")
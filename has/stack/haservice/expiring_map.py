@@ -0,0 +1,88 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bounded mapping whose entries expire."""
+
+import collections
+import time
+
+try:
+    from collections import abc as collections_abc
+except ImportError:
+    collections_abc = collections
+
+
+class ExpiringLRU(collections_abc.MutableMapping):
+    """Mapping which forgets its entries ttl seconds after they were set.
+
+    The entries are kept in the order they were last set, so the expired
+    ones are at the front; they are dropped lazily when an entry is set or
+    the mapping is iterated or sized, and can be read until then. Once the
+    mapping holds maxsize entries, setting a new one drops the least
+    recently set. Reading an entry does not refresh it.
+
+    Every entry dropped because it expired or did not fit is counted in
+    evictions and passed to on_evict(key, value), if given.
+    """
+    def __init__(self, ttl, maxsize, on_evict=None, items=None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.evictions = 0
+        # {key: (value, time the entry expires)}
+        self._data = collections.OrderedDict()
+        if items:
+            self.update(items)
+
+    def _evict(self, key):
+        value, _expires = self._data.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def expire(self, now=None):
+        """Drop the expired entries."""
+        if now is None:
+            now = time.time()
+        while self._data:
+            key = next(iter(self._data))
+            if self._data[key][1] > now:
+                break
+            self._evict(key)
+
+    def __getitem__(self, key):
+        return self._data[key][0]
+
+    def __setitem__(self, key, value):
+        now = time.time()
+        self.expire(now)
+        self._data.pop(key, None)
+        while len(self._data) >= self.maxsize:
+            self._evict(next(iter(self._data)))
+        self._data[key] = (value, now + self.ttl)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __iter__(self):
+        self.expire()
+        return iter(list(self._data))
+
+    def __len__(self):
+        self.expire()
+        return len(self._data)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
@@ -0,0 +1,110 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Phi-accrual failure detector over the compute service heartbeats."""
+
+import array
+import calendar
+import math
+import time
+
+import hastack.has.conf as ha_conf
+
+CONF = ha_conf.CONF
+
+
+def _to_timestamp(value):
+    if hasattr(value, 'utctimetuple'):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    return float(value)
+
+
+class _HeartbeatHistory(object):
+    """Ring buffer of the last inter-arrival times of a host."""
+    __slots__ = ('intervals', 'index', 'count', 'last')
+
+    def __init__(self, size):
+        self.intervals = array.array('d', [0.0] * size)
+        self.index = 0
+        self.count = 0
+        self.last = None
+
+    def add(self, timestamp):
+        if self.last is not None:
+            if timestamp <= self.last:
+                # the heartbeat has not been renewed since the last sample
+                return
+            self.intervals[self.index] = timestamp - self.last
+            self.index = (self.index + 1) % len(self.intervals)
+            self.count = min(self.count + 1, len(self.intervals))
+        self.last = timestamp
+
+    def mean_and_std(self):
+        samples = self.intervals[:self.count]
+        mean = sum(samples) / self.count
+        variance = sum((sample - mean) ** 2 for sample in samples) / self.count
+        return mean, math.sqrt(variance)
+
+
+class PhiAccrualDetector(object):
+    """Suspicion level of each host from the arrival of its heartbeats.
+
+    phi is -log10 of the probability that a heartbeat arrives even later
+    than now, assuming normally distributed inter-arrival times learnt from
+    the last CONF.ha_phi_window_size heartbeats: phi 1 means a 10% chance
+    that the host is fine, phi 8 one in 10^8. A host is suspected once phi
+    reaches CONF.ha_phi_threshold; hosts with fewer than
+    CONF.ha_phi_min_samples inter-arrival times are always suspected.
+    """
+    def __init__(self):
+        self._histories = {}
+
+    def heartbeat(self, host, timestamp):
+        """Record the time of the last heartbeat of a host."""
+        history = self._histories.get(host)
+        if history is None:
+            history = self._histories[host] = _HeartbeatHistory(
+                CONF.ha_phi_window_size)
+        history.add(_to_timestamp(timestamp))
+
+    def forget(self, host):
+        self._histories.pop(host, None)
+
+    def phi(self, host, now=None):
+        """Get the suspicion level of a host; None if not known enough."""
+        history = self._histories.get(host)
+        if history is None or history.count < CONF.ha_phi_min_samples:
+            return None
+        now = time.time() if now is None else now
+        mean, std = history.mean_and_std()
+        std = max(std, CONF.ha_phi_min_std)
+        elapsed = now - history.last
+        # logistic approximation of the normal CDF
+        y = (elapsed - mean) / std
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if elapsed > mean:
+            p_later = e / (1.0 + e)
+        else:
+            p_later = 1.0 - 1.0 / (1.0 + e)
+        if p_later <= 0:
+            return float('inf')
+        return -math.log10(p_later)
+
+    def is_suspect(self, host, now=None):
+        """Determine if a host should be probed through its BMC."""
+        if CONF.ha_phi_threshold <= 0:
+            return True
+        phi = self.phi(host, now)
+        return phi is None or phi >= CONF.ha_phi_threshold
@@ -14,9 +14,9 @@
 #    under the License.
 
 from oslo_log import log as logging
-from pyghmi.ipmi import command
 
 from hastack.has.stack.haservice import driver
+from hastack.has.stack.haservice import ipmi_utils
 
 
 LOG = logging.getLogger(__name__)
@@ -37,6 +37,9 @@ class HAFencingDriver(driver.HAFencingBaseDriver):
 
 class IPMIFencingDriver(driver.HAFencingBaseDriver):
     def fencing_host(self, context, bmc, user, password):
-        """Fencing the host by IPMI"""
-        ipmicmd = command.Command(bmc=bmc, userid=user, password=password)
-        ipmicmd.set_power('off')
+        """Fencing the host by IPMI
+
+        The session opened by the power probe of the same BMC is reused.
+        """
+        with ipmi_utils.ipmi_session(bmc, user, password) as ipmicmd:
+            ipmicmd.set_power('off')
@@ -16,6 +16,7 @@
 from oslo_log import log as logging
 
 from hastack.has.stack.haservice import driver
+from hastack.has.stack.haservice import service_snapshot
 from hastack.openstack.openstack_api.api import ComputeAPI
 
 LOG = logging.getLogger(__name__)
@@ -32,8 +33,12 @@ class HAHypervisorDriver(driver.HAHypervisorBaseDriver):
 
         :param context: nova context
         :param hv_name: name of a hypervisor
+        :param services: optional ServiceSnapshot of the current cycle
         :return: True if the hypervisor is deemed up and False otherwise
         """
+        services = kwargs.get('services')
+        if services is not None and services.has_hypervisor(hv_name):
+            return services.hypervisor_is_up(hv_name)
         context = context.elevated()
         nodes = compute_api.get_compute_nodes_by_hypervisor(context, hv_name)
         for node in nodes:
@@ -43,6 +48,26 @@ class HAHypervisorDriver(driver.HAHypervisorBaseDriver):
                 return compute_api.service_is_up(service)
         return False
 
+    def hypervisors_are_up(self, context, hv_names, **kwargs):
+        """Determine which of the hypervisors are up.
+
+        The liveness of all hypervisors is taken from one service snapshot,
+        so this costs at most two queries whatever the number of names.
+
+        :param context: nova context
+        :param hv_names: names of the hypervisors
+        :param services: optional ServiceSnapshot of the current cycle
+        :return: {hv_name: True if the hypervisor is deemed up}
+        """
+        services = kwargs.get('services')
+        if services is None:
+            context = context.elevated()
+            services = service_snapshot.ServiceSnapshot.load(
+                context, compute_api,
+                compute_api.get_all_compute_node(context))
+        return dict((hv_name, services.hypervisor_is_up(hv_name))
+                    for hv_name in hv_names)
+
     def get_target_service_host(self, context, ha_action, hv_name):
         """Get target host
 
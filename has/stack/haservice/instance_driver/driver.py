@@ -22,36 +22,49 @@ compute_api = ComputeAPI()
 
 class HAInstanceDriver(driver.HAInstanceBaseDriver):
 
-    def select_instances(self, context, hv_name):
+    def select_instances(self, context, hv_name, services=None, index=None):
         """Select all instances from this host
 
         If you don't have a custom action, set it to None.
         If no instances on this host require HA action, then return [].
 
         :param context: nova context
-        :param svc_host: service host
+        :param hv_name: hypervisor name
+        :param services: optional ServiceSnapshot of the current cycle
+        :param index: optional InstanceIndex to select the instances from
+                      instead of the database
         :return: [(instance, action)]
         """
-        nodes = compute_api.get_compute_nodes_by_hypervisor(context, hv_name)
-        for node in nodes:
-            if node.hypervisor_hostname == hv_name:
-                service = compute_api.get_service_by_compute_host(context,
-                                                                  node.host)
-                hv_is_up = compute_api.service_is_up(service)
-                svc_host = node.host
+        if services is not None and services.has_hypervisor(hv_name):
+            svc_host = services.get_host(hv_name)
+            hv_is_up = services.is_up(svc_host)
+        else:
+            nodes = compute_api.get_compute_nodes_by_hypervisor(context,
+                                                                hv_name)
+            for node in nodes:
+                if node.hypervisor_hostname == hv_name:
+                    service = compute_api.get_service_by_compute_host(
+                        context, node.host)
+                    hv_is_up = compute_api.service_is_up(service)
+                    svc_host = node.host
         states = [openstack_constants.ACTIVE, openstack_constants.STOPPED]
         if not hv_is_up:
             # VMs that are in ERROR state can also be 'rebuilt'
             states.append(openstack_constants.ERROR)
 
+        # Only the VMs that have 'ha' metadata will be moved; the index
+        # only holds those.
+        if index is not None:
+            insts = index.get_by_host(svc_host)
+        else:
+            expected_attr = {'metadata'}
+            insts = [inst for inst in
+                     compute_api.get_instance_by_host(context,
+                                                      svc_host, expected_attr)
+                     if inst['metadata'].get('ha', None) == str(True)]
         # For ERROR VM, if its launched_at is None, that means the VM changed
         # to ERROR when booting. This kind of VM cannot be rebuilt.
-        # And the VM has 'ha' metadata that will be moved
-        expected_attr = {'metadata'}
-        insts = [inst for inst in
-                 compute_api.get_instance_by_host(context,
-                                                  svc_host, expected_attr)
+        insts = [inst for inst in insts
                  if (inst['vm_state'] in states and
-                     inst['launched_at'] is not None) and
-                     inst['metadata'].get('ha', None) == str(True)]
+                     inst['launched_at'] is not None)]
         return [(inst, None) for inst in insts]
@@ -0,0 +1,188 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory index of the HA-enabled instances by host."""
+
+import time
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack.haservice import constants as ha_constants
+import hastack.openstack.openstack_api.db_api as db_api
+
+from oslo_log import log as logging
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class IndexedInstance(object):
+    """The fields of an instance the HA engine selects it by.
+
+    The fields can be read as items too, like those of Instance objects.
+    """
+    __slots__ = ('uuid', 'display_name', 'host', 'node', 'vm_state',
+                 'task_state', 'launched_at')
+
+    def __init__(self, uuid, display_name=None, host=None, node=None,
+                 vm_state=None, task_state=None, launched_at=None, **kwargs):
+        self.uuid = uuid
+        self.display_name = display_name
+        self.host = host
+        self.node = node
+        self.vm_state = vm_state
+        # empty strings stand for None in the notification payloads
+        self.task_state = task_state or None
+        self.launched_at = launched_at or None
+
+    @classmethod
+    def from_notification(cls, payload):
+        task_state = payload.get('new_task_state',
+                                 payload.get('state_description'))
+        return cls(payload['instance_id'],
+                   display_name=payload.get('display_name'),
+                   host=payload.get('host'),
+                   node=payload.get('node'),
+                   vm_state=payload.get('state'),
+                   task_state=task_state,
+                   launched_at=payload.get('launched_at'))
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+
+class InstanceIndex(object):
+    """The HA-enabled instances by host.
+
+    The index is loaded from the database in pages of
+    CONF.ha_instance_index_page_size instances, and again every
+    CONF.ha_instance_index_reconcile_interval seconds; in between it is
+    kept current from the lifecycle notifications of the instances. The
+    notifications received while the index is being loaded are applied
+    again once it is loaded, as the pages may predate them.
+    """
+    def __init__(self):
+        # {host: {instance_uuid: IndexedInstance}}
+        self._by_host = {}
+        # {instance_uuid: host}
+        self._hosts = {}
+        # {instance_uuid: IndexedInstance or None} of the notifications
+        # received while loading
+        self._pending = None
+        self.last_seed = None
+
+    @property
+    def seeded(self):
+        return self.last_seed is not None
+
+    def seed_due(self):
+        return (self.last_seed is None or
+                time.time() - self.last_seed >=
+                CONF.ha_instance_index_reconcile_interval)
+
+    def seed(self, context):
+        """Load the index from the database."""
+        started_at = time.time()
+        by_host, hosts = {}, {}
+        self._pending = {}
+        try:
+            limit = CONF.ha_instance_index_page_size
+            marker = None
+            while True:
+                rows = db_api.instance_get_ha_enabled_page(
+                    context, marker=marker, limit=limit)
+                for row in rows:
+                    self._put(by_host, hosts, IndexedInstance(**row))
+                if len(rows) < limit:
+                    break
+                marker = rows[-1]['id']
+        finally:
+            pending = self._pending
+            self._pending = None
+        for inst_uuid, inst in pending.items():
+            self._remove(by_host, hosts, inst_uuid)
+            if inst is not None:
+                self._put(by_host, hosts, inst)
+        self._by_host, self._hosts = by_host, hosts
+        self.last_seed = started_at
+        LOG.debug("Loaded the index of %(count)d HA-enabled instance(s) on "
+                  "%(hosts)d host(s).",
+                  {'count': len(hosts), 'hosts': len(by_host)})
+
+    @staticmethod
+    def _put(by_host, hosts, inst):
+        if not inst.host:
+            return
+        by_host.setdefault(inst.host, {})[inst.uuid] = inst
+        hosts[inst.uuid] = inst.host
+
+    @staticmethod
+    def _remove(by_host, hosts, inst_uuid):
+        host = hosts.pop(inst_uuid, None)
+        if host is None:
+            return
+        insts = by_host[host]
+        del insts[inst_uuid]
+        if not insts:
+            del by_host[host]
+
+    def update(self, event_type, payload):
+        """Apply a lifecycle notification of an instance."""
+        inst_uuid = payload.get('instance_id')
+        if not inst_uuid:
+            return
+        if event_type == ha_constants.NOTIFY_INSTANCE_DELETE:
+            inst = None
+        elif 'metadata' not in payload:
+            # whether the instance is HA-enabled is unknown
+            return
+        elif (payload['metadata'] or {}).get('ha') == str(True):
+            inst = IndexedInstance.from_notification(payload)
+        else:
+            inst = None
+        if self._pending is not None:
+            self._pending[inst_uuid] = inst
+        self._remove(self._by_host, self._hosts, inst_uuid)
+        if inst is not None:
+            self._put(self._by_host, self._hosts, inst)
+
+    def refresh(self, inst):
+        """Replace the entry of an instance with the one loaded from the
+        database, e.g. when the notification of its move was lost.
+        """
+        indexed = IndexedInstance(inst['uuid'],
+                                  display_name=inst['display_name'],
+                                  host=inst['host'],
+                                  node=inst['node'],
+                                  vm_state=inst['vm_state'],
+                                  task_state=inst['task_state'],
+                                  launched_at=inst['launched_at'])
+        if self._pending is not None:
+            self._pending[inst['uuid']] = indexed
+        self._remove(self._by_host, self._hosts, inst['uuid'])
+        self._put(self._by_host, self._hosts, indexed)
+
+    def get_by_host(self, host):
+        """Get the HA-enabled instances on a host."""
+        return list(self._by_host.get(host, {}).values())
+
+    def __len__(self):
+        return len(self._hosts)
@@ -13,28 +13,103 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
+import time
+
+from eventlet import semaphore
 from oslo_log import log as logging
-from oslo_serialization import jsonutils
 
 from pyghmi.ipmi import command
 
+import hastack.has.conf as ha_conf
+from hastack.has.stack.haservice import node_cache
+
+CONF = ha_conf.CONF
+
 LOG = logging.getLogger(__name__)
 
 
+class IPMISessionPool(object):
+    """Authenticated pyghmi commands kept warm per (bmc, user).
+
+    Building a pyghmi Command pays the RMCP+ session handshake, so the
+    commands are handed back to the pool after use and reused by the next
+    probe or fencing of the same BMC. Commands whose session broke, whose
+    call raised or which stayed idle too long are logged out and dropped,
+    and at most CONF.ha_ipmi_max_sessions_per_bmc sessions to the same BMC
+    are in use at a time.
+    """
+    def __init__(self):
+        # {(bmc, user): [(password, command, last used)]}
+        self._idle = collections.defaultdict(list)
+        self._semaphores = {}
+
+    @staticmethod
+    def _is_broken(ipmicmd):
+        session = getattr(ipmicmd, 'ipmi_session', None)
+        return (session is not None and
+                getattr(session, 'broken', False) is True)
+
+    @staticmethod
+    def _logout(ipmicmd):
+        try:
+            ipmicmd.ipmi_session.logout()
+        except Exception:
+            pass
+
+    def _checkout(self, key, password):
+        idle = self._idle[key]
+        while idle:
+            cached_password, ipmicmd, last_used = idle.pop()
+            if (cached_password != password or self._is_broken(ipmicmd) or
+                    time.time() - last_used >
+                    CONF.ha_ipmi_session_idle_timeout):
+                self._logout(ipmicmd)
+                continue
+            return ipmicmd
+        return command.Command(bmc=key[0], userid=key[1], password=password)
+
+    @contextlib.contextmanager
+    def session(self, bmc, user, password):
+        key = (bmc, user)
+        if key not in self._semaphores:
+            self._semaphores[key] = semaphore.Semaphore(
+                CONF.ha_ipmi_max_sessions_per_bmc)
+        with self._semaphores[key]:
+            ipmicmd = self._checkout(key, password)
+            try:
+                yield ipmicmd
+            except BaseException:
+                # the session may be half-way through a request; never
+                # hand it out again
+                self._logout(ipmicmd)
+                raise
+            if self._is_broken(ipmicmd):
+                self._logout(ipmicmd)
+            else:
+                self._idle[key].append((password, ipmicmd, time.time()))
+
+    def clear(self):
+        for idle in self._idle.values():
+            for _password, ipmicmd, _last_used in idle:
+                self._logout(ipmicmd)
+        self._idle.clear()
+        self._semaphores.clear()
+
+
+_session_pool = IPMISessionPool()
+
+
+def ipmi_session(bmc, user, password):
+    """Context manager lending a pooled pyghmi Command for a BMC."""
+    return _session_pool.session(bmc, user, password)
+
+
 def get_bmc(compute_node):
-    metrics = compute_node['metrics'] or {}
-    metrics = jsonutils.loads(str(metrics))
-    bmc = ''
-    user = ''
-    password = ''
-    for metric in metrics:
-        if metric.get('name', '') == 'bmc':
-            bmc = metric.get('value', '')
-        if metric.get('name', '') == 'user':
-            user = metric.get('value', '')
-        if metric.get('name', '') == 'password':
-            password = metric.get('value', '')
-    return bmc, user, password
+    """get the BMC address and credentials of a compute node"""
+    attrs = node_cache.get_node_attributes(compute_node)
+    return attrs.bmc, attrs.user, attrs.password
 
 
 def get_power(compute_node):
@@ -44,6 +119,6 @@ def get_power(compute_node):
               "bmc: %(bmc)s, user: %(user)s, password: %(password)s")
              % {'compute_node': compute_node['hypervisor_hostname'],
                 'bmc': bmc, 'user': user, 'password': "hack_password"})
-    ipmicmd = command.Command(bmc=bmc, userid=user, password=password)
-    ret = ipmicmd.get_power()
+    with ipmi_session(bmc, user, password) as ipmicmd:
+        ret = ipmicmd.get_power()
     return ret['powerstate']
@@ -19,6 +19,7 @@ import time
 
 from hastack.has.stack import has_gettextutils
 from hastack.has.stack.haservice import engine
+from hastack.has.stack.haservice import notification
 
 from oslo_log import log as logging
 import oslo_messaging as messaging
@@ -75,7 +76,7 @@ def period_heartbeat_file(heartbeat_file,
 
 class HAServiceManager(openstack_utils.NovaManager):
 
-    target = messaging.Target(version="1.0")
+    target = messaging.Target(version="1.1")
 
     """
     The HA manager is responsible for handling the service CRUD operations and
@@ -85,6 +86,12 @@ class HAServiceManager(openstack_utils.NovaManager):
         super(HAServiceManager, self).__init__(*args, **kwargs)
         self.has_driver = importutils.import_object(CONF.has_driver)
         self.engine = engine.HAEngine(host, self.has_driver)
+        self.context_provider = openstack_utils.ContextProvider(
+            self.has_driver.get_context)
+        self.notification_consumer = None
+        if CONF.ha_notification_listener:
+            self.notification_consumer = notification.NotificationConsumer(
+                self.engine)
         # self.maintenance_engine = engine.MaintenanceEngine(None,
         #                                                    self.has_driver)
         period_heartbeat_file("hastack-service.heartbeat",
@@ -92,9 +99,30 @@ class HAServiceManager(openstack_utils.NovaManager):
         LOG.debug("The engine manager successfully initialized "
                   "the HA service.")
 
-    @periodic_task.periodic_task(spacing=CONF.ha_period_interval)
+    def init_host(self):
+        if self.notification_consumer is not None:
+            self.notification_consumer.start()
+            self.engine.notification_driven = True
+
+    def cleanup_host(self):
+        if self.notification_consumer is not None:
+            self.engine.notification_driven = False
+            self.notification_consumer.stop()
+
+    def host_suspect(self, context, hv_name, reason=None):
+        """Evaluate a host reported as failed by an external monitor.
+
+        The host is evaluated with the context of the service, as the
+        caller may not be allowed to see all the instances; only the request
+        id of the report is kept to trace it.
+        """
+        ctxt = self.context_provider.get_context()
+        ctxt.request_id = context.request_id
+        self.engine.host_suspect(ctxt, hv_name, reason=reason)
+
+    @periodic_task.periodic_task(spacing=CONF.ha_probe_tick_interval)
     def __periodic_task(self, context):
-        """This task is triggered every 60 seconds."""
-        ctxt = openstack_utils.create_context()
+        """This task is triggered every ha_probe_tick_interval seconds."""
+        ctxt = self.context_provider.get_context()
         self.engine.service_function(ctxt)
         # self.maintenance_engine.service_function(ctxt)
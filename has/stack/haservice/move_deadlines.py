@@ -0,0 +1,82 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Deadlines of the instances being moved away from their hypervisor."""
+
+import heapq
+import itertools
+import time
+
+import hastack.has.conf as ha_conf
+
+CONF = ha_conf.CONF
+
+
+class MoveDeadlines(object):
+    """Min-heap of the instances being moved, keyed by their deadline.
+
+    An instance must be moved within CONF.has_ha_timeout_seconds of the
+    start of its move; the engine pops the expired deadlines once per cycle,
+    which costs O(k log n) for k expired out of n instances being moved
+    instead of a scan of all of them.
+
+    Moving an instance again or discarding it leaves its previous heap entry
+    behind, which is skipped when it is popped.
+    """
+    def __init__(self):
+        self._heap = []
+        # {instance_uuid: sequence number of its valid heap entry}
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def add(self, inst_uuid, hv_name, started_at=None, name=None):
+        """Start the deadline of an instance moved away from hv_name."""
+        if started_at is None:
+            started_at = time.time()
+        seq = next(self._counter)
+        self._entries[inst_uuid] = seq
+        heapq.heappush(self._heap,
+                       (started_at + CONF.has_ha_timeout_seconds, seq,
+                        inst_uuid, hv_name, name))
+
+    def discard(self, inst_uuid):
+        """Forget an instance whose move has finished."""
+        self._entries.pop(inst_uuid, None)
+
+    def pop_expired(self, now=None):
+        """Pop the instances whose deadline has passed.
+
+        :returns: list of (instance_uuid, hv_name, name)
+        """
+        if now is None:
+            now = time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            _deadline, seq, inst_uuid, hv_name, name = heapq.heappop(
+                self._heap)
+            if self._entries.get(inst_uuid) == seq:
+                del self._entries[inst_uuid]
+                expired.append((inst_uuid, hv_name, name))
+        return expired
+
+    def clear(self):
+        self._heap = []
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, inst_uuid):
+        return inst_uuid in self._entries
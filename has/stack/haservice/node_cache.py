@@ -0,0 +1,171 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Incremental cache of the compute nodes managed by the HA engine."""
+
+import ast
+import collections
+import datetime
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack.haservice import constants as ha_constants
+import hastack.openstack.openstack_api.db_api as db_api
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class ComputeNodeCache(object):
+    """Compute nodes refreshed from the rows changed since the last refresh.
+
+    The first refresh (and one every CONF.ha_node_cache_full_sync_interval
+    seconds) loads all live nodes; the others only load the rows whose
+    created_at, updated_at or deleted_at is past the watermark, i.e. the
+    newest timestamp seen so far minus a small margin for clock skew
+    between the hosts writing the rows.
+    """
+    def __init__(self):
+        self._nodes = {}
+        self._watermark = None
+        self._last_full_sync = None
+
+    @staticmethod
+    def _changed_at(node):
+        return max(ts for ts in (node.get('created_at'),
+                                 node.get('updated_at'),
+                                 node.get('deleted_at')) if ts is not None)
+
+    def _full_sync_due(self):
+        return (self._watermark is None or
+                self._last_full_sync is None or
+                timeutils.is_older_than(
+                    self._last_full_sync,
+                    CONF.ha_node_cache_full_sync_interval))
+
+    def refresh(self, context):
+        """Bring the cache up to date and return the live nodes."""
+        if self._full_sync_due():
+            self._last_full_sync = timeutils.utcnow()
+            rows = db_api.compute_node_get_all_changed_since(context)
+            self._nodes = {}
+        else:
+            since = self._watermark - datetime.timedelta(
+                seconds=ha_constants.NODE_CACHE_WATERMARK_MARGIN)
+            rows = db_api.compute_node_get_all_changed_since(context, since)
+
+        for row in rows:
+            if row.get('deleted'):
+                self._nodes.pop(row['id'], None)
+                _attributes_cache.evict(row['id'])
+            else:
+                self._nodes[row['id']] = row
+            changed_at = self._changed_at(row)
+            if self._watermark is None or changed_at > self._watermark:
+                self._watermark = changed_at
+        LOG.debug("Refreshed the compute node cache with %(rows)d row(s); "
+                  "%(nodes)d node(s) are managed.",
+                  {'rows': len(rows), 'nodes': len(self._nodes)})
+        return self.nodes()
+
+    def nodes(self):
+        return list(self._nodes.values())
+
+
+# The attributes of a compute node the engine reads on its hot paths.
+NodeAttributes = collections.namedtuple(
+    'NodeAttributes', ['parallel_rebuild', 'parallel_dest_rebuild',
+                       'bmc', 'user', 'password'])
+
+
+def _node_field(node, key):
+    try:
+        return node[key]
+    except Exception:
+        # unset fields of ComputeNode objects cannot be lazy-loaded
+        return None
+
+
+def _parse_stats(stats):
+    if not stats:
+        return {}
+    if isinstance(stats, dict):
+        return stats
+    try:
+        return jsonutils.loads(stats)
+    except ValueError:
+        return ast.literal_eval(stats)
+
+
+def _parse_bmc(metrics):
+    metrics = jsonutils.loads(six.text_type(metrics or []))
+    bmc = {'bmc': '', 'user': '', 'password': ''}
+    for metric in metrics:
+        name = metric.get('name', '')
+        if name in bmc:
+            bmc[name] = metric.get('value', '')
+    return bmc['bmc'], bmc['user'], bmc['password']
+
+
+def parse_node_attributes(node):
+    """Parse the stats and metrics of a compute node."""
+    stats = _parse_stats(_node_field(node, 'stats'))
+    bmc, user, password = _parse_bmc(_node_field(node, 'metrics'))
+    return NodeAttributes(
+        int(stats.get(ha_constants.PARALLEL_REBUILD,
+                      ha_constants.DEFAULT_PARALLEL_REBUILD)),
+        int(stats.get(ha_constants.PARALLEL_DEST_REBUILD,
+                      ha_constants.DEFAULT_PARALLEL_DEST_REBUILD)),
+        bmc, user, password)
+
+
+class NodeAttributesCache(object):
+    """Parsed attributes of the compute nodes keyed by node id.
+
+    An entry is parsed again only when the updated_at of the node changes;
+    nodes without an id or updated_at are parsed on every lookup.
+    """
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, node):
+        node_id = _node_field(node, 'id')
+        updated_at = _node_field(node, 'updated_at')
+        if node_id is None or updated_at is None:
+            return parse_node_attributes(node)
+        entry = self._entries.get(node_id)
+        if entry is None or entry[0] != updated_at:
+            entry = (updated_at, parse_node_attributes(node))
+            self._entries[node_id] = entry
+        return entry[1]
+
+    def evict(self, node_id):
+        self._entries.pop(node_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+_attributes_cache = NodeAttributesCache()
+
+
+def get_node_attributes(node):
+    """Get the parsed attributes of a compute node from the cache."""
+    return _attributes_cache.get(node)
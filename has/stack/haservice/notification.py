@@ -0,0 +1,178 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Consumer of the notifications of nova handled by the HA engine."""
+
+import re
+
+import eventlet
+from eventlet import queue
+from eventlet import semaphore
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack.haservice import constants as ha_constants
+from nova import context as nova_context
+from nova import rpc
+
+from oslo_log import log as logging
+import oslo_messaging as messaging
+
+_LE = has_gettextutils._LE
+_LI = has_gettextutils._LI
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+_EVENT_TYPES = '^(%s)$' % '|'.join(
+    re.escape(event_type)
+    for event_type in sorted(set(list(ha_constants.NOTIFY_MOVE_SUCCESS) +
+                                 list(ha_constants.NOTIFY_MOVE_FAIL) +
+                                 list(ha_constants.NOTIFY_INSTANCE_INDEX))))
+
+# tells a worker to stop once it has handled what was queued before
+_STOP = object()
+
+
+def _instance_uuid(payload):
+    return payload.get('instance_id') or payload.get('instance_uuid')
+
+
+class NotificationEndpoint(object):
+    """Endpoint of the batch notification listener."""
+    filter_rule = messaging.NotificationFilter(event_type=_EVENT_TYPES)
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+
+    def info(self, messages):
+        self.consumer.put(messages)
+
+    def error(self, messages):
+        self.consumer.put(messages)
+
+
+class NotificationConsumer(object):
+    """Hands the notifications of nova to the HA engine in batches.
+
+    A batch notification listener in the CONF.ha_notification_pool pool
+    receives the notifications of the moves, and only those whose
+    request_id was made by HA are kept, along with the lifecycle
+    notifications of all instances if CONF.ha_instance_index is set. They
+    are queued to one of CONF.ha_notification_workers workers by their
+    instance, so that the notifications of an instance are handled in the
+    order they were received, and each worker hands what is queued to it,
+    at most CONF.ha_notification_batch_size at a time, to
+    engine.handle_notifications.
+
+    The queues hold at most CONF.ha_notification_queue_size notifications
+    each; while one is full the listener blocks, and the notifications not
+    consumed yet stay on the broker.
+
+    :param engine: the HAEngine
+    :param transport: the notification transport, e.g. a fake one in tests;
+                      the one of nova by default
+    """
+    def __init__(self, engine, transport=None):
+        self.engine = engine
+        self._transport = transport
+        self._queues = [queue.LightQueue(CONF.ha_notification_queue_size)
+                        for _i in range(CONF.ha_notification_workers)]
+        # the batches are queued one at a time so that the notifications of
+        # an instance keep their order
+        self._put_lock = semaphore.Semaphore()
+        self._index_events = (ha_constants.NOTIFY_INSTANCE_INDEX
+                              if CONF.ha_instance_index else ())
+        self._workers = []
+        self._listener = None
+
+    def start(self):
+        transport = (self._transport or rpc.NOTIFICATION_TRANSPORT or
+                     messaging.get_notification_transport(CONF))
+        targets = [messaging.Target(topic=topic)
+                   for topic in CONF.ha_notification_topics]
+        self._listener = messaging.get_batch_notification_listener(
+            transport, targets, [NotificationEndpoint(self)],
+            executor='eventlet', pool=CONF.ha_notification_pool,
+            batch_size=CONF.ha_notification_batch_size,
+            batch_timeout=CONF.ha_notification_batch_timeout)
+        self._workers = [eventlet.spawn(self._work, work_queue)
+                         for work_queue in self._queues]
+        self._listener.start()
+        LOG.info(_LI("Listening to the notifications on %(topics)s in pool "
+                     "%(pool)s.")
+                 % {'topics': ', '.join(CONF.ha_notification_topics),
+                    'pool': CONF.ha_notification_pool})
+
+    def stop(self):
+        """Stop listening and handle the notifications already queued."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener.wait()
+            self._listener = None
+        for work_queue in self._queues:
+            work_queue.put(_STOP)
+        for worker in self._workers:
+            worker.wait()
+        self._workers = []
+
+    def put(self, messages):
+        """Queue the notifications the engine handles.
+
+        Blocks while the queue of one of their instances is full.
+        """
+        with self._put_lock:
+            for message in messages:
+                ctxt = message.get('ctxt') or {}
+                request_id = ctxt.get('request_id') or ''
+                if not (request_id.startswith(ha_constants.PREFIX_HAS_HA) or
+                        message['event_type'] in self._index_events):
+                    continue
+                payload = message.get('payload') or {}
+                index = hash(_instance_uuid(payload)) % len(self._queues)
+                self._queues[index].put(
+                    (ctxt, message['event_type'], payload))
+
+    def queue_depths(self):
+        """Number of notifications queued per worker."""
+        return [work_queue.qsize() for work_queue in self._queues]
+
+    def _work(self, work_queue):
+        while True:
+            item = work_queue.get()
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= CONF.ha_notification_batch_size:
+                    break
+                try:
+                    item = work_queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._handle(batch)
+            if item is _STOP:
+                return
+
+    def _handle(self, batch):
+        try:
+            events = [(nova_context.RequestContext.from_dict(ctxt),
+                       event_type, payload)
+                      for ctxt, event_type, payload in batch]
+            self.engine.handle_notifications(events)
+        except Exception:
+            LOG.exception(_LE("Failed to handle %d notification(s).")
+                          % len(batch))
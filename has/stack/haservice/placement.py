@@ -0,0 +1,133 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Batched scheduler placement of the instances of a failed hypervisor."""
+
+import collections
+import copy
+import time
+
+import hastack.has.conf as ha_conf
+from hastack.has.stack import constants
+from hastack.has.stack.haservice import utils as ha_utils
+import hastack.openstack.openstack_constants as openstack_constants
+import hastack.openstack.openstack_utils as openstack_utils
+
+from oslo_log import log as logging
+
+CONF = ha_conf.CONF
+
+LOG = logging.getLogger(__name__)
+
+
+class PlacementPlanner(object):
+    """Selects the destinations of many instances in a few scheduler calls.
+
+    The instances are grouped by flavor and image, since a request spec
+    describes a single one of each, and each group is placed by a single
+    select_destinations call asking for up to CONF.ha_placement_batch_size
+    instances. As the scheduler fails a multi-instance request as a whole
+    when not all of them fit, the instances of a batch which failed with
+    NoValidHost are placed one by one instead.
+    """
+    def __init__(self, compute_api, scheduler_rpcapi):
+        self.compute_api = compute_api
+        self.scheduler_rpcapi = scheduler_rpcapi
+
+    @staticmethod
+    def _group_key(inst):
+        return inst['instance_type_id'], inst['image_ref']
+
+    def _batches(self, insts):
+        groups = collections.OrderedDict()
+        for inst in insts:
+            groups.setdefault(self._group_key(inst), []).append(inst)
+        size = CONF.ha_placement_batch_size
+        for group in groups.values():
+            for start in range(0, len(group), size):
+                yield group[start:start + size]
+
+    def _select_destinations(self, context, insts, filter_properties,
+                             observer=None):
+        start = time.time()
+        try:
+            destinations = self._do_select_destinations(
+                context, insts, filter_properties)
+        except Exception as ex:
+            if observer is not None:
+                observer(time.time() - start, ex)
+            raise
+        if observer is not None:
+            observer(time.time() - start)
+        return destinations
+
+    def _do_select_destinations(self, context, insts, filter_properties):
+        img = ha_utils.get_image_from_inst(insts[0])
+        request_spec = openstack_utils.build_request_spec(context, img, insts)
+        request_spec['operation_type'] = (
+            constants.FILTER_WORKING_SCOPE_EVACUATE)
+        filter_properties = copy.deepcopy(filter_properties)
+        openstack_utils.setup_instance_group(context, request_spec,
+                                             filter_properties)
+        spec_obj = self.compute_api.create_request_spec(context,
+                                                        request_spec,
+                                                        filter_properties)
+        return self.scheduler_rpcapi.select_destinations(context, spec_obj)
+
+    def _place_one_by_one(self, context, insts, filter_properties,
+                          observer):
+        for inst in insts:
+            try:
+                destinations = self._select_destinations(
+                    context, [inst], filter_properties, observer)
+            except Exception as ex:
+                yield inst, None, ex
+            else:
+                yield inst, destinations[0], None
+
+    def place(self, context, insts, filter_properties, observer=None):
+        """Select a destination for each instance.
+
+        :param context: nova context
+        :param insts: the instances to place
+        :param filter_properties: the filter properties shared by all of
+                                  the instances, e.g. ignore_hosts
+        :param observer: called with the latency of each scheduler call and
+                         the exception it raised, if any
+        :returns: [(instance, destination, exception)], where destination
+                  is the dict returned by the scheduler, or None if the
+                  instance could not be placed because of exception
+        """
+        plan = []
+        for batch in self._batches(insts):
+            try:
+                destinations = self._select_destinations(
+                    context, batch, filter_properties, observer)
+            except openstack_constants.NoValidHost as ex:
+                if len(batch) == 1:
+                    plan.append((batch[0], None, ex))
+                    continue
+                LOG.debug("No valid host was found for all %(num)d "
+                          "instance(s) of a batch; placing them one by one.",
+                          {'num': len(batch)})
+                plan.extend(self._place_one_by_one(context, batch,
+                                                   filter_properties,
+                                                   observer))
+            except Exception as ex:
+                plan.extend((inst, None, ex) for inst in batch)
+            else:
+                plan.extend((inst, destination, None)
+                            for inst, destination in zip(batch, destinations))
+        return plan
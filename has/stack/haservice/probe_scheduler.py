@@ -0,0 +1,112 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-hypervisor deadlines of the power probes."""
+
+import heapq
+import itertools
+import random
+import time
+
+import hastack.has.conf as ha_conf
+
+CONF = ha_conf.CONF
+
+
+class ProbeScheduler(object):
+    """Min-heap of the next probe deadline of every hypervisor.
+
+    A healthy hypervisor is probed every CONF.ha_period_interval seconds on
+    average, randomly spread by CONF.ha_probe_jitter, so that the probes of
+    all hosts are spread evenly over the period instead of being sent in one
+    sweep; a suspect hypervisor is probed every
+    CONF.ha_probe_suspect_interval seconds. New hypervisors are due at once.
+
+    Rescheduling a hypervisor leaves its previous heap entry behind, which
+    is skipped when it is popped.
+    """
+    def __init__(self):
+        self._heap = []
+        # {hv_name: (sequence number, deadline) of its valid heap entry};
+        # None while the hypervisor is being probed
+        self._entries = {}
+        self._counter = itertools.count()
+
+    def _push(self, hv_name, deadline):
+        seq = next(self._counter)
+        self._entries[hv_name] = (seq, deadline)
+        heapq.heappush(self._heap, (deadline, seq, hv_name))
+
+    def sync(self, hv_names):
+        """Track exactly the given hypervisors."""
+        hv_names = set(hv_names)
+        for hv_name in set(self._entries) - hv_names:
+            del self._entries[hv_name]
+        now = time.time()
+        for hv_name in hv_names - set(self._entries):
+            self._push(hv_name, now)
+
+    def schedule(self, hv_name, suspect=False):
+        """Set the next probe deadline of a hypervisor."""
+        if suspect:
+            interval = CONF.ha_probe_suspect_interval
+        else:
+            jitter = CONF.ha_probe_jitter
+            interval = CONF.ha_period_interval * random.uniform(1 - jitter,
+                                                                1 + jitter)
+        self._push(hv_name, time.time() + interval)
+
+    def schedule_popped(self, hv_names, suspect=False):
+        """Schedule those of the hypervisors still awaiting a deadline.
+
+        The hypervisors popped by pop_due and not scheduled again since,
+        e.g. because their probe raised, are scheduled; the others are left
+        alone.
+        """
+        for hv_name in hv_names:
+            if hv_name in self._entries and self._entries[hv_name] is None:
+                self.schedule(hv_name, suspect=suspect)
+
+    def expedite(self, hv_name):
+        """Make a hypervisor due now unless it is probed soon anyway."""
+        entry = self._entries.get(hv_name)
+        if entry is None:
+            return
+        now = time.time()
+        if entry[1] > now + CONF.ha_probe_suspect_interval:
+            self._push(hv_name, now)
+
+    def pop_due(self):
+        """Pop the hypervisors whose deadline has passed.
+
+        Each of them must be scheduled again once it has been probed.
+        """
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, seq, hv_name = heapq.heappop(self._heap)
+            if self._entries.get(hv_name) == (seq, deadline):
+                self._entries[hv_name] = None
+                due.append(hv_name)
+        return due
+
+    def next_deadline(self):
+        """Get the earliest probe deadline, or None."""
+        while self._heap:
+            deadline, seq, hv_name = self._heap[0]
+            if self._entries.get(hv_name) == (seq, deadline):
+                return deadline
+            heapq.heappop(self._heap)
+        return None
@@ -0,0 +1,85 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Admission control of the evacuations across all failed hypervisors."""
+
+import collections
+import time
+
+
+class TokenBucket(object):
+    """Token bucket admitting rate operations per second on average.
+
+    Up to burst operations may be admitted at once after the bucket has
+    been idle; a rate of 0 or less admits everything.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._last = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def consume(self):
+        """Take a token.
+
+        :returns: 0 if a token was taken, or else the seconds to wait until
+                  one is available
+        """
+        if self.rate <= 0:
+            return 0
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class FairQueue(object):
+    """FIFO queues per key, served round-robin.
+
+    Each get takes the oldest item of the next key, so a key with many
+    items queued cannot starve the others.
+    """
+    def __init__(self):
+        self._queues = collections.OrderedDict()
+        self._len = 0
+
+    def put(self, key, item):
+        self._queues.setdefault(key, collections.deque()).append(item)
+        self._len += 1
+
+    def get(self):
+        key, queue = next(iter(self._queues.items()))
+        item = queue.popleft()
+        # move the key to the end of the round
+        del self._queues[key]
+        if queue:
+            self._queues[key] = queue
+        self._len -= 1
+        return item
+
+    def depths(self):
+        """Number of items queued per key."""
+        return dict((key, len(queue))
+                    for key, queue in self._queues.items())
+
+    def __len__(self):
+        return self._len
@@ -0,0 +1,116 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Ledger of the rebuilds in flight per source and destination host."""
+
+import collections
+import time
+
+import hastack.openstack.openstack_api.db_api as db_api
+import hastack.openstack.openstack_constants as openstack_constants
+
+
+class RebuildLedger(object):
+    """Counts the rebuilds in flight on each host.
+
+    The evacuations started by the engine are recorded in the ledger as
+    soon as the evacuate API returns, and the move_inst_success and
+    move_inst_fail notifications remove them again, so the
+    has:max_parallel_rebuilds and has:max_parallel_dest_rebuilds limits
+    are dict lookups and the engine needs not wait for instance.host to
+    be updated before starting the next evacuation.
+
+    Once per cycle the ledger is reconciled with the instances which are
+    being rebuilt according to the database: the recorded evacuations that
+    are no longer rebuilding are dropped (e.g. when a notification was
+    lost), and the rebuilds the engine did not start are counted on the
+    host of their instance. The evacuations recorded as queued are kept
+    until they are started, as the database does not know them yet.
+    """
+    def __init__(self):
+        self._counts = {}
+        # {instance_uuid: (source host, destination host, started at)};
+        # started at is None while the evacuation is queued
+        self._inflight = {}
+        self._source = collections.defaultdict(int)
+        self._dest = collections.defaultdict(int)
+
+    def seed(self, context):
+        """Reconcile the ledger with the rebuilding instances."""
+        polled_at = time.time()
+        self.reconcile(db_api.instance_get_hosts_by_task_states(
+            context, openstack_constants.REBUILD_TASK_STATES), polled_at)
+
+    def reconcile(self, rebuilding, polled_at):
+        """Reconcile the ledger with the rebuilding instances.
+
+        :param rebuilding: {instance_uuid: host} of the instances being
+                           rebuilt
+        :param polled_at: the time the instances were polled at; rebuilds
+                          recorded after it are kept in any case
+        """
+        for inst_uuid, (_src, _dest, started_at) in list(
+                self._inflight.items()):
+            if (inst_uuid not in rebuilding and started_at is not None and
+                    started_at < polled_at):
+                self.remove(inst_uuid)
+        counts = collections.defaultdict(int)
+        for inst_uuid, host in rebuilding.items():
+            if inst_uuid not in self._inflight:
+                counts[host] += 1
+        self._counts = dict(counts)
+
+    def count_source(self, host):
+        """Number of rebuilds in flight away from a host."""
+        return self._counts.get(host, 0) + self._source[host]
+
+    def count_dest(self, host):
+        """Number of rebuilds in flight towards a host."""
+        return self._counts.get(host, 0) + self._dest[host]
+
+    def add(self, inst_uuid, source_host, dest_host, started_at=None,
+            queued=False):
+        """Record a rebuild the engine has just started, or queued."""
+        self.remove(inst_uuid)
+        if queued:
+            started_at = None
+        elif started_at is None:
+            started_at = time.time()
+        self._inflight[inst_uuid] = (source_host, dest_host, started_at)
+        self._source[source_host] += 1
+        self._dest[dest_host] += 1
+
+    def start(self, inst_uuid):
+        """Record that a queued rebuild has been started."""
+        hosts = self._inflight.get(inst_uuid)
+        if hosts is not None:
+            self._inflight[inst_uuid] = hosts[:2] + (time.time(),)
+
+    def remove(self, inst_uuid):
+        """Forget a rebuild which has succeeded or failed."""
+        hosts = self._inflight.pop(inst_uuid, None)
+        if hosts is None:
+            return False
+        source_host, dest_host, _started_at = hosts
+        self._source[source_host] -= 1
+        self._dest[dest_host] -= 1
+        return True
+
+    def inflight(self):
+        """{instance_uuid: (source host, destination host, started at)}"""
+        return dict(self._inflight)
+
+    def __contains__(self, inst_uuid):
+        return inst_uuid in self._inflight
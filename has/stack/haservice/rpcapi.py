@@ -0,0 +1,53 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Client side of the HA service RPC API."""
+
+import oslo_messaging as messaging
+
+import hastack.has.conf as ha_conf
+from nova.objects import base as objects_base
+from nova import rpc
+
+CONF = ha_conf.CONF
+
+
+class HAPolicyAPI(object):
+    """Client side of the HA service RPC API.
+
+    API version history:
+
+        * 1.0 - Initial version, without any method.
+        * 1.1 - Add host_suspect()
+    """
+
+    VERSION_ALIASES = {}
+
+    def __init__(self):
+        super(HAPolicyAPI, self).__init__()
+        target = messaging.Target(topic=CONF.haservice_topic, version='1.0')
+        serializer = objects_base.NovaObjectSerializer()
+        self.client = rpc.get_client(target, version_cap='1.1',
+                                     serializer=serializer)
+
+    def host_suspect(self, ctxt, hv_name, reason=None):
+        """Ask the HA service to evaluate a host which seems failed at once.
+
+        The HA service drops the reports exceeding its rate limit, so a
+        monitor may report a host as often as it sees it failing.
+        """
+        cctxt = self.client.prepare(version='1.1')
+        return cctxt.cast(ctxt, 'host_suspect', hv_name=hv_name,
+                          reason=reason)
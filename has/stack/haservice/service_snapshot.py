@@ -0,0 +1,77 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Per-cycle snapshot of the nova-compute service liveness."""
+
+
+class ServiceSnapshot(object):
+    """Liveness of all nova-compute services loaded with a single query.
+
+    The engine builds one snapshot per cycle and hands it to the hypervisor
+    and instance drivers, so that checking whether a host is up is a dict
+    lookup instead of a Service.get_by_compute_host round-trip.
+    """
+    def __init__(self, services, is_up_func, nodes=None):
+        """Build the snapshot.
+
+        :param services: the nova-compute services
+        :param is_up_func: callable telling whether a service is up
+        :param nodes: compute nodes used to map hypervisor names to hosts
+        """
+        self._services = dict((svc['host'], svc) for svc in services)
+        self._is_up_func = is_up_func
+        self._is_up = {}
+        self._hv_hosts = dict((node['hypervisor_hostname'], node['host'])
+                              for node in nodes or [])
+
+    @classmethod
+    def load(cls, context, compute_api, nodes=None):
+        services = compute_api.get_all_compute_services(context)
+        return cls(services, compute_api.service_is_up, nodes)
+
+    def get(self, host):
+        """Get the service of a host; None if the host has no service."""
+        return self._services.get(host)
+
+    def is_up(self, host):
+        """Determine if the compute service of a host is up."""
+        if host not in self._is_up:
+            service = self._services.get(host)
+            self._is_up[host] = (service is not None and
+                                 bool(self._is_up_func(service)))
+        return self._is_up[host]
+
+    def heartbeats(self):
+        """Yield the host and the time of the last heartbeat of each service.
+        """
+        for host, service in self._services.items():
+            beat = (service.get('last_seen_up') or service.get('updated_at') or
+                    service.get('created_at'))
+            if beat is not None:
+                yield host, beat
+
+    def has_hypervisor(self, hv_name):
+        return hv_name in self._hv_hosts
+
+    def get_host(self, hv_name):
+        """Get the service host of a hypervisor known to the snapshot."""
+        return self._hv_hosts.get(hv_name)
+
+    def hypervisor_is_up(self, hv_name):
+        """Determine if the compute service of a hypervisor is up."""
+        host = self._hv_hosts.get(hv_name)
+        if host is None:
+            return False
+        return self.is_up(host)
@@ -102,7 +102,7 @@ def check_hv_status_json_keys(json_stat):
                     'target_host']
 
     def check_keys(json_status, func_item, check_item):
-        hv_names = json_status[func_item].keys()
+        hv_names = list(json_status[func_item].keys())
         for hv_name in hv_names:
             diff_item = (set(check_item) -
                 set(json_status[func_item][hv_name].keys()))
@@ -0,0 +1,184 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Write-ahead journal of the changes of a HypervisorStatus."""
+
+import errno
+import os
+import tempfile
+
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+import six
+
+from hastack.has.stack import has_gettextutils
+from hastack.has.stack import hv_status
+
+_LW = has_gettextutils._LW
+
+LOG = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = '.journal'
+
+
+def write_file_atomically(path, text):
+    """Replace a file by text so that a crash leaves the old or new one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % os.path.basename(path),
+                                    dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class StatusJournal(object):
+    """Snapshot of a HypervisorStatus and the journal of its later changes.
+
+    Each change is appended to the journal as a JSON line holding its
+    sequence number, so writing the status costs O(changes) rather than
+    O(status). The changes are buffered until flush, which writes and
+    fsyncs all of them at once. compact writes the whole status, with the
+    sequence number of its last change, to a new snapshot which is renamed
+    over the previous one, and then truncates the journal; the changes a
+    snapshot already holds are skipped when the journal is replayed, should
+    the service stop in between.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self._seq = 0
+        self._buffer = []
+        self._file = None
+        # number of changes in the journal file
+        self.records = 0
+
+    def _read_snapshot(self):
+        """Read the snapshot.
+
+        :returns: (document, whether it is valid)
+        """
+        empty = {'version': hv_status.VERSION, 'ha': {}}
+        try:
+            with open(self.path) as f:
+                doc = jsonutils.loads(f.read())
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return empty, True
+            LOG.warning(_LW("Cannot read the HA status snapshot %(path)s: "
+                            "%(reason)s")
+                        % {'path': self.path, 'reason': six.text_type(e)})
+            return empty, False
+        except ValueError as e:
+            LOG.warning(_LW("The HA status snapshot %(path)s is corrupted "
+                            "and is ignored: %(reason)s")
+                        % {'path': self.path, 'reason': six.text_type(e)})
+            return empty, False
+        if not isinstance(doc, dict) or doc.get('version') != \
+                hv_status.VERSION:
+            LOG.warning(_LW("The HA status snapshot %(path)s has an unknown "
+                            "version and is ignored.")
+                        % {'path': self.path})
+            return empty, False
+        doc.setdefault('ha', {})
+        return doc, True
+
+    def load(self):
+        """Load the snapshot and replay the journal over it.
+
+        :returns: (HypervisorStatus recording its changes in this journal,
+                   True if the snapshot and the journal were read entirely)
+        """
+        doc, intact = self._read_snapshot()
+        seq = doc.pop('seq', 0)
+        status = hv_status.HypervisorStatus(doc)
+        self.records = 0
+        if intact:
+            try:
+                with open(self.journal_path) as f:
+                    for line in f:
+                        try:
+                            record = jsonutils.loads(line)
+                            if record[0] > seq:
+                                status.apply(record[1:])
+                                seq = record[0]
+                        except (ValueError, IndexError, TypeError,
+                                KeyError):
+                            # the tail of an interrupted write
+                            LOG.warning(_LW("The HA status journal "
+                                            "%(path)s is truncated after "
+                                            "change %(seq)d.")
+                                        % {'path': self.journal_path,
+                                           'seq': seq})
+                            intact = False
+                            break
+                        self.records += 1
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        self._seq = seq
+        self._buffer = []
+        status.journal = self
+        return status, intact
+
+    def append(self, change):
+        """Buffer a change of the status."""
+        self._seq += 1
+        self._buffer.append(jsonutils.dumps([self._seq] + list(change)))
+
+    def flush(self):
+        """Write the buffered changes to the journal.
+
+        :returns: True if there was any
+        """
+        if not self._buffer:
+            return False
+        if self._file is None:
+            self._file = open(self.journal_path, 'a')
+        self._file.write('\n'.join(self._buffer) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.records += len(self._buffer)
+        self._buffer = []
+        return True
+
+    def compact(self, status):
+        """Write a snapshot of the status and truncate the journal."""
+        doc = dict(status.get_json(), seq=self._seq)
+        write_file_atomically(self.path, jsonutils.dumps(doc))
+        self._buffer = []
+        self.close()
+        with open(self.journal_path, 'w') as f:
+            os.fsync(f.fileno())
+        self.records = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
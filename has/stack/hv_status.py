@@ -13,80 +13,250 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import calendar
+import copy
+import datetime
+import time
+
 from oslo_utils import timeutils
+import six
 
 from hastack.has.stack.haservice import constants as ha_constants
 
 VERSION = '2.0'
 
+# one shared string per state
+_STATES = dict((state, state)
+               for state in [ha_constants.STATE_OK] + ha_constants.STATE_LIST_HA)
+
+_TIMESTAMPS = ('created_at', 'updated_at')
+
+# the fields keyed by instance or request id, whose changes are recorded
+# item by item
+_ITEM_FIELDS = ('moving_insts', 'inst_start', 'retries', 'actions')
+
+
+def _to_epoch(value):
+    if not isinstance(value, six.string_types):
+        return value
+    at = timeutils.parse_strtime(value)
+    return calendar.timegm(at.timetuple()) + at.microsecond / 1000000.0
+
+
+def _to_strtime(value):
+    if value is None:
+        return None
+    return timeutils.strtime(datetime.datetime.utcfromtimestamp(value))
+
+
+class HAHypervisorRecord(object):
+    """HA state of a hypervisor.
+
+    The timestamps are seconds since the epoch and the fields which are not
+    set are None; to_json and from_json convert it from and to an entry of
+    the version 2.0 'ha' document, whose timestamps are timeutils.strtime()
+    strings.
+    """
+    __slots__ = ('state', 'created_at', 'updated_at', 'moving_insts',
+                 'inst_start', 'failed_instances', 'retries', 'actions')
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+
+    def update(self, fields):
+        for field, value in fields.items():
+            if field == 'state':
+                value = _STATES.get(value, value)
+            elif field in _TIMESTAMPS:
+                value = _to_epoch(value)
+            setattr(self, field, value)
+
+    @classmethod
+    def from_json(cls, entry):
+        record = cls()
+        record.update(dict((field, value) for field, value in entry.items()
+                           if field in cls.__slots__))
+        return record
+
+    def to_json(self):
+        entry = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is None:
+                continue
+            if field in _TIMESTAMPS:
+                value = _to_strtime(value)
+            entry[field] = value
+        return entry
+
 
 class HypervisorStatus(object):
-    def __init__(self, json):
-        self.ha_hvs = json['ha']
+    def __init__(self, json, journal=None):
+        # {hv_name: HAHypervisorRecord}
+        self.ha_hvs = dict((hv_name, HAHypervisorRecord.from_json(entry))
+                           for hv_name, entry in json['ha'].items())
+        # records the changes of the status if set, see hv_journal
+        self.journal = journal
+
+    def _record(self, change):
+        if self.journal is not None:
+            self.journal.append(change)
+
+    def _update(self, hv_name, fields):
+        """Update the fields of a hypervisor and record the changed ones."""
+        record = self.ha_hvs[hv_name]
+        changed = dict((field, value) for field, value in fields.items()
+                       if getattr(record, field) != value)
+        if changed:
+            record.update(changed)
+            self._record(['update', hv_name, changed])
+
+    def _update_items(self, hv_name, field, items):
+        """Set a field keyed by instance and record the changed items."""
+        record = self.ha_hvs[hv_name]
+        current = getattr(record, field)
+        if current is None:
+            current = {}
+            setattr(record, field, current)
+        for key in [key for key in current if key not in items]:
+            del current[key]
+            self._record(['pop_item', hv_name, field, key])
+        for key, value in items.items():
+            if key not in current or current[key] != value:
+                # the caller may change its value in place later
+                current[key] = copy.deepcopy(value)
+                self._record(['set_item', hv_name, field, key,
+                              current[key]])
+
+    def _pop(self, hv_name):
+        self.ha_hvs.pop(hv_name)
+        self._record(['pop', hv_name])
+
+    def apply(self, change):
+        """Apply a change recorded by _record, e.g. from the journal."""
+        op, hv_name = change[0], change[1]
+        if op == 'pop':
+            self.ha_hvs.pop(hv_name, None)
+            return
+        record = self.ha_hvs.get(hv_name)
+        if record is None:
+            record = self.ha_hvs[hv_name] = HAHypervisorRecord()
+        if op == 'update':
+            record.update(change[2])
+        elif op in ('set_item', 'pop_item'):
+            field, key = change[2], change[3]
+            if field not in _ITEM_FIELDS:
+                raise ValueError('unknown field %r' % field)
+            items = getattr(record, field)
+            if items is None:
+                items = {}
+                setattr(record, field, items)
+            if op == 'set_item':
+                items[key] = change[4]
+            else:
+                items.pop(key, None)
+        elif op == 'inst_start':
+            # recorded by the previous versions
+            self.apply(['set_item', hv_name, 'inst_start'] + list(change[2:]))
+        else:
+            raise ValueError('unknown change %r' % op)
 
     def get_ha(self, hv_name):
         """Get ha status of a hypervisor"""
         if hv_name not in self.ha_hvs:
             return ha_constants.STATE_OK
-        return self.ha_hvs[hv_name]['state']
+        return self.ha_hvs[hv_name].state
 
     def get_ha_moving_insts(self, hv_name):
         if hv_name not in self.ha_hvs:
             return None
-        return self.ha_hvs[hv_name].get('moving_insts')
+        return self.ha_hvs[hv_name].moving_insts
 
     def get_ha_moving_inst_start(self, hv_name, inst_uuid):
         if hv_name not in self.ha_hvs:
             return None
-        return self.ha_hvs[hv_name].get('inst_start', {}).get(inst_uuid)
+        return (self.ha_hvs[hv_name].inst_start or {}).get(inst_uuid)
 
     def get_ha_failed_instances(self, hv_name):
         """Get the instances which ha failed to move away."""
         if hv_name not in self.ha_hvs:
             failed_instances = []
         else:
-            failed_instances = (self.ha_hvs[hv_name].get('failed_instances') or
-                                [])
+            failed_instances = self.ha_hvs[hv_name].failed_instances or []
         return failed_instances
 
     def set_ha_failed_instances(self, hv_name, inst_uuid_list):
         """Set the instances ha failed to move away for a hypervisor."""
         if hv_name in self.ha_hvs:
-            self.ha_hvs[hv_name]['failed_instances'] = inst_uuid_list
+            self._update(hv_name, {'failed_instances': inst_uuid_list})
 
     def set_ha(self, hv_name, status):
         """Set ha status to a hypervisor."""
         if status == ha_constants.STATE_OK:
-            self.ha_hvs.pop(hv_name)
+            self._pop(hv_name)
         else:
+            now = time.time()
             if hv_name in self.ha_hvs:
-                self.ha_hvs[hv_name].update(
-                                    {'state': status,
-                                     'updated_at': timeutils.strtime()})
+                self._update(hv_name, {'state': status, 'updated_at': now})
             else:
-                self.ha_hvs[hv_name] = {'state': status,
-                                        'created_at': timeutils.strtime(),
-                                        'updated_at': timeutils.strtime()}
+                self.ha_hvs[hv_name] = HAHypervisorRecord()
+                self._update(hv_name, {'state': status, 'created_at': now,
+                                       'updated_at': now})
 
     def set_ha_moving_insts(self, hv_name, inst_host):
         if hv_name in self.ha_hvs:
-            self.ha_hvs[hv_name].update({'moving_insts': inst_host})
+            self._update_items(hv_name, 'moving_insts', inst_host)
 
     def set_ha_moving_inst_start(self, hv_name, inst_uuid, start):
         if hv_name in self.ha_hvs:
-            if 'inst_start' in self.ha_hvs[hv_name]:
-                self.ha_hvs[hv_name]['inst_start'].update({inst_uuid: start})
-            else:
-                self.ha_hvs[hv_name].update({'inst_start':
-                                             {inst_uuid: start}})
+            record = self.ha_hvs[hv_name]
+            if record.inst_start is None:
+                record.inst_start = {}
+            inst_start = record.inst_start
+            if inst_uuid not in inst_start or inst_start[inst_uuid] != start:
+                inst_start[inst_uuid] = start
+                self._record(['set_item', hv_name, 'inst_start', inst_uuid,
+                              start])
+
+    def set_ha_moving_inst_starts(self, hv_name, inst_start):
+        """Replace the start times of all moving instances of a hypervisor."""
+        if hv_name in self.ha_hvs:
+            self._update_items(hv_name, 'inst_start', inst_start)
+
+    def get_ha_retries(self, hv_name):
+        """Get the failed move attempts per instance of a hypervisor."""
+        if hv_name not in self.ha_hvs:
+            return {}
+        return self.ha_hvs[hv_name].retries or {}
+
+    def set_ha_retries(self, hv_name, retries):
+        if hv_name in self.ha_hvs:
+            self._update_items(hv_name, 'retries', retries)
+
+    def get_ha_actions(self, hv_name):
+        """Get the HA actions in flight of a hypervisor by request id."""
+        if hv_name not in self.ha_hvs:
+            return {}
+        return self.ha_hvs[hv_name].actions or {}
+
+    def set_ha_actions(self, hv_name, actions):
+        if hv_name in self.ha_hvs:
+            self._update_items(hv_name, 'actions', actions)
+
+    def get_json(self):
+        return {'version': VERSION,
+                'ha': dict((hv_name, record.to_json())
+                           for hv_name, record in self.ha_hvs.items())}
 
     def get_ha_timestamp(self, hv_name):
         """Get ha timestamp (created_at, updated_at) of the hypervisor."""
         if hv_name not in self.ha_hvs:
             ha_ts = {'created_at': '-', 'updated_at': '-'}
         else:
-            ha_ts = {'created_at': self.ha_hvs[hv_name]['created_at'],
-                     'updated_at': self.ha_hvs[hv_name]['updated_at']}
+            record = self.ha_hvs[hv_name]
+            ha_ts = {'created_at': _to_strtime(record.created_at),
+                     'updated_at': _to_strtime(record.updated_at)}
         return ha_ts
 
     def refresh(self, ha_manage_hosts):
@@ -97,4 +267,4 @@ class HypervisorStatus(object):
         """
         ha_hvs = set(self.ha_hvs.keys())
         for key in ha_hvs - ha_manage_hosts:
-            self.ha_hvs.pop(key)
+            self._pop(key)
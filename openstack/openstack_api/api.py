@@ -74,6 +74,10 @@ class ComputeAPI(object):
         return objects.Instance.get_by_uuid(context, uuid,
                                             expected_attrs=expected_attrs)
 
+    def get_instances_by_uuids(self, context, uuids, expected_attrs=None):
+        return objects.InstanceList.get_by_filters(
+            context, {'uuid': list(uuids)}, expected_attrs=expected_attrs)
+
     def get_instance_by_host(self, context, host, expected_attrs=None,
                              use_slave=False):
         return objects.InstanceList.get_by_host(context, host, expected_attrs,
@@ -94,6 +98,10 @@ class ComputeAPI(object):
         return objects.Service.get_by_compute_host(context, host,
                                                    use_slave=use_slave)
 
+    def get_all_compute_services(self, context, include_disabled=True):
+        return objects.ServiceList.get_by_binary(
+            context, 'nova-compute', include_disabled=include_disabled)
+
     def get_flavor_by_id(self, context, id):
         return objects.Flavor.get_by_id(context, id)
 
@@ -14,6 +14,9 @@
 #    under the License.
 
 from nova.db import api as db_api
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
+import sqlalchemy as sa
 
 
 def get_service_by_host_and_binary(context, host, binary):
@@ -22,3 +25,114 @@ def get_service_by_host_and_binary(context, host, binary):
 
 def db_update_service(context, service_id, values):
     db_api.service_update(context, service_id, values)
+
+
+# columns of compute_nodes read by the HA engine; cpu_info and the other
+# large columns are left out on purpose
+COMPUTE_NODE_HA_COLUMNS = ('id', 'host', 'hypervisor_hostname',
+                           'hypervisor_type', 'host_ip', 'stats', 'metrics',
+                           'created_at', 'updated_at', 'deleted_at',
+                           'deleted')
+
+
+@sqlalchemy_api.pick_context_manager_reader
+def compute_node_get_all_changed_since(context, since=None,
+                                       columns=COMPUTE_NODE_HA_COLUMNS):
+    """Get the non-ironic compute nodes as dicts of the given columns.
+
+    Without since, only the live compute nodes are returned; otherwise the
+    nodes created, updated or deleted at or after since are returned,
+    deleted ones included so that callers can evict them.
+    """
+    model = models.ComputeNode
+    query = sqlalchemy_api.model_query(
+        context, model, args=[getattr(model, col) for col in columns],
+        read_deleted='no' if since is None else 'yes')
+    query = query.filter(sa.or_(model.hypervisor_type.is_(None),
+                                model.hypervisor_type != 'ironic'))
+    if since is not None:
+        query = query.filter(sa.or_(model.created_at >= since,
+                                    model.updated_at >= since,
+                                    model.deleted_at >= since))
+    return [dict(zip(columns, row)) for row in query.all()]
+
+
+@sqlalchemy_api.pick_context_manager_reader
+def migration_get_finished_since(context, since=None):
+    """Get the finished migrations updated at or after since.
+
+    The migrations are returned as dicts ordered by updated_at so that the
+    caller can keep the newest timestamp as its watermark.
+    """
+    model = models.Migration
+    columns = ('id', 'instance_uuid', 'old_instance_type_id',
+               'new_instance_type_id', 'updated_at')
+    query = sqlalchemy_api.model_query(
+        context, model, args=[getattr(model, col) for col in columns])
+    query = query.filter_by(status='finished')
+    if since is not None:
+        query = query.filter(model.updated_at >= since)
+    query = query.order_by(model.updated_at.asc(), model.id.asc())
+    return [dict(zip(columns, row)) for row in query.all()]
+
+
+@sqlalchemy_api.pick_context_manager_reader
+def instance_action_get_latest_request_ids(context, instance_uuids):
+    """Get the request_id of the latest action of each instance.
+
+    :returns: {instance_uuid: request_id}; instances without any action
+              are left out
+    """
+    if not instance_uuids:
+        return {}
+    model = models.InstanceAction
+    # only the latest action of each instance is loaded
+    latest = sqlalchemy_api.model_query(
+        context, model, args=[sa.func.max(model.id).label('id')])
+    latest = latest.filter(model.instance_uuid.in_(list(instance_uuids)))
+    latest = latest.group_by(model.instance_uuid).subquery()
+    query = sqlalchemy_api.model_query(
+        context, model, args=[model.instance_uuid, model.request_id])
+    query = query.join(latest, model.id == latest.c.id)
+    return dict(query.all())
+
+
+@sqlalchemy_api.pick_context_manager_reader
+def instance_get_hosts_by_task_states(context, task_states):
+    """Get the host of the instances in one of the task states.
+
+    :returns: {instance_uuid: host}
+    """
+    model = models.Instance
+    query = sqlalchemy_api.model_query(
+        context, model, args=[model.uuid, model.host])
+    query = query.filter(model.task_state.in_(list(task_states)))
+    return dict(query.all())
+
+
+# columns of instances kept in the instance index of the HA engine
+INSTANCE_HA_COLUMNS = ('id', 'uuid', 'display_name', 'host', 'node',
+                       'vm_state', 'task_state', 'launched_at')
+
+
+@sqlalchemy_api.pick_context_manager_reader
+def instance_get_ha_enabled_page(context, marker=None, limit=1000,
+                                 columns=INSTANCE_HA_COLUMNS):
+    """Get a page of the live instances whose ha metadata is True.
+
+    The instances are ordered by id and start after the id marker.
+
+    :returns: list of dicts of the given columns
+    """
+    model = models.Instance
+    meta = models.InstanceMetadata
+    query = sqlalchemy_api.model_query(
+        context, model, args=[getattr(model, col) for col in columns])
+    query = query.join(meta, sa.and_(meta.instance_uuid == model.uuid,
+                                     meta.deleted == 0,
+                                     meta.key == 'ha',
+                                     meta.value == str(True)))
+    if marker is not None:
+        query = query.filter(model.id > marker)
+    query = query.order_by(model.id.asc()).limit(limit)
+    return [dict(zip(columns, row)) for row in query.all()]
@@ -33,6 +33,9 @@ REBUILD_SPAWNING = task_states.REBUILD_SPAWNING
 REBUILD_BLOCK_DEVICE_MAPPING = task_states.REBUILD_BLOCK_DEVICE_MAPPING
 RESIZE_PREP = task_states.RESIZE_PREP
 
+REBUILD_TASK_STATES = [REBUILDING, REBUILD_SPAWNING,
+                       REBUILD_BLOCK_DEVICE_MAPPING]
+
 
 RESIZE = instance_actions.RESIZE
 
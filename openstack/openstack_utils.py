@@ -16,6 +16,7 @@ import sys
 
 import hastack.has.conf as ha_conf
 import hastack.has.conf.client
+from hastack.has.stack import has_gettextutils
 
 from keystoneauth1 import loading as ks_loading
 
@@ -30,9 +31,14 @@ from nova import version
 
 from oslo_log import log as logging
 from oslo_reports import guru_meditation_report as gmr
+import six
+
+_LW = has_gettextutils._LW
 
 CONF = ha_conf.CONF
 
+LOG = logging.getLogger(__name__)
+
 
 def execute(*cmd, **kwargs):
     nova_utils.execute(*cmd, **kwargs)
@@ -117,6 +123,67 @@ def create_context():
     return context
 
 
+class ContextProvider(object):
+    """Admin contexts built from a cached keystone token.
+
+    The auth plugin and the keystone session are created once and shared;
+    the token and the converted service catalog are reused until the token
+    expires within CONF.ha_token_refresh_margin seconds, so only then does
+    getting a context wait on keystone. If keystone cannot be reached the
+    context returned by the fallback callable is used instead.
+    """
+    def __init__(self, fallback):
+        self._fallback = fallback
+        self._auth_plugin = None
+        self._session = None
+        self._access_info = None
+        self._catalog = None
+
+    def _refresh(self):
+        group_name = hastack.has.conf.client.CLIENT_GROUP_NAME
+        if self._session is None:
+            self._auth_plugin = create_auth_plugin(CONF, group_name)
+            self._session = create_client_session(CONF, group_name,
+                                                  auth=self._auth_plugin)
+        if (self._access_info is None or
+                self._access_info.will_expire_soon(
+                    CONF.ha_token_refresh_margin)):
+            # drop the token of the plugin too, or it would hand it back
+            self._auth_plugin.invalidate()
+            access_info = self._auth_plugin.get_access(self._session)
+            self._catalog = v3_to_v2_catalog(
+                getattr(access_info.service_catalog, 'catalog', []))
+            self._access_info = access_info
+
+    def invalidate(self):
+        """Forget the cached token, e.g. after it has been revoked."""
+        self._access_info = None
+        self._catalog = None
+
+    def get_context(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            self.invalidate()
+            LOG.warning(_LW("Failed to get a keystone token; falling back "
+                            "to the standard admin context; exception "
+                            "message is: %(message)s")
+                        % {'message': six.text_type(e)})
+            return self._fallback()
+
+        group = CONF[hastack.has.conf.client.CLIENT_GROUP_NAME]
+        return nova_context.RequestContext(
+            user_name=group.username,
+            project_name=group.project_name,
+            user_domain_name=group.user_domain_name,
+            project_domain_name=group.project_domain_name,
+            is_admin=True,
+            read_deleted='no',
+            user_auth_plugin=self._auth_plugin,
+            auth_token=self._access_info.auth_token,
+            service_catalog=list(self._catalog))
+
+
 def v3_to_v2_catalog(catalog):
     """Convert a catalog to v2 format.
 
@@ -0,0 +1,84 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for bmc_breaker.
+"""
+import mock
+
+from hastack.has.stack.haservice import bmc_breaker
+from hastack.has.stack.haservice import constants as ha_constants
+from nova import test
+
+
+@mock.patch.object(bmc_breaker.time, 'time')
+class PowerProbeGuardTestCase(test.TestCase):
+    def setUp(self):
+        super(PowerProbeGuardTestCase, self).setUp()
+        self.flags(ha_power_cache_ttl=10, ha_bmc_breaker_threshold=2,
+                   ha_bmc_breaker_backoff=30, ha_bmc_breaker_max_backoff=100)
+        self.guard = bmc_breaker.PowerProbeGuard()
+
+    def test_cached_status_expires(self, mock_time):
+        mock_time.return_value = 1000
+        self.guard.record_success('10.0.0.1', 'on')
+        mock_time.return_value = 1009
+        self.assertEqual('on', self.guard.get_cached('10.0.0.1'))
+        mock_time.return_value = 1010
+        self.assertIsNone(self.guard.get_cached('10.0.0.1'))
+
+    def test_failure_drops_cached_status(self, mock_time):
+        mock_time.return_value = 1000
+        self.guard.record_success('10.0.0.1', 'on')
+        self.guard.record_failure('10.0.0.1')
+        self.assertIsNone(self.guard.get_cached('10.0.0.1'))
+
+    def test_breaker_opens_after_threshold(self, mock_time):
+        mock_time.return_value = 1000
+        self.assertFalse(self.guard.record_failure('10.0.0.1'))
+        self.assertTrue(self.guard.allow('10.0.0.1'))
+        self.assertTrue(self.guard.record_failure('10.0.0.1'))
+        self.assertFalse(self.guard.allow('10.0.0.1'))
+        self.assertEqual(30, self.guard.retry_in('10.0.0.1'))
+        self.assertEqual({'10.0.0.1': {'state': ha_constants.BREAKER_OPEN,
+                                       'failures': 2, 'retry_at': 1030}},
+                         self.guard.get_states())
+
+    def test_half_open_trial(self, mock_time):
+        mock_time.return_value = 1000
+        self.guard.record_failure('10.0.0.1')
+        self.guard.record_failure('10.0.0.1')
+        mock_time.return_value = 1030
+        self.assertTrue(self.guard.allow('10.0.0.1'))
+        # only a single trial probe is let through
+        self.assertFalse(self.guard.allow('10.0.0.1'))
+        self.assertEqual(ha_constants.BREAKER_HALF_OPEN,
+                         self.guard.get_states()['10.0.0.1']['state'])
+        # a failed trial re-opens the breaker with a doubled backoff
+        self.assertTrue(self.guard.record_failure('10.0.0.1'))
+        self.assertEqual(60, self.guard.retry_in('10.0.0.1'))
+        mock_time.return_value = 1090
+        self.assertTrue(self.guard.allow('10.0.0.1'))
+        self.guard.record_failure('10.0.0.1')
+        self.assertEqual(100, self.guard.retry_in('10.0.0.1'))
+
+    def test_success_closes_breaker(self, mock_time):
+        mock_time.return_value = 1000
+        self.guard.record_failure('10.0.0.1')
+        self.guard.record_failure('10.0.0.1')
+        mock_time.return_value = 1030
+        self.assertTrue(self.guard.allow('10.0.0.1'))
+        self.guard.record_success('10.0.0.1', 'on')
+        self.assertTrue(self.guard.allow('10.0.0.1'))
+        self.assertEqual({}, self.guard.get_states())
@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Test suite for checkpoint.
+"""
+import os
+
+import fixtures
+import mock
+
+from hastack.has.stack.haservice import checkpoint
+from hastack.has.stack.haservice import constants
+from nova import test
+
+
+class StatusCheckpointTestCase(test.TestCase):
+    def setUp(self):
+        super(StatusCheckpointTestCase, self).setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'status.json')
+        self.flags(ha_checkpoint_interval=5,
+                   ha_checkpoint_compact_records=100)
+        self.checkpoint = checkpoint.StatusCheckpoint(self.path)
+        self.status = self.checkpoint.load()
+        self.status.set_ha('compute1', constants.STATE_HA_REBUILDING)
+        self.status.set_ha_moving_insts('compute1', {'uuid1': 'compute2'})
+        self.status.set_ha_moving_inst_starts('compute1', {'uuid1': 100.5})
+        self.status.set_ha_retries('compute1', {'uuid2': 1})
+
+    def _load(self):
+        return checkpoint.StatusCheckpoint(self.path).load()
+
+    def test_save_and_load(self):
+        self.assertTrue(self.checkpoint.save(self.status))
+        status = self._load()
+        self.assertEqual(constants.STATE_HA_REBUILDING,
+                         status.get_ha('compute1'))
+        self.assertEqual({'uuid1': 'compute2'},
+                         status.get_ha_moving_insts('compute1'))
+        self.assertEqual(100.5, status.get_ha_moving_inst_start('compute1',
+                                                                'uuid1'))
+        self.assertEqual({'uuid2': 1}, status.get_ha_retries('compute1'))
+
+    @mock.patch.object(checkpoint.time, 'time')
+    def test_save_batched(self, mock_time):
+        mock_time.return_value = 100
+        self.assertTrue(self.checkpoint.save(self.status))
+        # unchanged
+        self.assertFalse(self.checkpoint.save(self.status, force=True))
+        self.status.set_ha_retries('compute1', {'uuid2': 2})
+        mock_time.return_value = 103
+        self.assertFalse(self.checkpoint.save(self.status))
+        self.assertEqual({'uuid2': 1},
+                         self._load().get_ha_retries('compute1'))
+        mock_time.return_value = 105
+        self.assertTrue(self.checkpoint.save(self.status))
+        self.assertEqual({'uuid2': 2},
+                         self._load().get_ha_retries('compute1'))
+
+    def test_save_compacts(self):
+        self.flags(ha_checkpoint_compact_records=4)
+        self.assertTrue(self.checkpoint.save(self.status))
+        self.assertFalse(os.path.exists(self.path))
+        self.status.set_ha('compute2', constants.STATE_HA_STARTED)
+        self.assertTrue(self.checkpoint.save(self.status, force=True))
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(0, os.path.getsize(self.checkpoint.journal
+                                            .journal_path))
+        self.assertEqual(constants.STATE_HA_STARTED,
+                         self._load().get_ha('compute2'))
+
+    def test_load_missing(self):
+        self.assertEqual({}, self._load().ha_hvs)
+
+    def test_load_corrupted(self):
+        with open(self.path, 'w') as f:
+            f.write('{"version": "2.0", "ha": ')
+        self.assertEqual({}, self._load().ha_hvs)
+        with open(self.path, 'w') as f:
+            f.write('{"version": "1.0", "ha": {}}')
+        self.assertEqual({}, self._load().ha_hvs)
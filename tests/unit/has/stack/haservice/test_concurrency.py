@@ -0,0 +1,93 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for concurrency.
+"""
+import mock
+import oslo_messaging as messaging
+
+from hastack.has.stack.haservice import concurrency
+import hastack.openstack.openstack_constants as openstack_constants
+from nova import test
+
+
+class AIMDLimiterTestCase(test.TestCase):
+    def setUp(self):
+        super(AIMDLimiterTestCase, self).setUp()
+        self.flags(ha_aimd_initial_window=2, ha_aimd_decrease_factor=0.5,
+                   ha_aimd_latency_threshold=10)
+        self.limiter = concurrency.AIMDLimiter()
+
+    def test_initial_window_bounded_by_limit(self):
+        self.assertEqual(1, self.limiter.window('compute1', 1))
+        self.assertEqual(2, self.limiter.window('compute2', 5))
+
+    def test_additive_increase(self):
+        self.limiter.window('compute1', 3)
+        # one more after a window's worth of successful calls
+        self.limiter.record('compute1', 1)
+        self.limiter.record('compute1', 1)
+        self.assertEqual(2, self.limiter.window('compute1', 3))
+        self.limiter.record('compute1', 1)
+        self.assertEqual(3, self.limiter.window('compute1', 3))
+        for _i in range(10):
+            self.limiter.record('compute1', 1)
+        self.assertEqual({'compute1': 3}, self.limiter.windows())
+
+    @mock.patch.object(concurrency.time, 'time')
+    def test_multiplicative_decrease(self, mock_time):
+        self.flags(ha_aimd_initial_window=5)
+        self.limiter.window('compute1', 5)
+        mock_time.return_value = 100
+        self.limiter.record('compute1', 1,
+                            openstack_constants.NoValidHost(reason=''))
+        self.assertEqual(2, self.limiter.window('compute1', 5))
+        mock_time.return_value = 110
+        self.limiter.record('compute1', 1, messaging.MessagingTimeout())
+        self.assertEqual(1, self.limiter.window('compute1', 5))
+        mock_time.return_value = 120
+        self.limiter.record('compute1', 1, messaging.MessagingTimeout())
+        self.assertEqual(1, self.limiter.window('compute1', 5))
+
+    @mock.patch.object(concurrency.time, 'time')
+    def test_one_decrease_per_window(self, mock_time):
+        self.flags(ha_aimd_initial_window=8)
+        self.limiter.window('compute1', 8)
+        mock_time.return_value = 100
+        self.limiter.record('compute1', 5, messaging.MessagingTimeout())
+        self.assertEqual(4, self.limiter.window('compute1', 8))
+        # the calls in flight at the cut do not cut the window again
+        mock_time.return_value = 102
+        self.limiter.record('compute1', 5, messaging.MessagingTimeout())
+        self.limiter.record('compute1', 12)
+        self.assertEqual(4, self.limiter.window('compute1', 8))
+        mock_time.return_value = 103
+        self.limiter.record('compute1', 1, messaging.MessagingTimeout())
+        self.assertEqual(2, self.limiter.window('compute1', 8))
+
+    def test_slow_call_decreases(self):
+        self.flags(ha_aimd_initial_window=4)
+        self.limiter.window('compute1', 5)
+        self.limiter.record('compute1', 11)
+        self.assertEqual(2, self.limiter.window('compute1', 5))
+
+    def test_other_errors_ignored(self):
+        self.limiter.window('compute1', 5)
+        self.limiter.record('compute1', 1, Exception('conflict'))
+        self.assertEqual(2, self.limiter.window('compute1', 5))
+
+    def test_unknown_host_ignored(self):
+        self.limiter.record('compute1', 1)
+        self.assertEqual({}, self.limiter.windows())
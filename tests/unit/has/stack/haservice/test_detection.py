@@ -0,0 +1,208 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Test suite for detection and the detection drivers.
+"""
+import os
+import socket
+
+import eventlet
+import fixtures
+import mock
+
+from hastack.has.stack.haservice import constants
+from hastack.has.stack.haservice import detection
+from hastack.has.stack.haservice.detection_driver import driver
+from nova import test
+
+
+NODES = [{'hypervisor_hostname': 'compute1', 'host': 'compute1',
+          'host_ip': '127.0.0.1'},
+         {'hypervisor_hostname': 'compute2', 'host': 'compute2',
+          'host_ip': '127.0.0.1'}]
+
+
+class FakeDriver(object):
+    timeout = 1
+    concurrency = 2
+
+    def __init__(self, results):
+        self.results = results
+        self.checked = []
+
+    def check_host(self, context, node, services=None):
+        self.checked.append(node['hypervisor_hostname'])
+        result = self.results[node['hypervisor_hostname']]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class DetectionPipelineTestCase(test.TestCase):
+    def test_stages_only_check_passed_hosts(self):
+        network = FakeDriver({'compute1': constants.VERDICT_EVACUATE,
+                              'compute2': constants.DETECTION_PASS})
+        process = FakeDriver({'compute2': constants.VERDICT_ALARM})
+        pipeline = detection.DetectionPipeline([network, process])
+        self.assertEqual({'compute1': constants.VERDICT_EVACUATE,
+                          'compute2': constants.VERDICT_ALARM},
+                         pipeline.run(None, NODES))
+        self.assertEqual(['compute1', 'compute2'], sorted(network.checked))
+        self.assertEqual(['compute2'], process.checked)
+
+    def test_hosts_passing_all_stages(self):
+        network = FakeDriver({'compute1': constants.DETECTION_PASS,
+                              'compute2': constants.DETECTION_PASS})
+        pipeline = detection.DetectionPipeline([network])
+        self.assertEqual({'compute1': constants.VERDICT_NOOP,
+                          'compute2': constants.VERDICT_NOOP},
+                         pipeline.run(None, NODES))
+
+    def test_inconclusive_checks_pass(self):
+        def _hang(context, node, services=None):
+            eventlet.sleep(10)
+
+        network = FakeDriver({'compute1': Exception('boom'),
+                              'compute2': constants.DETECTION_PASS})
+        process = FakeDriver({})
+        process.timeout = 0.01
+        process.check_host = _hang
+        pipeline = detection.DetectionPipeline([network, process])
+        self.assertEqual({'compute1': constants.VERDICT_NOOP,
+                          'compute2': constants.VERDICT_NOOP},
+                         pipeline.run(None, NODES))
+
+    def test_drivers_from_conf(self):
+        # the drivers need the heartbeat files or fence hosts, so they are
+        # opt-in
+        self.assertEqual([], detection.DetectionPipeline().drivers)
+        self.flags(ha_detection_drivers=[
+            'hastack.has.stack.haservice.detection_driver.driver.'
+            'ComputeProcessDetectionDriver'])
+        pipeline = detection.DetectionPipeline()
+        self.assertEqual([driver.ComputeProcessDetectionDriver],
+                         [d.__class__ for d in pipeline.drivers])
+
+
+class NetworkDetectionDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(NetworkDetectionDriverTestCase, self).setUp()
+        # a local stand-in for the host
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.addCleanup(self.listener.close)
+        self.port = self.listener.getsockname()[1]
+        self.driver = driver.NetworkDetectionDriver()
+        self.services = mock.Mock()
+
+    def test_reachable(self):
+        self.flags(ha_network_probe_ports=[str(self.port)])
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, NODES[0],
+                                                services=self.services))
+
+    def test_refused_is_reachable(self):
+        self.listener.close()
+        self.flags(ha_network_probe_ports=[str(self.port)])
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, NODES[0],
+                                                services=self.services))
+
+    @mock.patch.object(driver.socket, 'create_connection')
+    def test_unreachable(self, mock_connect):
+        mock_connect.side_effect = socket.timeout()
+        self.flags(ha_network_probe_ports=['22', '16509'],
+                   ha_network_probe_timeout=2)
+        self.services.is_up.return_value = False
+        self.assertEqual(constants.VERDICT_EVACUATE,
+                         self.driver.check_host(None, NODES[0],
+                                                services=self.services))
+        mock_connect.assert_has_calls([mock.call(('127.0.0.1', 22), 2),
+                                       mock.call(('127.0.0.1', 16509), 2)])
+        self.assertEqual(6, self.driver.timeout)
+
+    @mock.patch.object(driver.socket, 'create_connection')
+    def test_unreachable_service_up(self, mock_connect):
+        mock_connect.side_effect = socket.timeout()
+        self.services.is_up.return_value = True
+        self.assertEqual(constants.VERDICT_ALARM,
+                         self.driver.check_host(None, NODES[0],
+                                                services=self.services))
+        self.services.is_up.assert_called_once_with('compute1')
+
+    @mock.patch.object(driver.socket, 'create_connection')
+    def test_unreachable_in_pipeline(self, mock_connect):
+        def _unanswered(address, timeout):
+            eventlet.sleep(timeout)
+            raise socket.timeout()
+
+        mock_connect.side_effect = _unanswered
+        self.flags(ha_network_probe_ports=['22'],
+                   ha_network_probe_timeout=1)
+        self.services.is_up.side_effect = lambda host: host == 'compute2'
+        pipeline = detection.DetectionPipeline([self.driver])
+        # the stage outlasts the connection attempts
+        self.assertEqual({'compute1': constants.VERDICT_EVACUATE,
+                          'compute2': constants.VERDICT_ALARM},
+                         pipeline.run(None, NODES, services=self.services))
+
+    def test_no_host_ip(self):
+        node = {'hypervisor_hostname': 'compute1', 'host': 'compute1',
+                'host_ip': None}
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, node))
+
+
+@mock.patch.object(driver.time, 'time')
+class ComputeProcessDetectionDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(ComputeProcessDetectionDriverTestCase, self).setUp()
+        self.path = self.useFixture(fixtures.TempDir()).path
+        self.flags(heartbeat_file_path=self.path,
+                   ha_compute_heartbeat_file='%(host)s.heartbeat')
+        self.driver = driver.ComputeProcessDetectionDriver()
+
+    def _touch(self, host, mtime):
+        path = os.path.join(self.path, '%s.heartbeat' % host)
+        open(path, 'w').close()
+        os.utime(path, (mtime, mtime))
+
+    def test_heartbeat(self, mock_time):
+        mock_time.return_value = 1000
+        self._touch('compute1', 100)
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, NODES[0]))
+
+    def test_heartbeat_missing(self, mock_time):
+        mock_time.return_value = 1000
+        self.assertEqual(constants.VERDICT_ALARM,
+                         self.driver.check_host(None, NODES[0]))
+
+    def test_heartbeat_stale(self, mock_time):
+        self.flags(ha_compute_heartbeat_max_age=15)
+        mock_time.return_value = 1000
+        self._touch('compute1', 990)
+        self._touch('compute2', 900)
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, NODES[0]))
+        self.assertEqual(constants.VERDICT_ALARM,
+                         self.driver.check_host(None, NODES[1]))
+
+    def test_heartbeat_not_deployed(self, mock_time):
+        self.flags(heartbeat_file_path=os.path.join(self.path, 'missing'))
+        self.assertEqual(constants.DETECTION_PASS,
+                         self.driver.check_host(None, NODES[0]))
@@ -0,0 +1,107 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for dispatcher.
+"""
+import eventlet
+from eventlet import event
+
+from hastack.has.stack.haservice import dispatcher
+from nova import test
+
+
+class EvacuationDispatcherTestCase(test.TestCase):
+    def setUp(self):
+        super(EvacuationDispatcherTestCase, self).setUp()
+        self.flags(ha_evacuate_concurrency=2)
+        self.dispatcher = dispatcher.EvacuationDispatcher()
+        self.results = []
+
+    def test_dispatch_no_jobs(self):
+        self.dispatcher.dispatch([], None, self.results.append)
+        self.assertEqual([[]], self.results)
+
+    def test_dispatch_concurrent(self):
+        running = []
+        peak = []
+
+        def fake_evacuate(uuid, host):
+            running.append(uuid)
+            peak.append(len(running))
+            eventlet.sleep(0.01)
+            running.remove(uuid)
+            return uuid != 'uuid2'
+
+        jobs = [('uuid%d' % i, 'compute2') for i in range(5)]
+        self.dispatcher.dispatch(jobs, fake_evacuate, self.results.append)
+        self.dispatcher.wait()
+        self.assertEqual([[True, True, False, True, True]], self.results)
+        self.assertEqual(2, max(peak))
+        self.assertEqual(0, self.dispatcher.running())
+
+    def test_dispatch_shared_pool(self):
+        def fake_evacuate(uuid, host):
+            eventlet.sleep(0.01)
+            return True
+
+        self.dispatcher.dispatch([('uuid1', 'compute2')], fake_evacuate,
+                                 self.results.append)
+        self.dispatcher.dispatch([('uuid2', 'compute3')], fake_evacuate,
+                                 self.results.append)
+        self.assertEqual(0, len(self.results))
+        self.dispatcher.wait()
+        self.assertEqual([[True], [True]], self.results)
+
+    def test_dispatch_fair_rate_limited(self):
+        self.flags(ha_evacuate_rate=1000, ha_evacuate_burst=1)
+        self.dispatcher = dispatcher.EvacuationDispatcher()
+        started = []
+
+        def fake_evacuate(uuid, host):
+            started.append(uuid)
+            return True
+
+        self.dispatcher.dispatch([('a1', 'c'), ('a2', 'c'), ('a3', 'c')],
+                                 fake_evacuate, self.results.append,
+                                 key='compute1')
+        self.dispatcher.dispatch([('b1', 'c')], fake_evacuate,
+                                 self.results.append, key='compute2')
+        self.assertEqual(4, self.dispatcher.queue_depth())
+        self.assertEqual({'compute1': 3, 'compute2': 1},
+                         self.dispatcher.queue_depths())
+        self.dispatcher.wait()
+        self.assertEqual(['a1', 'b1', 'a2', 'a3'], started)
+        self.assertEqual(0, self.dispatcher.queue_depth())
+
+    def test_queue_depth_while_pool_full(self):
+        self.flags(ha_evacuate_concurrency=1)
+        self.dispatcher = dispatcher.EvacuationDispatcher()
+        release = event.Event()
+
+        def fake_evacuate(uuid, host):
+            release.wait()
+            return True
+
+        jobs = [('uuid%d' % i, 'compute2') for i in range(3)]
+        self.dispatcher.dispatch(jobs, fake_evacuate, self.results.append,
+                                 key='compute1')
+        eventlet.sleep(0)
+        # the calls not started yet are all counted as queued
+        self.assertEqual(1, self.dispatcher.running())
+        self.assertEqual(2, self.dispatcher.queue_depth())
+        self.assertEqual({'compute1': 2}, self.dispatcher.queue_depths())
+        release.send()
+        self.dispatcher.wait()
+        self.assertEqual([[True, True, True]], self.results)
@@ -22,6 +22,9 @@ import requests
 from hastack.has.stack.haservice.fencing_driver import driver as fencing_driver
 from hastack.has.stack.haservice.hypervisor_driver import driver as hv_driver
 from hastack.has.stack.haservice.instance_driver import driver as inst_driver
+from hastack.has.stack.haservice import instance_index
+from hastack.has.stack.haservice import ipmi_utils
+from hastack.has.stack.haservice import service_snapshot
 from hastack.has.stack.haservice import utils
 from nova import objects
 from nova import servicegroup
@@ -143,6 +146,26 @@ class HADriverTestCase(test.TestCase):
         instances = instance_driver.select_instances(ctx, "compute1")
         self.assertEqual(2, len(instances))
 
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_select_instances_from_index(self, mock_method):
+        services = service_snapshot.ServiceSnapshot(
+            [{'host': 'compute1', 'is_up': True}],
+            lambda service: service['is_up'], COMPUTE_NODES[:1])
+        index = instance_index.InstanceIndex()
+        for uuid, vm_state, launched_at in (('uuid1', 'active', 'now'),
+                                            ('uuid2', 'error', 'now'),
+                                            ('uuid3', 'active', None)):
+            index.update('compute.instance.update',
+                         {'instance_id': uuid, 'host': 'compute1',
+                          'state': vm_state, 'launched_at': launched_at,
+                          'metadata': {'ha': 'True'}})
+        instance_driver = inst_driver.HAInstanceDriver()
+        instances = instance_driver.select_instances(
+            Fake_Context(), 'compute1', services=services, index=index)
+        self.assertEqual(['uuid1'], [inst['uuid'] for inst, _action
+                                     in instances])
+        self.assertFalse(mock_method.called)
+
     @mock.patch.object(requests, 'request')
     def test_get_host_status(self, mock_request):
         mock_request.return_value.text = HOST_STATE
@@ -161,7 +184,33 @@ class HADriverTestCase(test.TestCase):
         self.assertEqual(True, hvs_driver.hypervisor_is_up(ctx, 'compute1'))
         self.assertEqual(False, hvs_driver.hypervisor_is_up(ctx, 'compute2'))
 
+    def test_hypervisors_are_up(self):
+        services = service_snapshot.ServiceSnapshot(
+            [{'host': 'compute1', 'is_up': True},
+             {'host': 'compute2', 'is_up': False}],
+            lambda service: service['is_up'], COMPUTE_NODES[:2])
+        hvs_driver = hv_driver.HAHypervisorDriver()
+        ctx = Fake_Context()
+        result = hvs_driver.hypervisors_are_up(
+            ctx, ['compute1', 'compute2', 'compute3'], services=services)
+        self.assertEqual({'compute1': True, 'compute2': False,
+                          'compute3': False}, result)
+
+    def test_hypervisor_is_up_with_snapshot(self):
+        services = service_snapshot.ServiceSnapshot(
+            [{'host': 'compute1', 'is_up': False}],
+            lambda service: service['is_up'], COMPUTE_NODES[:1])
+        hvs_driver = hv_driver.HAHypervisorDriver()
+        with mock.patch.object(Fake_ComputeNodeList,
+                               'get_by_hypervisor') as mock_get:
+            objects.ComputeNodeList = Fake_ComputeNodeList
+            self.assertFalse(hvs_driver.hypervisor_is_up(
+                Fake_Context(), 'compute1', services=services))
+            self.assertFalse(mock_get.called)
+
     def test_ipmi_fencing_host(self):
+        ipmi_utils._session_pool.clear()
+        self.addCleanup(ipmi_utils._session_pool.clear)
         mock_return = mock.Mock()
         mock_command = mock.Mock(return_value=mock_return)
         command.Command = mock_command
@@ -16,17 +16,28 @@
 """
 Test suite for engine.
 """
+import datetime
+import os
+import time
+
+import eventlet
+import fixtures
 import mock
 from mox3 import mox
 from oslo_config import cfg
 
+from hastack.has.stack.haservice import checkpoint
 from hastack.has.stack.haservice import constants
 from hastack.has.stack.haservice import engine as engines
+from hastack.has.stack.haservice import exception as service_exception
+from hastack.has.stack.haservice import instance_index
 from hastack.has.stack.haservice.instance_driver \
 import driver as instance_driver
 from hastack.has.stack.haservice import ipmi_utils
 from hastack.has.stack.haservice import utils as ha_utils
 from hastack.has.stack import hv_status
+import hastack.openstack.openstack_api.db_api as ha_db_api
+import hastack.openstack.openstack_constants as openstack_constants
 from nova.db import api as db_api
 from nova import objects
 from nova.objects import instance as instance_obj
@@ -63,6 +74,29 @@ COMPUTE_NODES = [
                 metrics=None),
 ]
 
+COMPUTE_NODE_ROWS = [
+    {'id': 1,
+     'hypervisor_hostname': 'compute1',
+     'hypervisor_type': 'QEMU',
+     'host': 'compute1',
+     'stats': None,
+     'metrics': None,
+     'created_at': datetime.datetime(2016, 1, 1),
+     'updated_at': None,
+     'deleted_at': None,
+     'deleted': 0},
+    {'id': 2,
+     'hypervisor_hostname': 'compute2',
+     'hypervisor_type': 'QEMU',
+     'host': 'compute2',
+     'stats': None,
+     'metrics': None,
+     'created_at': datetime.datetime(2016, 1, 1),
+     'updated_at': datetime.datetime(2016, 1, 2),
+     'deleted_at': None,
+     'deleted': 0},
+]
+
 INSTANCES = [
     {
         'uuid': 'uuid1',
@@ -102,11 +136,20 @@ def fake_compute_node_get_all(cls, context):
     return COMPUTE_NODES
 
 
+def fake_compute_node_get_all_changed_since(context, since=None):
+    return COMPUTE_NODE_ROWS
+
+
 @classmethod
 def fake_service_get_by_compute_host(cls, context, host):
     return 'service'
 
 
+@classmethod
+def fake_service_get_by_binary(cls, context, binary, include_disabled=False):
+    return [{'host': node['host']} for node in COMPUTE_NODES]
+
+
 class Fake_InstanceList(object):
     @classmethod
     def get_by_host(cls, context, host, expected_attrs=None,
@@ -134,6 +177,8 @@ class BasePolicyEngineTestCase(test.TestCase):
         super(BasePolicyEngineTestCase, self).setUp()
         self.stubs.Set(objects.ComputeNodeList, 'get_all',
                        fake_compute_node_get_all)
+        self.stubs.Set(ha_db_api, 'compute_node_get_all_changed_since',
+                       fake_compute_node_get_all_changed_since)
         self.engine = engines.BasePolicyEngine(host=all_nodes[0],
                                                has_driver=Fake_HASDriver())
 
@@ -150,6 +195,8 @@ class HAEngineTestCase(test.TestCase):
         super(HAEngineTestCase, self).setUp()
         self.stubs.Set(objects.ComputeNodeList, 'get_all',
                        fake_compute_node_get_all)
+        self.stubs.Set(ha_db_api, 'compute_node_get_all_changed_since',
+                       fake_compute_node_get_all_changed_since)
         self.engine = engines.HAEngine(host=all_nodes[0],
                                        has_driver=Fake_HASDriver())
         self.context = self.engine.ctxt
@@ -183,9 +230,59 @@ class HAEngineTestCase(test.TestCase):
         self.assertEqual(self.engine.in_action_hvs, set())
         self.assertEqual(self.engine.error_insts, {})
 
+    def test_checkpoint_state_restored(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'status.json')
+        self.flags(ha_checkpoint_state=True, has_compute_status_file=path)
+        self.engine.checkpoint = checkpoint.StatusCheckpoint()
+        self.engine.in_action_hvs.add('compute1')
+        self.engine.idle_hvs.add('compute2')
+        self.engine._error_counts('compute1')['uuid2'] = 1
+        self.engine.changed_hvs.update(['compute1', 'compute2'])
+        self.engine.haservice_action['req-1'] = {
+            'hypervisor_hostname': 'compute1', 'vm_uuid': 'uuid1',
+            'target_host': 'compute2'}
+        self.engine.rebuild_ledger.add('uuid1', 'compute1', 'compute2',
+                                       started_at=100.5)
+        self.engine._checkpoint_state()
+
+        engine = engines.HAEngine(host=all_nodes[0],
+                                  has_driver=Fake_HASDriver())
+        self.assertEqual(set(['compute1']), engine.in_action_hvs)
+        self.assertEqual(set(['compute2']), engine.idle_hvs)
+        self.assertEqual({'compute1': {'uuid2': 1}}, engine.error_insts)
+        self.assertEqual(['req-1'], list(engine.haservice_action))
+        self.assertEqual({'uuid1': ('compute1', 'compute2', 100.5)},
+                         engine.rebuild_ledger.inflight())
+        self.assertEqual(constants.STATE_HA_REBUILDING,
+                         engine.status.get_ha('compute1'))
+
+    def test_checkpoint_state_changed_hvs(self):
+        path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                            'status.json')
+        self.flags(ha_checkpoint_state=True, has_compute_status_file=path)
+        self.engine.checkpoint = checkpoint.StatusCheckpoint()
+        self.engine.hv_map = {'compute1': COMPUTE_NODES[0],
+                              'compute2': COMPUTE_NODES[1]}
+        self.engine.idle_hvs.update(['compute1', 'compute2'])
+        self.engine.changed_hvs.add('compute1')
+        self.engine._checkpoint_state()
+        self.assertEqual(constants.STATE_HA_EVACUATED,
+                         self.engine.status.get_ha('compute1'))
+        # compute2 was not marked as changed
+        self.assertEqual(constants.STATE_OK,
+                         self.engine.status.get_ha('compute2'))
+        self.assertEqual(set(), self.engine.changed_hvs)
+
+        self.engine._action_finished(self.engine.ctxt, 'compute2')
+        self.engine._checkpoint_state()
+        self.assertEqual(constants.STATE_HA_EVACUATED,
+                         self.engine.status.get_ha('compute2'))
+
     def test_select_nodes(self):
         result = self.engine.select_nodes(self.engine.ctxt)
-        self.assertEqual(result, COMPUTE_NODES)
+        self.assertEqual(sorted(result, key=lambda node: node['id']),
+                         COMPUTE_NODE_ROWS)
 
     def test_check_host_network(self):
         mock_getstatus = mock.Mock()
@@ -206,6 +303,347 @@ class HAEngineTestCase(test.TestCase):
         self.engine.check_host_power_status(None, COMPUTE_NODES[0])
         self.mox.VerifyAll()
 
+    def test_check_host_power_status_probe_failed(self):
+        self.mox.StubOutWithMock(self.engine, 'evacuate_instance')
+        self.mox.ReplayAll()
+        result = self.engine.check_host_power_status(
+            None, COMPUTE_NODES[0], (None, Exception('unreachable')))
+        self.assertTrue(result)
+        self.mox.VerifyAll()
+
+    def test_probe_power_states(self):
+        def fake_get_power(node):
+            if node['hypervisor_hostname'] == 'compute2':
+                raise Exception('unreachable')
+            return 'on'
+
+        self.stubs.Set(ipmi_utils, 'get_power', fake_get_power)
+        probes = self.engine._probe_power_states(COMPUTE_NODES)
+        self.assertEqual(('on', None), probes['compute1'])
+        self.assertIsNone(probes['compute2'][0])
+        self.assertEqual('unreachable', str(probes['compute2'][1]))
+
+    def test_probe_power_states_bad_metrics(self):
+        bad_node = objects.ComputeNode(id=2,
+                                       hypervisor_hostname='compute2',
+                                       hypervisor_type='QEMU',
+                                       host='compute2',
+                                       stats=None,
+                                       metrics='not json')
+        self.stubs.Set(ipmi_utils, 'get_power', lambda node: 'on')
+        probes = self.engine._probe_power_states([COMPUTE_NODES[0],
+                                                  bad_node])
+        self.assertEqual(('on', None), probes['compute1'])
+        self.assertIsNone(probes['compute2'][0])
+        self.assertIsInstance(probes['compute2'][1], ValueError)
+
+    def test_probe_power_states_timeout(self):
+        def fake_get_power(node):
+            eventlet.sleep(5)
+            return 'on'
+
+        self.flags(ha_power_probe_timeout=1)
+        self.stubs.Set(ipmi_utils, 'get_power', fake_get_power)
+        probes = self.engine._probe_power_states([COMPUTE_NODES[0]])
+        self.assertIsInstance(probes['compute1'][1],
+                              service_exception.PowerProbeTimeout)
+
+    def test_probe_power_states_cached(self):
+        self.mox.StubOutWithMock(ipmi_utils, 'get_power')
+        ipmi_utils.get_power(COMPUTE_NODES[0]).AndReturn('on')
+        self.mox.ReplayAll()
+        self.engine._probe_power_states([COMPUTE_NODES[0]])
+        probes = self.engine._probe_power_states([COMPUTE_NODES[0]])
+        self.assertEqual(('on', None), probes['compute1'])
+
+    def test_probe_power_states_breaker_open(self):
+        self.flags(ha_bmc_breaker_threshold=1)
+        self.mox.StubOutWithMock(ipmi_utils, 'get_power')
+        ipmi_utils.get_power(COMPUTE_NODES[0]).AndRaise(
+            Exception('unreachable'))
+        self.mox.ReplayAll()
+        with mock.patch.object(engines.LOG, 'warning') as mock_warning:
+            self.engine._probe_power_states([COMPUTE_NODES[0]])
+            probes = self.engine._probe_power_states([COMPUTE_NODES[0]])
+        self.assertIsInstance(probes['compute1'][1],
+                              service_exception.BMCCircuitOpen)
+        # the open breakers are reported once, when they change
+        self.assertEqual(1, mock_warning.call_count)
+        self.assertIn('compute1', mock_warning.call_args[0][0])
+        self.assertTrue(self.engine.check_host_power_status(
+            self.context, COMPUTE_NODES[0], probes['compute1']))
+        self.assertIn('compute1', self.engine.get_bmc_breaker_states())
+
+    def test_service_function_probes_due_hosts(self):
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__refresh')
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__load_services')
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
+        self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
+        self.mox.StubOutWithMock(self.engine.probe_scheduler, 'pop_due')
+
+        self.engine._BasePolicyEngine__refresh(self.context).AndReturn(True)
+        self.engine.probe_scheduler.pop_due().AndReturn(['compute2'])
+        self.engine._probe_power_states([COMPUTE_NODES[1]]).AndReturn(
+            {'compute2': (None, Exception('unreachable'))})
+        self.engine.check_host_power_status(
+            self.context, COMPUTE_NODES[1], mox.IgnoreArg()).AndReturn(True)
+        # within ha_period_interval only the services are reloaded
+        self.engine._BasePolicyEngine__load_services(self.context)
+        self.engine.probe_scheduler.pop_due().AndReturn([])
+        self.mox.ReplayAll()
+        self.engine.managed_nodes = COMPUTE_NODES
+        self.engine.service_snapshot = mock.Mock()
+        self.engine.service_function(self.context)
+        self.engine.service_function(self.context)
+        # the host whose BMC failed is probed again sooner
+        self.assertLessEqual(
+            self.engine.probe_scheduler.next_deadline(),
+            self.engine.last_refresh + CONF.ha_probe_suspect_interval + 1)
+
+    def test_load_services_expedites_suspects(self):
+        services = [{'host': 'compute1', 'updated_at': 100},
+                    {'host': 'compute2', 'updated_at': 100}]
+        self.engine.managed_nodes = COMPUTE_NODES
+        self.engine.probe_scheduler.sync(['compute1', 'compute2'])
+        self.engine.probe_scheduler.pop_due()
+        self.engine.probe_scheduler.schedule('compute1')
+        self.engine.probe_scheduler.schedule('compute2')
+        self.mox.StubOutWithMock(self.engine.failure_detector, 'is_suspect')
+        self.engine.failure_detector.is_suspect('compute1').AndReturn(False)
+        self.engine.failure_detector.is_suspect('compute2').AndReturn(True)
+        self.mox.ReplayAll()
+        with mock.patch.object(self.engine.compute_api,
+                               'get_all_compute_services',
+                               return_value=services), \
+                mock.patch.object(self.engine.compute_api, 'service_is_up',
+                                  return_value=True):
+            self.engine._BasePolicyEngine__load_services(self.context)
+        # the heartbeats stopped on compute2, which is probed at once
+        self.assertEqual(['compute2'], self.engine.probe_scheduler.pop_due())
+
+    def test_service_function_reschedules_failed_evaluation(self):
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__refresh')
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
+
+        self.engine._BasePolicyEngine__refresh(self.context).AndReturn(True)
+        self.engine._probe_power_states(COMPUTE_NODES).AndRaise(
+            Exception('boom'))
+        self.mox.ReplayAll()
+        self.engine.managed_nodes = COMPUTE_NODES
+        self.engine.service_snapshot = mock.Mock()
+        self.engine.probe_scheduler.sync(['compute1', 'compute2'])
+        self.assertRaises(Exception,
+                          self.engine.service_function, self.context)
+        self.assertEqual(set(), self.engine.evaluating_hvs)
+        # the hosts are probed again as suspects rather than never again
+        self.assertLessEqual(
+            self.engine.probe_scheduler.next_deadline(),
+            time.time() + CONF.ha_probe_suspect_interval)
+
+    def test_service_function_skips_healthy_hosts(self):
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__refresh')
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
+        self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
+        self.mox.StubOutWithMock(self.engine.probe_scheduler, 'pop_due')
+        self.mox.StubOutWithMock(self.engine.failure_detector, 'is_suspect')
+
+        self.engine._BasePolicyEngine__refresh(self.context).AndReturn(True)
+        self.engine.probe_scheduler.pop_due().AndReturn(
+            ['compute1', 'compute2'])
+        self.engine.failure_detector.is_suspect('compute1').AndReturn(False)
+        self.engine.failure_detector.is_suspect('compute2').AndReturn(True)
+        # only the BMC of the suspect host is probed
+        self.engine._probe_power_states([COMPUTE_NODES[1]]).AndReturn(
+            {'compute2': ('on', None)})
+        self.engine.check_host_power_status(
+            self.context, COMPUTE_NODES[1], ('on', None)).AndReturn(False)
+        self.mox.ReplayAll()
+        self.engine.managed_nodes = COMPUTE_NODES
+        self.engine.service_snapshot = mock.Mock()
+        with mock.patch.object(self.engine.detection_pipeline,
+                               'run') as mock_run:
+            mock_run.return_value = {'compute2': constants.VERDICT_NOOP}
+            self.engine.service_function(self.context)
+            mock_run.assert_called_once_with(
+                self.context, [COMPUTE_NODES[1]],
+                services=self.engine.service_snapshot)
+        self.assertIsNotNone(self.engine.probe_scheduler.next_deadline())
+
+    def test_service_function_takes_detection_verdicts(self):
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__refresh')
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
+        self.mox.StubOutWithMock(self.engine.probe_scheduler, 'pop_due')
+        self.mox.StubOutWithMock(self.engine.detection_pipeline, 'run')
+        self.mox.StubOutWithMock(self.engine, 'fencing_and_evacuate')
+        self.mox.StubOutWithMock(self.engine, 'ha_alarm')
+
+        self.engine._BasePolicyEngine__refresh(self.context).AndReturn(True)
+        self.engine.probe_scheduler.pop_due().AndReturn(
+            ['compute1', 'compute2'])
+        probes = dict((node['hypervisor_hostname'], ('on', None))
+                      for node in COMPUTE_NODES)
+        self.engine._probe_power_states(COMPUTE_NODES).AndReturn(probes)
+        self.engine.detection_pipeline.run(
+            self.context, COMPUTE_NODES, services=mox.IgnoreArg()).AndReturn(
+            {'compute1': constants.VERDICT_EVACUATE,
+             'compute2': constants.VERDICT_ALARM})
+        self.engine.fencing_and_evacuate(self.context, COMPUTE_NODES[0])
+        self.engine.ha_alarm(self.context, COMPUTE_NODES[1])
+        self.mox.ReplayAll()
+        self.engine.managed_nodes = COMPUTE_NODES
+        self.engine.service_snapshot = mock.Mock()
+        self.engine.service_snapshot.is_up.return_value = False
+        self.engine.service_function(self.context)
+
+    def test_host_suspect_evaluates_host(self):
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
+        self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
+        self.engine._probe_power_states([COMPUTE_NODES[0]]).AndReturn(
+            {'compute1': ('off', None)})
+        self.engine.check_host_power_status(
+            self.context, COMPUTE_NODES[0], ('off', None)).AndReturn(True)
+        self.mox.ReplayAll()
+        self.engine.hv_map = {'compute1': COMPUTE_NODES[0]}
+        self.engine.ha_enabled = True
+        self.engine.service_snapshot = mock.Mock()
+        self.assertTrue(self.engine.host_suspect(self.context, 'compute1',
+                                                 reason='watchdog'))
+        self.assertEqual(set(), self.engine.evaluating_hvs)
+        # the same host is not evaluated again right away
+        self.assertFalse(self.engine.host_suspect(self.context, 'compute1'))
+
+    def test_host_suspect_ignored(self):
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__evaluate_hosts')
+        self.mox.ReplayAll()
+        self.engine.hv_map = {'compute1': COMPUTE_NODES[0]}
+        self.assertFalse(self.engine.host_suspect(self.context, 'compute1'))
+        self.engine.ha_enabled = True
+        self.assertFalse(self.engine.host_suspect(self.context, 'compute3'))
+        self.engine.in_action_hvs.add('compute1')
+        self.assertFalse(self.engine.host_suspect(self.context, 'compute1'))
+
+    def test_host_suspect_rate_limited(self):
+        self.flags(ha_host_suspect_min_interval=0)
+        self.mox.StubOutWithMock(self.engine,
+                                 '_BasePolicyEngine__evaluate_hosts')
+        self.mox.StubOutWithMock(self.engine.suspect_bucket, 'consume')
+        self.engine.suspect_bucket.consume().AndReturn(0)
+        self.engine._BasePolicyEngine__evaluate_hosts(
+            self.context, [COMPUTE_NODES[0]])
+        self.engine.suspect_bucket.consume().AndReturn(0.5)
+        self.mox.ReplayAll()
+        self.engine.hv_map = {'compute1': COMPUTE_NODES[0]}
+        self.engine.ha_enabled = True
+        self.assertTrue(self.engine.host_suspect(self.context, 'compute1'))
+        self.assertFalse(self.engine.host_suspect(self.context, 'compute1'))
+
+    def test_verify_migration_watermark(self):
+        updated_at = datetime.datetime(2016, 1, 1)
+        migrations = [{'id': 1, 'instance_uuid': 'uuid1',
+                       'old_instance_type_id': 1, 'new_instance_type_id': 1,
+                       'updated_at': updated_at}]
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.mox.StubOutWithMock(self.engine.compute_api, 'confirm_resize')
+
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn(migrations)
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': 'has-ha-requestid'})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
+        self.engine.compute_api.confirm_resize(self.context, self.instance)
+        # the migration at the watermark is not verified a second time
+        since = updated_at - datetime.timedelta(
+            seconds=constants.MIGRATION_WATERMARK_MARGIN)
+        ha_db_api.migration_get_finished_since(
+            self.context, since).AndReturn(migrations)
+        self.mox.ReplayAll()
+        self.engine._BasePolicyEngine__verify_migration(self.context)
+        self.engine._BasePolicyEngine__verify_migration(self.context)
+        self.assertEqual(updated_at, self.engine.migration_watermark)
+        self.assertEqual({1: updated_at},
+                         self.engine.migration_watermark_ids)
+
+    def test_verify_migration_committed_late(self):
+        updated_at = datetime.datetime(2016, 1, 1, 0, 1)
+        self.engine.migration_watermark = updated_at
+        self.engine.migration_watermark_ids = {1: updated_at}
+        # written before the watermark by a host whose clock is behind
+        late = {'id': 2, 'instance_uuid': 'uuid1',
+                'old_instance_type_id': 1, 'new_instance_type_id': 1,
+                'updated_at': updated_at - datetime.timedelta(seconds=10)}
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.mox.StubOutWithMock(self.engine.compute_api, 'confirm_resize')
+
+        ha_db_api.migration_get_finished_since(
+            self.context, datetime.datetime(2016, 1, 1)).AndReturn(
+            [late, {'id': 1, 'instance_uuid': 'uuid2',
+                    'old_instance_type_id': 1, 'new_instance_type_id': 1,
+                    'updated_at': updated_at}])
+        # only the migration not verified yet is
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': 'has-ha-requestid'})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
+        self.engine.compute_api.confirm_resize(self.context, self.instance)
+        self.mox.ReplayAll()
+        self.engine._BasePolicyEngine__verify_migration(self.context)
+        self.assertEqual(updated_at, self.engine.migration_watermark)
+        self.assertEqual({1: updated_at, 2: late['updated_at']},
+                         self.engine.migration_watermark_ids)
+
+    def test_verify_migration_not_by_ha(self):
+        migrations = [{'id': 1, 'instance_uuid': 'uuid1',
+                       'old_instance_type_id': 1, 'new_instance_type_id': 1,
+                       'updated_at': datetime.datetime(2016, 1, 1)}]
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(self.engine.compute_api, 'confirm_resize')
+
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn(migrations)
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn({'uuid1': 'req-user'})
+        self.mox.ReplayAll()
+        self.engine._BasePolicyEngine__verify_migration(self.context)
+
+    def test_verify_migration_deleted_instance(self):
+        self.engine.unconfirmed_migrations['uuid2'] = 1
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn([])
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid2'])).AndReturn(
+            {'uuid2': 'has-ha-requestid'})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid2']},
+            expected_attrs=mox.IgnoreArg()).AndReturn([])
+        self.mox.ReplayAll()
+        self.engine._BasePolicyEngine__verify_migration(self.context)
+        # the deleted instance is not retried in the next cycles
+        self.assertEqual({}, self.engine.unconfirmed_migrations)
+
     def test_update_managed_hvs(self):
         # def fake_aggregate_host_get_all(context, aggregate_id):
         #     return [all_nodes[0]['host']]
@@ -227,23 +665,34 @@ class HAEngineTestCase(test.TestCase):
                                'select_instances') as mock_method:
             mock_method.return_value = INSTANCES
             result = self.engine.select_instances(None, 'compute1')
-            mock_method.assert_called_with(None, 'compute1')
+            mock_method.assert_called_with(None, 'compute1', services=None)
             self.assertEqual(result, INSTANCES)
 
+    def test_select_instance_from_index(self):
+        self.engine.instance_index = instance_index.InstanceIndex()
+        with mock.patch.object(instance_driver.HAInstanceDriver,
+                               'select_instances') as mock_method:
+            # the index is not used until it is loaded
+            self.engine.select_instances(None, 'compute1')
+            mock_method.assert_called_with(None, 'compute1', services=None)
+            self.engine.notification_driven = True
+            self.engine.instance_index.last_seed = 100
+            self.engine.select_instances(None, 'compute1')
+            mock_method.assert_called_with(
+                None, 'compute1', services=None,
+                index=self.engine.instance_index)
+
     def test_evacuate_instance(self):
         self.mox.StubOutWithMock(self.engine, 'select_instances')
-        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(ha_utils, 'get_image_from_inst')
         self.mox.StubOutWithMock(scheduler_utils, 'build_request_spec')
         self.mox.StubOutWithMock(self.engine.scheduler_rpcapi,
                                  'select_destinations')
-        self.mox.StubOutWithMock(objects.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(self.engine.compute_api, 'evacuate')
 
         self.engine.select_instances(self.context,
                     self.hv_name).AndReturn([(self.instance, None)])
-        objects.InstanceList.get_by_filters(
-            self.context, mox.IgnoreArg()).AndReturn([self.instance])
         ha_utils.get_image_from_inst(self.instance).AndReturn('image')
         scheduler_utils.build_request_spec(self.context, 'image',
                                            [self.instance]).AndReturn({})
@@ -251,13 +700,132 @@ class HAEngineTestCase(test.TestCase):
             self.context, mox.IgnoreArg()).AndReturn(
             [{'host': 'compute2', 'nodename': 'compute2'}])
         objects.InstanceList.get_by_filters(
-            self.context, mox.IgnoreArg()).AndReturn([self.instance])
-        objects.Instance.get_by_uuid(mox.IgnoreArg(), mox.IgnoreArg(),
-                    expected_attrs=mox.IgnoreArg()).AndReturn('instance')
+            self.context, {'uuid': [self.instance_uuid]},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
         self.engine.compute_api.evacuate(mox.IgnoreArg(),
-                                         'instance', 'compute2', True)
+                                         self.instance, 'compute2', True)
+        self.mox.ReplayAll()
+        self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        # the rebuild is reserved before it is dispatched
+        self.assertEqual(1, self.engine.rebuild_ledger.count_source('compute1'))
+        self.assertEqual(1, self.engine.rebuild_ledger.count_dest('compute2'))
+        self.engine.dispatcher.wait()
+        # the deadline of the rebuild runs once it has been started
+        self.assertIn(self.instance_uuid, self.engine.move_deadlines)
+        request_id, action_info = list(self.engine.haservice_action.items())[0]
+        self.assertTrue(request_id.startswith(constants.PREFIX_HAS_HA))
+        self.assertEqual(self.instance_uuid, action_info['vm_uuid'])
+        self.assertIn(self.hv_name, self.engine.idle_hvs)
+
+    def test_evacuate_instance_moved(self):
+        self.engine.instance_index = instance_index.InstanceIndex()
+        self.mox.StubOutWithMock(self.engine, 'select_instances')
+        self.mox.StubOutWithMock(self.engine.placement, 'place')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+
+        self.engine.select_instances(self.context,
+                    self.hv_name).AndReturn([(self.instance, None)])
+        # the instance was evacuated by hand in the meantime
+        moved = self.instance.obj_clone()
+        moved.host = 'compute2'
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': [self.instance_uuid]},
+            expected_attrs=mox.IgnoreArg()).AndReturn([moved])
+        self.mox.ReplayAll()
+        with mock.patch.object(self.engine, '_usable_instance_index',
+                               return_value=self.engine.instance_index):
+            self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        self.engine.dispatcher.wait()
+        self.assertNotIn(self.instance_uuid, self.engine.rebuild_ledger)
+        self.assertEqual([self.instance_uuid],
+                         [inst['uuid'] for inst in
+                          self.engine.instance_index.get_by_host('compute2')])
+        self.assertIn(self.hv_name, self.engine.idle_hvs)
+
+    def test_evacuate_instance_evacuate_error(self):
+        self.mox.StubOutWithMock(self.engine, 'select_instances')
+        self.mox.StubOutWithMock(self.engine.placement, 'place')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.mox.StubOutWithMock(self.engine.compute_api, 'evacuate')
+
+        self.engine.select_instances(self.context,
+                    self.hv_name).AndReturn([(self.instance, None)])
+        self.engine.placement.place(
+            self.context, [self.instance], mox.IgnoreArg(),
+            observer=mox.IgnoreArg()).AndReturn(
+            [(self.instance, {'host': 'compute2', 'nodename': 'compute2'},
+              None)])
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': [self.instance_uuid]},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
+        self.engine.compute_api.evacuate(
+            mox.IgnoreArg(), self.instance, 'compute2', True).AndRaise(
+            Exception('conflict'))
+        self.mox.ReplayAll()
+        self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        self.engine.dispatcher.wait()
+        self.assertNotIn(self.instance_uuid, self.engine.rebuild_ledger)
+        self.assertNotIn(self.instance_uuid, self.engine.move_deadlines)
+        self.assertEqual(
+            1, self.engine.error_insts[self.hv_name][self.instance_uuid])
+        self.assertIn(self.hv_name, self.engine.in_action_hvs)
+
+    def test_evacuate_instance_no_valid_host(self):
+        self.mox.StubOutWithMock(self.engine, 'select_instances')
+        self.mox.StubOutWithMock(self.engine.placement, 'place')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.mox.StubOutWithMock(self.engine.compute_api, 'evacuate')
+
+        self.engine.select_instances(self.context,
+                    self.hv_name).AndReturn([(self.instance, None)])
+        self.engine.placement.place(
+            self.context, [self.instance], {'ignore_hosts': ['compute1']},
+            observer=mox.IgnoreArg()).AndReturn(
+            [(self.instance, None,
+              openstack_constants.NoValidHost(reason=''))])
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': [self.instance_uuid]},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
+        self.mox.ReplayAll()
+        self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        self.assertEqual(
+            1, self.engine.error_insts[self.hv_name][self.instance_uuid])
+        self.assertIn(self.hv_name, self.engine.in_action_hvs)
+
+    def test_rebuild_instances_source_limit(self):
+        self.engine.rebuild_ledger.reconcile(
+            dict(('uuid-rebuilding%d' % i, 'compute1')
+                 for i in range(constants.DEFAULT_PARALLEL_REBUILD)),
+            time.time())
+        self.mox.StubOutWithMock(self.engine, 'select_instances')
+        self.mox.StubOutWithMock(self.engine.scheduler_rpcapi,
+                                 'select_destinations')
+        self.engine.select_instances(self.context,
+                    self.hv_name).AndReturn([(self.instance, None)])
         self.mox.ReplayAll()
         self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        self.assertIn(self.hv_name, self.engine.in_action_hvs)
+
+    def test_rebuild_instances_source_window(self):
+        self.flags(ha_aimd_initial_window=1)
+        instance2 = self.instance.obj_clone()
+        instance2.uuid = 'uuid2'
+        self.mox.StubOutWithMock(self.engine, 'select_instances')
+        self.mox.StubOutWithMock(self.engine.placement, 'place')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
+        self.engine.select_instances(self.context, self.hv_name).AndReturn(
+            [(self.instance, None), (instance2, None)])
+        # only one instance fits in the initial window of the source
+        self.engine.placement.place(
+            self.context, [self.instance], mox.IgnoreArg(),
+            observer=mox.IgnoreArg()).AndReturn([])
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': [self.instance_uuid]},
+            expected_attrs=mox.IgnoreArg()).AndReturn([self.instance])
+        self.mox.ReplayAll()
+        self.engine.evacuate_instance(self.context, COMPUTE_NODES[0])
+        self.assertEqual({'source': {'compute1': 1}, 'dest': {}},
+                         self.engine.get_rebuild_windows())
 
     def test_fencing_and_evacuate(self):
         self.mox.StubOutWithMock(ipmi_utils, 'get_bmc')
@@ -272,10 +840,12 @@ class HAEngineTestCase(test.TestCase):
         ipmi_utils.get_power(COMPUTE_NODES[0]).AndReturn('status')
         self.engine.fencing_driver.fencing_host(self.engine.ctxt,
                                                 'bmc', 'user', 'password')
-        self.engine.host_driver.hypervisor_is_up(self.engine.ctxt,
-                                                 'compute1').AndReturn(False)
+        # the service is not taken from the snapshot made before fencing
+        self.engine.host_driver.hypervisor_is_up(
+            self.engine.ctxt, 'compute1').AndReturn(False)
         self.engine._rebuild_instances(self.engine.ctxt, COMPUTE_NODES[0])
         self.mox.ReplayAll()
+        self.engine.service_snapshot = mock.Mock()
         result = self.engine.fencing_and_evacuate(self.engine.ctxt,
                                                   COMPUTE_NODES[0])
         self.assertEqual(result, True)
@@ -457,6 +1027,85 @@ class HAEngineTestCase(test.TestCase):
         self.mox.ReplayAll()
         self.engine.move_inst_success(self.context)
 
+    def test_handle_notifications(self):
+        self.engine.haservice_action = {
+            'has-ha-req1': {'hypervisor_hostname': 'compute1',
+                            'vm_uuid': 'uuid1', 'vm_name': 'vm1'},
+            'has-ha-req2': {'hypervisor_hostname': 'compute1',
+                            'vm_uuid': 'uuid2', 'vm_name': 'vm2'}}
+        ctxt1 = Fake_Context()
+        ctxt1.request_id = 'has-ha-req1'
+        ctxt2 = Fake_Context()
+        ctxt2.request_id = 'has-ha-req2'
+        ctxt3 = Fake_Context()
+        ctxt3.request_id = 'has-ha-req3'
+        with mock.patch.object(self.engine, 'move_inst_success') as \
+                mock_success, \
+                mock.patch.object(self.engine, 'move_inst_fail') as mock_fail:
+            self.engine.handle_notifications([
+                (ctxt1, 'compute.instance.update', {'state': 'rebuilding'}),
+                (ctxt1, 'compute.instance.rebuild.end', {}),
+                (ctxt2, 'compute.instance.update', {'state': 'error'}),
+                (ctxt3, 'compute.instance.rebuild.end', {})])
+        mock_success.assert_called_once_with(ctxt1)
+        mock_fail.assert_called_once_with(
+            ctxt2, 'compute1',
+            {'state': 'error', 'instance_id': 'uuid2', 'name': 'vm2'}, False)
+
+    def test_handle_notifications_rebuild_error_instance(self):
+        self.engine.haservice_action = {
+            'has-ha-req1': {'hypervisor_hostname': 'compute1',
+                            'vm_uuid': 'uuid1', 'vm_name': 'vm1'}}
+        ctxt = Fake_Context()
+        ctxt.request_id = 'has-ha-req1'
+        started = {'state': 'error', 'old_state': 'error',
+                   'old_task_state': None, 'new_task_state': 'rebuilding'}
+        ended = {'state': 'error', 'old_state': 'error',
+                 'old_task_state': 'rebuilding', 'new_task_state': None}
+        with mock.patch.object(self.engine, 'move_inst_fail') as mock_fail:
+            # the instance in error is still being rebuilt
+            self.engine.handle_notifications(
+                [(ctxt, 'compute.instance.update', started)])
+            self.assertFalse(mock_fail.called)
+            self.engine.handle_notifications(
+                [(ctxt, 'compute.instance.update', ended)])
+        mock_fail.assert_called_once_with(
+            ctxt, 'compute1',
+            dict(ended, instance_id='uuid1', name='vm1'), False)
+
+    def test_lost_action_expires(self):
+        self.flags(ha_action_ttl=60)
+        engine = engines.HAEngine(host=all_nodes[0],
+                                  has_driver=Fake_HASDriver())
+        with mock.patch.object(engines.expiring_map.time, 'time',
+                               return_value=100):
+            engine.haservice_action['req-1'] = {
+                'hypervisor_hostname': 'compute1', 'vm_uuid': 'uuid1'}
+        with mock.patch.object(engines.expiring_map.time, 'time',
+                               return_value=160):
+            self.assertEqual({}, dict(engine.haservice_action))
+        self.assertEqual(1, engine.haservice_action.evictions)
+
+    def test_expire_moves(self):
+        self.flags(has_ha_timeout_seconds=60)
+        self.engine.rebuild_ledger.add('uuid1', 'compute1', 'compute2',
+                                       started_at=100)
+        self.engine.move_deadlines.add('uuid1', 'compute1', started_at=100,
+                                       name='vm1')
+        # a rebuild which finished before its deadline is not failed
+        self.engine.move_deadlines.add('uuid2', 'compute1', started_at=100)
+        self.mox.StubOutWithMock(self.engine.notifier, 'info')
+        self.engine.notifier.info(
+            self.context, constants.ETYPE_MOVING_INSTANCE_FAILED,
+            mox.ContainsKeyValue('instance_uuid', 'uuid1'))
+        self.mox.ReplayAll()
+        with mock.patch.object(engines.time, 'time', return_value=160):
+            self.engine._BasePolicyEngine__expire_moves(self.context)
+        self.assertNotIn('uuid1', self.engine.rebuild_ledger)
+        self.assertEqual({'uuid1': constants.MAX_RETRY_TIMES},
+                         self.engine.error_insts['compute1'])
+        self.assertEqual(0, len(self.engine.move_deadlines))
+
     def test_service_function_disable_haservice(self):
         db_migration = {
             'id': 1,
@@ -515,22 +1164,16 @@ class HAEngineTestCase(test.TestCase):
             'deleted_at': None,
             'deleted': False
         }
-        migration = objects.Migration._from_db_object(
-            self.context, objects.Migration(), db_migration
-        )
-        action = objects.InstanceAction._from_db_object(
-            self.context, objects.InstanceAction(), db_action
-        )
         haservice = objects.Service._from_db_object(
             self.context, objects.Service(), db_haservice
         )
-        self.stubs.Set(objects.Service, 'get_by_compute_host',
-                       fake_service_get_by_compute_host)
+        self.stubs.Set(objects.ServiceList, 'get_by_binary',
+                       fake_service_get_by_binary)
 
-        self.mox.StubOutWithMock(objects.MigrationList, 'get_by_filters')
-        self.mox.StubOutWithMock(objects.InstanceActionList,
-                                 'get_by_instance_uuid')
-        self.mox.StubOutWithMock(objects.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(self.engine.compute_api,
                                  'confirm_resize')
         self.mox.StubOutWithMock(self.engine.servicegroup_api,
@@ -540,23 +1183,22 @@ class HAEngineTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.engine, 'select_nodes')
         self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
         self.mox.StubOutWithMock(self.engine, 'check_vm_status')
-        objects.MigrationList.get_by_filters(
-            self.context, {'status': 'finished'}).AndReturn([migration])
-        objects.InstanceActionList.get_by_instance_uuid(
-            self.context, migration['instance_uuid']
-        ).AndReturn([action])
-        objects.Instance.get_by_uuid(
-            self.context, migration['instance_uuid'],
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn([db_migration])
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': db_action['request_id']})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
             expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS).AndReturn(
-            self.instance
-        )
+            [self.instance])
         self.engine.compute_api.confirm_resize(self.context, self.instance)
         self.engine.select_nodes(self.context).AndReturn(COMPUTE_NODES)
         db_api.service_get_by_host_and_binary(self.context, self.engine.host,
                                     'hastack.haservice').AndReturn(haservice)
         for i in range(0, len(COMPUTE_NODES)):
             self.engine.servicegroup_api.service_is_up(
-                'service').AndReturn(False)
+                mox.IgnoreArg()).AndReturn(False)
         db_api.service_update(self.context, int(haservice['id']),
                               {'disabled': True})
         self.mox.ReplayAll()
@@ -620,50 +1262,48 @@ class HAEngineTestCase(test.TestCase):
             'deleted_at': None,
             'deleted': False
         }
-        migration = objects.Migration._from_db_object(
-            self.context, objects.Migration(), db_migration
-        )
-        action = objects.InstanceAction._from_db_object(
-            self.context, objects.InstanceAction(), db_action
-        )
         haservice = objects.Service._from_db_object(
             self.context, objects.Service(), db_haservice
         )
-        self.stubs.Set(objects.Service, 'get_by_compute_host',
-                       fake_service_get_by_compute_host)
+        self.stubs.Set(objects.ServiceList, 'get_by_binary',
+                       fake_service_get_by_binary)
 
-        self.mox.StubOutWithMock(objects.MigrationList, 'get_by_filters')
-        self.mox.StubOutWithMock(objects.InstanceActionList,
-                                 'get_by_instance_uuid')
-        self.mox.StubOutWithMock(objects.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(self.engine.compute_api,
                                  'confirm_resize')
         self.mox.StubOutWithMock(self.engine.servicegroup_api,
                                  'service_is_up')
         self.mox.StubOutWithMock(self.engine, 'select_nodes')
         self.mox.StubOutWithMock(db_api, 'service_get_by_host_and_binary')
+        self.mox.StubOutWithMock(self.engine, '_probe_power_states')
         self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
         self.mox.StubOutWithMock(self.engine, 'check_vm_status')
 
-        objects.MigrationList.get_by_filters(
-            self.context, {'status': 'finished'}).AndReturn([migration])
-        objects.InstanceActionList.get_by_instance_uuid(
-            self.context, migration['instance_uuid']
-        ).AndReturn([action])
-        objects.Instance.get_by_uuid(
-            self.context, migration['instance_uuid'],
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn([db_migration])
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': db_action['request_id']})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
             expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS).AndReturn(
-            self.instance
-        )
+            [self.instance])
         self.engine.compute_api.confirm_resize(self.context, self.instance)
         self.engine.select_nodes(self.context).AndReturn(COMPUTE_NODES)
         db_api.service_get_by_host_and_binary(self.context, self.engine.host,
                                     'hastack.haservice').AndReturn(haservice)
         for i in range(0, len(COMPUTE_NODES)):
             self.engine.servicegroup_api.service_is_up(
-                'service').AndReturn(True)
+                mox.IgnoreArg()).AndReturn(True)
+        probes = dict((node['hypervisor_hostname'], ('on', None))
+                      for node in COMPUTE_NODES)
+        self.engine._probe_power_states(COMPUTE_NODES).AndReturn(probes)
         for node in COMPUTE_NODES:
-            self.engine.check_host_power_status(self.context, node)
+            self.engine.check_host_power_status(self.context, node,
+                                                ('on', None))
             self.engine.check_vm_status(self.context, node)
         self.mox.ReplayAll()
         self.engine.service_function(self.context)
@@ -726,22 +1366,16 @@ class HAEngineTestCase(test.TestCase):
             'deleted_at': None,
             'deleted': False
         }
-        migration = objects.Migration._from_db_object(
-            self.context, objects.Migration(), db_migration
-        )
-        action = objects.InstanceAction._from_db_object(
-            self.context, objects.InstanceAction(), db_action
-        )
         haservice = objects.Service._from_db_object(
             self.context, objects.Service(), db_haservice
         )
-        self.stubs.Set(objects.Service, 'get_by_compute_host',
-                       fake_service_get_by_compute_host)
+        self.stubs.Set(objects.ServiceList, 'get_by_binary',
+                       fake_service_get_by_binary)
 
-        self.mox.StubOutWithMock(objects.MigrationList, 'get_by_filters')
-        self.mox.StubOutWithMock(objects.InstanceActionList,
-                                 'get_by_instance_uuid')
-        self.mox.StubOutWithMock(objects.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(self.engine.compute_api,
                                  'confirm_resize')
         self.mox.StubOutWithMock(self.engine.servicegroup_api,
@@ -752,23 +1386,22 @@ class HAEngineTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
         self.mox.StubOutWithMock(self.engine, 'check_vm_status')
 
-        objects.MigrationList.get_by_filters(
-            self.context, {'status': 'finished'}).AndReturn([migration])
-        objects.InstanceActionList.get_by_instance_uuid(
-            self.context, migration['instance_uuid']
-        ).AndReturn([action])
-        objects.Instance.get_by_uuid(
-            self.context, migration['instance_uuid'],
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn([db_migration])
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': db_action['request_id']})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
             expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS).AndReturn(
-            self.instance
-        )
+            [self.instance])
         self.engine.compute_api.confirm_resize(self.context, self.instance)
         self.engine.select_nodes(self.context).AndReturn(COMPUTE_NODES)
         db_api.service_get_by_host_and_binary(self.context, self.engine.host,
                                     'hastack.haservice').AndReturn(haservice)
         for i in range(0, len(COMPUTE_NODES)):
             self.engine.servicegroup_api.service_is_up(
-                'service').AndReturn(True)
+                mox.IgnoreArg()).AndReturn(True)
         db_api.service_update(self.context, int(haservice['id']),
                               {'disabled': False})
         self.mox.ReplayAll()
@@ -832,22 +1465,16 @@ class HAEngineTestCase(test.TestCase):
             'deleted_at': None,
             'deleted': False
         }
-        migration = objects.Migration._from_db_object(
-            self.context, objects.Migration(), db_migration
-        )
-        action = objects.InstanceAction._from_db_object(
-            self.context, objects.InstanceAction(), db_action
-        )
         haservice = objects.Service._from_db_object(
             self.context, objects.Service(), db_haservice
         )
-        self.stubs.Set(objects.Service, 'get_by_compute_host',
-                       fake_service_get_by_compute_host)
+        self.stubs.Set(objects.ServiceList, 'get_by_binary',
+                       fake_service_get_by_binary)
 
-        self.mox.StubOutWithMock(objects.MigrationList, 'get_by_filters')
-        self.mox.StubOutWithMock(objects.InstanceActionList,
-                                 'get_by_instance_uuid')
-        self.mox.StubOutWithMock(objects.Instance, 'get_by_uuid')
+        self.mox.StubOutWithMock(ha_db_api, 'migration_get_finished_since')
+        self.mox.StubOutWithMock(ha_db_api,
+                                 'instance_action_get_latest_request_ids')
+        self.mox.StubOutWithMock(objects.InstanceList, 'get_by_filters')
         self.mox.StubOutWithMock(self.engine.compute_api,
                                  'confirm_resize')
         self.mox.StubOutWithMock(self.engine.servicegroup_api,
@@ -857,21 +1484,20 @@ class HAEngineTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.engine, 'check_host_power_status')
         self.mox.StubOutWithMock(self.engine, 'check_vm_status')
 
-        objects.MigrationList.get_by_filters(
-            self.context, {'status': 'finished'}).AndReturn([migration])
-        objects.InstanceActionList.get_by_instance_uuid(
-            self.context, migration['instance_uuid']
-        ).AndReturn([action])
-        objects.Instance.get_by_uuid(
-            self.context, migration['instance_uuid'],
+        ha_db_api.migration_get_finished_since(
+            self.context, None).AndReturn([db_migration])
+        ha_db_api.instance_action_get_latest_request_ids(
+            self.context, set(['uuid1'])).AndReturn(
+            {'uuid1': db_action['request_id']})
+        objects.InstanceList.get_by_filters(
+            self.context, {'uuid': ['uuid1']},
             expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS).AndReturn(
-            self.instance
-        )
+            [self.instance])
         self.engine.compute_api.confirm_resize(self.context, self.instance)
         self.engine.select_nodes(self.context).AndReturn(COMPUTE_NODES)
         db_api.service_get_by_host_and_binary(self.context, self.engine.host,
                                     'hastack.haservice').AndReturn(haservice)
         self.engine.servicegroup_api.service_is_up(
-                'service').AndReturn(False)
+                mox.IgnoreArg()).AndReturn(False)
         self.mox.ReplayAll()
         self.engine.service_function(self.context)
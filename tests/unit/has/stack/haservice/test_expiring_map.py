@@ -0,0 +1,65 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for expiring_map.
+"""
+import mock
+
+from hastack.has.stack.haservice import expiring_map
+from nova import test
+
+
+@mock.patch.object(expiring_map.time, 'time')
+class ExpiringLRUTestCase(test.TestCase):
+    def setUp(self):
+        super(ExpiringLRUTestCase, self).setUp()
+        self.evicted = []
+        self.store = expiring_map.ExpiringLRU(
+            60, 3, on_evict=lambda key, value: self.evicted.append(key))
+
+    def test_dict_behavior(self, mock_time):
+        mock_time.return_value = 100
+        self.store['req-1'] = 1
+        self.store.update({'req-2': 2})
+        self.assertEqual({'req-1': 1, 'req-2': 2}, self.store)
+        self.assertEqual(2, self.store.pop('req-2'))
+        self.assertIsNone(self.store.pop('req-2', None))
+        self.assertEqual(1, self.store.setdefault('req-1', 0))
+        self.assertNotIn('req-2', self.store)
+        self.assertEqual(0, self.store.evictions)
+
+    def test_expire(self, mock_time):
+        mock_time.return_value = 100
+        self.store['req-1'] = 1
+        mock_time.return_value = 130
+        self.store['req-2'] = 2
+        mock_time.return_value = 150
+        # setting an entry again refreshes it
+        self.store['req-1'] = 1
+        mock_time.return_value = 185
+        self.assertEqual(['req-1', 'req-2'], sorted(self.store))
+        mock_time.return_value = 190
+        self.assertEqual(['req-1'], list(self.store))
+        mock_time.return_value = 210
+        self.assertEqual(0, len(self.store))
+        self.assertEqual(['req-2', 'req-1'], self.evicted)
+        self.assertEqual(2, self.store.evictions)
+
+    def test_maxsize(self, mock_time):
+        mock_time.return_value = 100
+        for i in range(5):
+            self.store['req-%d' % i] = i
+        self.assertEqual({'req-2': 2, 'req-3': 3, 'req-4': 4}, self.store)
+        self.assertEqual(['req-0', 'req-1'], self.evicted)
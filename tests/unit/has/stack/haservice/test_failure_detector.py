@@ -0,0 +1,68 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for failure_detector.
+"""
+import datetime
+
+from hastack.has.stack.haservice import failure_detector
+from nova import test
+
+BASE = datetime.datetime(2016, 1, 1)
+
+
+class PhiAccrualDetectorTestCase(test.TestCase):
+    def setUp(self):
+        super(PhiAccrualDetectorTestCase, self).setUp()
+        self.flags(ha_phi_threshold=8, ha_phi_window_size=4,
+                   ha_phi_min_samples=3, ha_phi_min_std=2)
+        self.detector = failure_detector.PhiAccrualDetector()
+
+    def _feed(self, host, offsets):
+        for offset in offsets:
+            self.detector.heartbeat(
+                host, BASE + datetime.timedelta(seconds=offset))
+        return failure_detector._to_timestamp(
+            BASE + datetime.timedelta(seconds=offsets[-1]))
+
+    def test_unknown_host_is_suspect(self):
+        self.assertIsNone(self.detector.phi('compute1'))
+        self.assertTrue(self.detector.is_suspect('compute1'))
+        last = self._feed('compute1', [0, 30, 60])
+        # only two inter-arrival times so far
+        self.assertTrue(self.detector.is_suspect('compute1', last))
+
+    def test_phi_grows_with_silence(self):
+        last = self._feed('compute1', [0, 30, 61, 90, 121])
+        self.assertFalse(self.detector.is_suspect('compute1', last + 30))
+        self.assertFalse(self.detector.is_suspect('compute1', last + 35))
+        self.assertTrue(self.detector.is_suspect('compute1', last + 60))
+        self.assertLess(self.detector.phi('compute1', last + 35),
+                        self.detector.phi('compute1', last + 40))
+
+    def test_stale_heartbeat_ignored(self):
+        last = self._feed('compute1', [0, 30, 60, 90, 90, 90])
+        self.assertEqual(0, int(self.detector.phi('compute1', last)))
+        self.assertFalse(self.detector.is_suspect('compute1', last + 30))
+
+    def test_ring_buffer(self):
+        # the slow early heartbeats fall out of the window
+        last = self._feed('compute1', [0, 300, 330, 360, 390, 420])
+        self.assertTrue(self.detector.is_suspect('compute1', last + 120))
+
+    def test_threshold_disabled(self):
+        self.flags(ha_phi_threshold=0)
+        last = self._feed('compute1', [0, 30, 60, 90])
+        self.assertTrue(self.detector.is_suspect('compute1', last))
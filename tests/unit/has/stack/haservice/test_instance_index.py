@@ -0,0 +1,133 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for instance_index.
+"""
+import mock
+
+from hastack.has.stack.haservice import instance_index
+import hastack.openstack.openstack_api.db_api as ha_db_api
+from nova import test
+
+
+def _row(row_id, uuid, host):
+    return {'id': row_id, 'uuid': uuid, 'display_name': 'vm-%s' % uuid,
+            'host': host, 'node': host, 'vm_state': 'active',
+            'task_state': None, 'launched_at': 'now'}
+
+
+def _payload(uuid, host, ha='True', **kwargs):
+    payload = {'instance_id': uuid, 'display_name': 'vm-%s' % uuid,
+               'host': host, 'node': host, 'state': 'active',
+               'state_description': '', 'launched_at': 'now',
+               'metadata': {'ha': ha}}
+    payload.update(kwargs)
+    return payload
+
+
+def _uuids(insts):
+    return sorted(inst['uuid'] for inst in insts)
+
+
+class InstanceIndexTestCase(test.TestCase):
+    def setUp(self):
+        super(InstanceIndexTestCase, self).setUp()
+        self.flags(ha_instance_index_page_size=2,
+                   ha_instance_index_reconcile_interval=600)
+        self.index = instance_index.InstanceIndex()
+
+    @mock.patch.object(ha_db_api, 'instance_get_ha_enabled_page')
+    def test_seed_pages(self, mock_page):
+        mock_page.side_effect = [
+            [_row(1, 'uuid1', 'compute1'), _row(2, 'uuid2', 'compute1')],
+            [_row(5, 'uuid3', 'compute2')]]
+        self.assertTrue(self.index.seed_due())
+        self.index.seed('ctxt')
+        self.assertEqual([mock.call('ctxt', marker=None, limit=2),
+                          mock.call('ctxt', marker=2, limit=2)],
+                         mock_page.call_args_list)
+        self.assertEqual(['uuid1', 'uuid2'],
+                         _uuids(self.index.get_by_host('compute1')))
+        self.assertEqual(3, len(self.index))
+        self.assertTrue(self.index.seeded)
+        self.assertFalse(self.index.seed_due())
+
+    def test_update(self):
+        self.index.update('compute.instance.create.end',
+                          _payload('uuid1', 'compute1'))
+        self.index.update('compute.instance.create.end',
+                          _payload('uuid2', 'compute1', ha='False'))
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute1')))
+        inst = self.index.get_by_host('compute1')[0]
+        self.assertIsNone(inst['task_state'])
+        # an evacuation moves the instance to its new host
+        self.index.update('compute.instance.rebuild.end',
+                          _payload('uuid1', 'compute2'))
+        self.assertEqual([], self.index.get_by_host('compute1'))
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute2')))
+        # the payloads without metadata are ignored
+        self.index.update('compute.instance.update',
+                          {'instance_id': 'uuid1', 'host': 'compute3'})
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute2')))
+        self.index.update('compute.instance.delete.end',
+                          {'instance_id': 'uuid1'})
+        self.assertEqual(0, len(self.index))
+
+    def test_update_shelve_and_revert(self):
+        self.index.update('compute.instance.create.end',
+                          _payload('uuid1', 'compute1'))
+        # an offloaded instance has no host
+        self.index.update('compute.instance.shelve_offload.end',
+                          _payload('uuid1', None, state='shelved_offloaded'))
+        self.assertEqual(0, len(self.index))
+        self.index.update('compute.instance.unshelve.end',
+                          _payload('uuid1', 'compute2'))
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute2')))
+        self.index.update('compute.instance.finish_resize.end',
+                          _payload('uuid1', 'compute3'))
+        self.index.update('compute.instance.resize.revert.end',
+                          _payload('uuid1', 'compute2'))
+        self.assertEqual([], self.index.get_by_host('compute3'))
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute2')))
+
+    def test_refresh(self):
+        self.index.update('compute.instance.create.end',
+                          _payload('uuid1', 'compute1'))
+        # the notification of the evacuation was lost
+        self.index.refresh(_row(1, 'uuid1', 'compute2'))
+        self.assertEqual([], self.index.get_by_host('compute1'))
+        self.assertEqual(['uuid1'],
+                         _uuids(self.index.get_by_host('compute2')))
+
+    @mock.patch.object(ha_db_api, 'instance_get_ha_enabled_page')
+    def test_notifications_while_seeding(self, mock_page):
+        def fake_page(context, marker=None, limit=None):
+            # the notifications are newer than the rows
+            self.index.update('compute.instance.delete.end',
+                              {'instance_id': 'uuid1'})
+            self.index.update('compute.instance.create.end',
+                              _payload('uuid2', 'compute2'))
+            return [_row(1, 'uuid1', 'compute1')]
+
+        mock_page.side_effect = fake_page
+        self.index.seed('ctxt')
+        self.assertEqual([], self.index.get_by_host('compute1'))
+        self.assertEqual(['uuid2'],
+                         _uuids(self.index.get_by_host('compute2')))
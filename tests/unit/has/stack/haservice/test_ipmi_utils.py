@@ -55,6 +55,8 @@ node1.metrics = json.dumps(metrics)
 class IpmiUtilsTestCase(test.TestCase):
     def setUp(self):
         super(IpmiUtilsTestCase, self).setUp()
+        ipmi_utils._session_pool.clear()
+        self.addCleanup(ipmi_utils._session_pool.clear)
 
     def test_get_bmc(self):
         result = ipmi_utils.get_bmc(node1)
@@ -73,3 +75,46 @@ class IpmiUtilsTestCase(test.TestCase):
         mock_command.assert_called_once_with(bmc='bmc', userid='user',
                                              password='password')
         self.assertTrue(mock_ipmi.get_power.called)
+
+    @mock.patch.object(command, 'Command')
+    def test_ipmi_session_reused(self, mock_command):
+        mock_ipmi = mock.Mock()
+        mock_ipmi.ipmi_session.broken = False
+        mock_command.return_value = mock_ipmi
+        with ipmi_utils.ipmi_session('bmc', 'user', 'password') as ipmicmd:
+            ipmicmd.get_power()
+        with ipmi_utils.ipmi_session('bmc', 'user', 'password') as ipmicmd:
+            ipmicmd.set_power('off')
+        self.assertEqual(1, mock_command.call_count)
+
+    @mock.patch.object(command, 'Command')
+    def test_ipmi_session_broken_evicted(self, mock_command):
+        mock_ipmi = mock.Mock()
+        mock_ipmi.ipmi_session.broken = True
+        mock_command.return_value = mock_ipmi
+        for i in range(2):
+            with ipmi_utils.ipmi_session('bmc', 'user', 'password'):
+                pass
+        self.assertEqual(2, mock_command.call_count)
+        self.assertEqual(2, mock_ipmi.ipmi_session.logout.call_count)
+
+    @mock.patch.object(command, 'Command')
+    def test_ipmi_session_evicted_on_error(self, mock_command):
+        mock_ipmi = mock.Mock()
+        mock_ipmi.ipmi_session.broken = False
+        mock_ipmi.get_power.side_effect = [Exception('timeout'),
+                                           {'powerstate': 'off'}]
+        mock_command.return_value = mock_ipmi
+        self.assertRaises(Exception, ipmi_utils.get_power, node1)
+        self.assertEqual('off', ipmi_utils.get_power(node1))
+        self.assertEqual(2, mock_command.call_count)
+
+    @mock.patch.object(command, 'Command')
+    def test_ipmi_session_password_changed(self, mock_command):
+        with ipmi_utils.ipmi_session('bmc', 'user', 'password'):
+            pass
+        with ipmi_utils.ipmi_session('bmc', 'user', 'new-password'):
+            pass
+        mock_command.assert_called_with(bmc='bmc', userid='user',
+                                        password='new-password')
+        self.assertEqual(2, mock_command.call_count)
@@ -0,0 +1,53 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for move_deadlines.
+"""
+import mock
+
+from hastack.has.stack.haservice import move_deadlines
+from nova import test
+
+
+@mock.patch.object(move_deadlines.time, 'time')
+class MoveDeadlinesTestCase(test.TestCase):
+    def setUp(self):
+        super(MoveDeadlinesTestCase, self).setUp()
+        self.flags(has_ha_timeout_seconds=60)
+        self.deadlines = move_deadlines.MoveDeadlines()
+
+    def test_pop_expired(self, mock_time):
+        mock_time.return_value = 100
+        self.deadlines.add('uuid1', 'compute1', name='vm1')
+        self.deadlines.add('uuid2', 'compute2', started_at=120)
+        self.assertEqual([], self.deadlines.pop_expired(159))
+        self.assertEqual([('uuid1', 'compute1', 'vm1')],
+                         self.deadlines.pop_expired(160))
+        mock_time.return_value = 200
+        self.assertEqual([('uuid2', 'compute2', None)],
+                         self.deadlines.pop_expired())
+        self.assertEqual(0, len(self.deadlines))
+
+    def test_discard_and_move_again(self, mock_time):
+        mock_time.return_value = 100
+        self.deadlines.add('uuid1', 'compute1')
+        self.deadlines.add('uuid2', 'compute1')
+        self.deadlines.discard('uuid2')
+        self.assertNotIn('uuid2', self.deadlines)
+        # the earlier deadline of uuid1 is superseded
+        self.deadlines.add('uuid1', 'compute1', started_at=150)
+        self.assertEqual([], self.deadlines.pop_expired(200))
+        self.assertEqual([('uuid1', 'compute1', None)],
+                         self.deadlines.pop_expired(210))
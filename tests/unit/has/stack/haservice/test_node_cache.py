@@ -0,0 +1,109 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for node_cache.
+"""
+import datetime
+
+import mock
+
+from hastack.has.stack.haservice import constants
+from hastack.has.stack.haservice import node_cache
+import hastack.openstack.openstack_api.db_api as db_api
+from nova import test
+
+
+def _row(node_id, updated_at=None, deleted=0):
+    return {'id': node_id,
+            'host': 'compute%d' % node_id,
+            'hypervisor_hostname': 'compute%d' % node_id,
+            'hypervisor_type': 'QEMU',
+            'created_at': datetime.datetime(2016, 1, 1),
+            'updated_at': updated_at,
+            'deleted_at': updated_at if deleted else None,
+            'deleted': deleted}
+
+
+class ComputeNodeCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(ComputeNodeCacheTestCase, self).setUp()
+        self.cache = node_cache.ComputeNodeCache()
+
+    @mock.patch.object(db_api, 'compute_node_get_all_changed_since')
+    def test_refresh_full(self, mock_get):
+        mock_get.return_value = [_row(1), _row(2)]
+        nodes = self.cache.refresh('ctxt')
+        mock_get.assert_called_once_with('ctxt')
+        self.assertEqual([1, 2], sorted(node['id'] for node in nodes))
+
+    @mock.patch.object(db_api, 'compute_node_get_all_changed_since')
+    def test_refresh_incremental(self, mock_get):
+        updated_at = datetime.datetime(2016, 1, 2)
+        mock_get.return_value = [_row(1), _row(2, updated_at)]
+        self.cache.refresh('ctxt')
+
+        mock_get.reset_mock()
+        changed = _row(1, datetime.datetime(2016, 1, 3))
+        mock_get.return_value = [changed,
+                                 _row(2, datetime.datetime(2016, 1, 3),
+                                      deleted=1)]
+        nodes = self.cache.refresh('ctxt')
+        since = updated_at - datetime.timedelta(
+            seconds=constants.NODE_CACHE_WATERMARK_MARGIN)
+        mock_get.assert_called_once_with('ctxt', since)
+        self.assertEqual([changed], nodes)
+
+    @mock.patch.object(db_api, 'compute_node_get_all_changed_since')
+    def test_refresh_full_sync_interval(self, mock_get):
+        self.flags(ha_node_cache_full_sync_interval=0)
+        mock_get.return_value = [_row(1)]
+        self.cache.refresh('ctxt')
+        mock_get.return_value = [_row(2)]
+        nodes = self.cache.refresh('ctxt')
+        self.assertEqual([2], [node['id'] for node in nodes])
+        mock_get.assert_called_with('ctxt')
+
+
+class NodeAttributesCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(NodeAttributesCacheTestCase, self).setUp()
+        self.cache = node_cache.NodeAttributesCache()
+        self.node = _row(1, datetime.datetime(2016, 1, 2))
+        self.node['stats'] = '{"%s": "3"}' % constants.PARALLEL_REBUILD
+        self.node['metrics'] = ('[{"name": "bmc", "value": "10.0.0.1"}, '
+                                '{"name": "user", "value": "admin"}]')
+
+    def test_get(self):
+        attrs = self.cache.get(self.node)
+        self.assertEqual(3, attrs.parallel_rebuild)
+        self.assertEqual(constants.DEFAULT_PARALLEL_DEST_REBUILD,
+                         attrs.parallel_dest_rebuild)
+        self.assertEqual(('10.0.0.1', 'admin', ''),
+                         (attrs.bmc, attrs.user, attrs.password))
+
+    @mock.patch.object(node_cache, 'parse_node_attributes')
+    def test_get_cached_until_updated(self, mock_parse):
+        self.cache.get(self.node)
+        self.cache.get(self.node)
+        self.assertEqual(1, mock_parse.call_count)
+        self.node['updated_at'] = datetime.datetime(2016, 1, 3)
+        self.cache.get(self.node)
+        self.assertEqual(2, mock_parse.call_count)
+
+    def test_get_without_stats(self):
+        attrs = self.cache.get(_row(2))
+        self.assertEqual(constants.DEFAULT_PARALLEL_REBUILD,
+                         attrs.parallel_rebuild)
+        self.assertEqual('', attrs.bmc)
@@ -0,0 +1,122 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for notification.
+"""
+import eventlet
+import oslo_messaging as messaging
+
+from hastack.has.stack.haservice import notification
+from nova import test
+
+
+def _message(request_id, event_type, inst_uuid):
+    return {'ctxt': {'request_id': request_id},
+            'publisher_id': 'compute.compute1',
+            'event_type': event_type,
+            'payload': {'instance_id': inst_uuid},
+            'metadata': {}}
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.batches = []
+
+    def handle_notifications(self, events):
+        self.batches.append([(context.request_id, event_type,
+                              payload['instance_id'])
+                             for context, event_type, payload in events])
+
+
+class NotificationConsumerTestCase(test.TestCase):
+    def setUp(self):
+        super(NotificationConsumerTestCase, self).setUp()
+        self.flags(ha_notification_workers=2, ha_notification_queue_size=3,
+                   ha_notification_batch_size=2,
+                   ha_notification_topics=['notifications'])
+        self.engine = FakeEngine()
+        self.consumer = notification.NotificationConsumer(self.engine)
+
+    def test_put_keeps_ha_moves(self):
+        self.consumer.put([
+            _message('has-ha-req1', 'compute.instance.update', 'uuid1'),
+            _message('req-2', 'compute.instance.update', 'uuid2'),
+            _message('has-ha-req1', 'compute.instance.rebuild.end',
+                     'uuid1')])
+        self.assertEqual(2, sum(self.consumer.queue_depths()))
+        # both notifications of uuid1 are queued to the same worker
+        self.assertIn(2, self.consumer.queue_depths())
+
+    def test_workers_handle_batches_in_order(self):
+        self.consumer.put([
+            _message('has-ha-req1', 'compute.instance.update', 'uuid1'),
+            _message('has-ha-req1', 'compute.instance.update', 'uuid1'),
+            _message('has-ha-req1', 'compute.instance.rebuild.end',
+                     'uuid1')])
+        self.consumer._workers = [eventlet.spawn(self.consumer._work, queue)
+                                  for queue in self.consumer._queues]
+        self.consumer.stop()
+        self.assertEqual(
+            [[('has-ha-req1', 'compute.instance.update', 'uuid1'),
+              ('has-ha-req1', 'compute.instance.update', 'uuid1')],
+             [('has-ha-req1', 'compute.instance.rebuild.end', 'uuid1')]],
+            self.engine.batches)
+
+    def test_put_blocks_while_queue_full(self):
+        messages = [_message('has-ha-req1', 'compute.instance.update',
+                             'uuid1')] * 4
+        putter = eventlet.spawn(self.consumer.put, messages)
+        eventlet.sleep(0)
+        self.assertEqual(3, max(self.consumer.queue_depths()))
+        self.assertFalse(putter.dead)
+        self.consumer._workers = [eventlet.spawn(self.consumer._work, queue)
+                                  for queue in self.consumer._queues]
+        putter.wait()
+        self.consumer.stop()
+        self.assertEqual(4, sum(len(batch) for batch in self.engine.batches))
+
+    def test_fake_transport(self):
+        transport = messaging.get_notification_transport(
+            notification.CONF, url='fake:')
+        consumer = notification.NotificationConsumer(self.engine,
+                                                     transport=transport)
+        consumer.start()
+        notifier = messaging.Notifier(transport, 'compute.compute1',
+                                      driver='messaging',
+                                      topics=['notifications'])
+        notifier.info({'request_id': 'req-2'}, 'compute.instance.rebuild.end',
+                      {'instance_id': 'uuid2'})
+        notifier.info({'request_id': 'has-ha-req1'},
+                      'compute.instance.exists', {'instance_id': 'uuid1'})
+        notifier.info({'request_id': 'has-ha-req1'},
+                      'compute.instance.rebuild.end',
+                      {'instance_id': 'uuid1'})
+        with eventlet.Timeout(10):
+            while not self.engine.batches:
+                eventlet.sleep(0.1)
+        consumer.stop()
+        self.assertEqual(
+            [[('has-ha-req1', 'compute.instance.rebuild.end', 'uuid1')]],
+            self.engine.batches)
+
+    def test_filter_index_events(self):
+        rule = notification.NotificationEndpoint.filter_rule
+        for event_type in ('compute.instance.resize.revert.end',
+                           'compute.instance.unshelve.end',
+                           'compute.instance.shelve_offload.end'):
+            self.assertTrue(rule.match({}, 'compute.compute1', event_type,
+                                       {}, {}))
+        self.assertFalse(rule.match({}, 'compute.compute1',
+                                    'compute.instance.exists', {}, {}))
@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for placement.
+"""
+import mock
+
+from hastack.has.stack.haservice import placement
+import hastack.openstack.openstack_constants as openstack_constants
+from nova import test
+
+INSTANCES = [
+    {'uuid': 'uuid1', 'instance_type_id': 1, 'image_ref': 'image1'},
+    {'uuid': 'uuid2', 'instance_type_id': 2, 'image_ref': 'image1'},
+    {'uuid': 'uuid3', 'instance_type_id': 1, 'image_ref': 'image1'},
+]
+
+
+def _destination(host):
+    return {'host': host, 'nodename': host}
+
+
+@mock.patch.object(placement.openstack_utils, 'setup_instance_group')
+@mock.patch.object(placement.openstack_utils, 'build_request_spec',
+                   side_effect=lambda ctxt, img, insts:
+                   {'num_instances': len(insts)})
+@mock.patch.object(placement.ha_utils, 'get_image_from_inst')
+class PlacementPlannerTestCase(test.TestCase):
+    def setUp(self):
+        super(PlacementPlannerTestCase, self).setUp()
+        self.compute_api = mock.Mock()
+        self.compute_api.create_request_spec.side_effect = (
+            lambda ctxt, spec, props: spec['num_instances'])
+        self.scheduler_rpcapi = mock.Mock()
+        self.planner = placement.PlacementPlanner(self.compute_api,
+                                                  self.scheduler_rpcapi)
+
+    def test_place_grouped(self, mock_image, mock_spec, mock_group):
+        self.scheduler_rpcapi.select_destinations.side_effect = (
+            lambda ctxt, num: [_destination('compute2')] * num)
+        plan = self.planner.place('ctxt', INSTANCES,
+                                  {'ignore_hosts': ['compute1']})
+        # one request per flavor instead of one per instance
+        self.assertEqual(2, self.scheduler_rpcapi.select_destinations.
+                         call_count)
+        mock_spec.assert_any_call('ctxt', mock_image.return_value,
+                                  [INSTANCES[0], INSTANCES[2]])
+        self.assertEqual([(INSTANCES[0], _destination('compute2'), None),
+                          (INSTANCES[2], _destination('compute2'), None),
+                          (INSTANCES[1], _destination('compute2'), None)],
+                         plan)
+
+    def test_place_batch_size(self, mock_image, mock_spec, mock_group):
+        self.flags(ha_placement_batch_size=1)
+        self.scheduler_rpcapi.select_destinations.return_value = [
+            _destination('compute2')]
+        plan = self.planner.place('ctxt', INSTANCES, {})
+        self.assertEqual(3, self.scheduler_rpcapi.select_destinations.
+                         call_count)
+        self.assertEqual(3, len(plan))
+
+    def test_place_no_valid_host(self, mock_image, mock_spec, mock_group):
+        def fake_select_destinations(ctxt, num):
+            if num > 1:
+                raise openstack_constants.NoValidHost(reason='')
+            return [_destination('compute2')]
+
+        self.scheduler_rpcapi.select_destinations.side_effect = (
+            fake_select_destinations)
+        plan = self.planner.place('ctxt', INSTANCES[:1] + INSTANCES[2:], {})
+        # the failed batch is placed one instance at a time
+        self.assertEqual(3, self.scheduler_rpcapi.select_destinations.
+                         call_count)
+        self.assertEqual([(INSTANCES[0], _destination('compute2'), None),
+                          (INSTANCES[2], _destination('compute2'), None)],
+                         plan)
+
+    def test_place_error(self, mock_image, mock_spec, mock_group):
+        ex = Exception('timeout')
+        self.scheduler_rpcapi.select_destinations.side_effect = ex
+        plan = self.planner.place('ctxt', INSTANCES[:1], {})
+        self.assertEqual([(INSTANCES[0], None, ex)], plan)
@@ -0,0 +1,101 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for probe_scheduler.
+"""
+import mock
+
+from hastack.has.stack.haservice import probe_scheduler
+from nova import test
+
+
+@mock.patch.object(probe_scheduler.time, 'time')
+class ProbeSchedulerTestCase(test.TestCase):
+    def setUp(self):
+        super(ProbeSchedulerTestCase, self).setUp()
+        self.flags(ha_period_interval=30, ha_probe_suspect_interval=5,
+                   ha_probe_jitter=0.2)
+        self.scheduler = probe_scheduler.ProbeScheduler()
+
+    def test_new_hosts_due_at_once(self, mock_time):
+        mock_time.return_value = 100
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.assertEqual(['compute1', 'compute2'],
+                         sorted(self.scheduler.pop_due()))
+        self.assertEqual([], self.scheduler.pop_due())
+        # hosts being probed are not added again
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.assertIsNone(self.scheduler.next_deadline())
+
+    @mock.patch.object(probe_scheduler.random, 'uniform')
+    def test_schedule_jitter(self, mock_uniform, mock_time):
+        mock_time.return_value = 100
+        mock_uniform.return_value = 1.1
+        self.scheduler.sync(['compute1'])
+        self.scheduler.pop_due()
+        self.scheduler.schedule('compute1')
+        mock_uniform.assert_called_once_with(0.8, 1.2)
+        self.assertEqual(133, self.scheduler.next_deadline())
+        mock_time.return_value = 132
+        self.assertEqual([], self.scheduler.pop_due())
+        mock_time.return_value = 133
+        self.assertEqual(['compute1'], self.scheduler.pop_due())
+
+    def test_schedule_suspect(self, mock_time):
+        mock_time.return_value = 100
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.scheduler.pop_due()
+        self.scheduler.schedule('compute1')
+        self.scheduler.schedule('compute2', suspect=True)
+        mock_time.return_value = 105
+        self.assertEqual(['compute2'], self.scheduler.pop_due())
+
+    def test_reschedule_and_remove(self, mock_time):
+        mock_time.return_value = 100
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.scheduler.pop_due()
+        self.scheduler.schedule('compute1', suspect=True)
+        self.scheduler.schedule('compute2', suspect=True)
+        # the earlier deadline of compute1 is superseded
+        self.scheduler.schedule('compute1')
+        self.scheduler.sync(['compute1'])
+        mock_time.return_value = 110
+        self.assertEqual([], self.scheduler.pop_due())
+
+    def test_expedite(self, mock_time):
+        mock_time.return_value = 100
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.scheduler.pop_due()
+        self.scheduler.schedule('compute1')
+        self.scheduler.schedule('compute2', suspect=True)
+        self.scheduler.expedite('compute1')
+        # compute2 is probed soon anyway
+        self.scheduler.expedite('compute2')
+        self.assertEqual(['compute1'], self.scheduler.pop_due())
+        self.scheduler.expedite('compute1')
+        self.assertEqual([], self.scheduler.pop_due())
+
+    def test_schedule_popped(self, mock_time):
+        mock_time.return_value = 100
+        self.scheduler.sync(['compute1', 'compute2'])
+        self.scheduler.pop_due()
+        self.scheduler.schedule('compute1')
+        self.scheduler.schedule_popped(['compute1', 'compute2', 'compute3'],
+                                       suspect=True)
+        # compute1 keeps its deadline and the unknown compute3 is ignored
+        mock_time.return_value = 105
+        self.assertEqual(['compute2'], self.scheduler.pop_due())
+        mock_time.return_value = 200
+        self.assertEqual(['compute1'], self.scheduler.pop_due())
@@ -0,0 +1,57 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for rate_limiter.
+"""
+import mock
+
+from hastack.has.stack.haservice import rate_limiter
+from nova import test
+
+
+class TokenBucketTestCase(test.TestCase):
+    @mock.patch.object(rate_limiter.time, 'time')
+    def test_consume(self, mock_time):
+        mock_time.return_value = 100
+        bucket = rate_limiter.TokenBucket(2, 3)
+        for _i in range(3):
+            self.assertEqual(0, bucket.consume())
+        self.assertEqual(0.5, bucket.consume())
+        mock_time.return_value = 100.5
+        self.assertEqual(0, bucket.consume())
+        # the bucket never holds more than the burst
+        mock_time.return_value = 200
+        for _i in range(3):
+            self.assertEqual(0, bucket.consume())
+        self.assertNotEqual(0, bucket.consume())
+
+    def test_unlimited(self):
+        bucket = rate_limiter.TokenBucket(0, 1)
+        for _i in range(10):
+            self.assertEqual(0, bucket.consume())
+
+
+class FairQueueTestCase(test.TestCase):
+    def test_round_robin(self):
+        queue = rate_limiter.FairQueue()
+        for item in ('a1', 'a2', 'a3'):
+            queue.put('compute1', item)
+        queue.put('compute2', 'b1')
+        self.assertEqual(4, len(queue))
+        self.assertEqual({'compute1': 3, 'compute2': 1}, queue.depths())
+        self.assertEqual(['a1', 'b1', 'a2', 'a3'],
+                         [queue.get() for _i in range(4)])
+        self.assertEqual(0, len(queue))
+        self.assertEqual({}, queue.depths())
@@ -0,0 +1,80 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for rebuild_ledger.
+"""
+import mock
+
+from hastack.has.stack.haservice import rebuild_ledger
+import hastack.openstack.openstack_api.db_api as db_api
+import hastack.openstack.openstack_constants as openstack_constants
+from nova import test
+
+
+class RebuildLedgerTestCase(test.TestCase):
+    def setUp(self):
+        super(RebuildLedgerTestCase, self).setUp()
+        self.ledger = rebuild_ledger.RebuildLedger()
+
+    @mock.patch.object(db_api, 'instance_get_hosts_by_task_states')
+    def test_seed(self, mock_hosts):
+        mock_hosts.return_value = {'uuid1': 'compute2', 'uuid2': 'compute1',
+                                   'uuid3': 'compute1'}
+        self.ledger.add('uuid1', 'compute1', 'compute2')
+        self.ledger.seed('ctxt')
+        mock_hosts.assert_called_once_with(
+            'ctxt', openstack_constants.REBUILD_TASK_STATES)
+        # uuid1 is still rebuilding and only counted once
+        self.assertIn('uuid1', self.ledger)
+        self.assertEqual(3, self.ledger.count_source('compute1'))
+        self.assertEqual(1, self.ledger.count_dest('compute2'))
+
+    @mock.patch.object(rebuild_ledger.time, 'time')
+    def test_reconcile_drops_finished(self, mock_time):
+        mock_time.return_value = 100
+        self.ledger.add('uuid1', 'compute1', 'compute2')
+        mock_time.return_value = 200
+        self.ledger.add('uuid2', 'compute1', 'compute2')
+        # uuid2 was started after the poll and must not be dropped yet
+        self.ledger.reconcile({}, 150)
+        self.assertNotIn('uuid1', self.ledger)
+        self.assertIn('uuid2', self.ledger)
+        self.assertEqual(1, self.ledger.count_source('compute1'))
+        self.assertEqual(1, self.ledger.count_dest('compute2'))
+
+    @mock.patch.object(rebuild_ledger.time, 'time')
+    def test_reconcile_keeps_queued(self, mock_time):
+        mock_time.return_value = 100
+        self.ledger.add('uuid1', 'compute1', 'compute2', queued=True)
+        self.ledger.reconcile({}, 150)
+        # the database does not know the queued rebuild yet
+        self.assertIn('uuid1', self.ledger)
+        mock_time.return_value = 160
+        self.ledger.start('uuid1')
+        self.assertEqual({'uuid1': ('compute1', 'compute2', 160)},
+                         self.ledger.inflight())
+        self.ledger.reconcile({}, 170)
+        self.assertNotIn('uuid1', self.ledger)
+
+    def test_add_remove(self):
+        self.ledger.reconcile({'uuid0': 'compute1'}, 100)
+        self.ledger.add('uuid1', 'compute1', 'compute2')
+        self.ledger.add('uuid1', 'compute1', 'compute2')
+        self.assertEqual(2, self.ledger.count_source('compute1'))
+        self.assertEqual(1, self.ledger.count_dest('compute2'))
+        self.assertTrue(self.ledger.remove('uuid1'))
+        self.assertFalse(self.ledger.remove('uuid1'))
+        self.assertEqual(1, self.ledger.count_source('compute1'))
+        self.assertEqual(0, self.ledger.count_dest('compute2'))
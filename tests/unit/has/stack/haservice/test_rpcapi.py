@@ -52,30 +52,6 @@ class HAPolicyAPITestCase(test.TestCase):
             self.assertEqual(prepare_mock.call_count, 1)
             rpc_mock.assert_called_once_with(ctxt, method, **kwargs)
 
-    def test_get_all(self):
-        self._test_hapolicy_api('get_all', 'call')
-
-    def test_get(self):
-        self._test_hapolicy_api('get', 'call', policy_id='policy_id')
-
-    def test_update(self):
-        self._test_hapolicy_api('update', 'call', policy_id='policy_id',
-                                updates='updates')
-
-    def test_set_maintenance(self):
-        self._test_hapolicy_api('set_maintenance', 'call',
-                                hv_name='hv_name',
-                                status='status', migrate='migrate',
-                                target_host='target_host')
-
-    def test_get_hv_status(self):
-        self._test_hapolicy_api('get_hv_status', 'call')
-
-    def test_hypervisor_list(self):
-        self._test_hapolicy_api('hypervisor_list', 'call',
-                                search_opts='search_opts')
-
-    def test_event_list(self):
-        self._test_hapolicy_api('event_list', 'call',
-                                search_opts='search_opts',
-                                marker='marker', limit='limit')
+    def test_host_suspect(self):
+        self._test_hapolicy_api('host_suspect', 'cast', hv_name='hv_name',
+                                reason='reason')
@@ -0,0 +1,73 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for service_snapshot.
+"""
+import mock
+
+from hastack.has.stack.haservice import service_snapshot
+from nova import test
+
+
+SERVICES = [
+    {'host': 'compute1', 'is_up': True},
+    {'host': 'compute2', 'is_up': False},
+]
+
+NODES = [
+    {'host': 'compute1', 'hypervisor_hostname': 'compute1.local'},
+    {'host': 'compute2', 'hypervisor_hostname': 'compute2.local'},
+]
+
+
+class ServiceSnapshotTestCase(test.TestCase):
+    def setUp(self):
+        super(ServiceSnapshotTestCase, self).setUp()
+        self.is_up = mock.Mock(side_effect=lambda svc: svc['is_up'])
+        self.snapshot = service_snapshot.ServiceSnapshot(SERVICES,
+                                                         self.is_up, NODES)
+
+    def test_load(self):
+        compute_api = mock.Mock()
+        compute_api.get_all_compute_services.return_value = SERVICES
+        snapshot = service_snapshot.ServiceSnapshot.load('ctxt', compute_api,
+                                                         NODES)
+        compute_api.get_all_compute_services.assert_called_once_with('ctxt')
+        self.assertEqual(SERVICES[0], snapshot.get('compute1'))
+
+    def test_is_up(self):
+        self.assertTrue(self.snapshot.is_up('compute1'))
+        self.assertFalse(self.snapshot.is_up('compute2'))
+        self.assertFalse(self.snapshot.is_up('compute3'))
+
+    def test_is_up_cached(self):
+        self.snapshot.is_up('compute1')
+        self.snapshot.is_up('compute1')
+        self.assertEqual(1, self.is_up.call_count)
+
+    def test_hypervisor_is_up(self):
+        self.assertTrue(self.snapshot.has_hypervisor('compute1.local'))
+        self.assertEqual('compute2', self.snapshot.get_host('compute2.local'))
+        self.assertTrue(self.snapshot.hypervisor_is_up('compute1.local'))
+        self.assertFalse(self.snapshot.hypervisor_is_up('compute2.local'))
+        self.assertFalse(self.snapshot.hypervisor_is_up('compute3.local'))
+
+    def test_heartbeats(self):
+        snapshot = service_snapshot.ServiceSnapshot(
+            [{'host': 'compute1', 'last_seen_up': 3, 'updated_at': 2},
+             {'host': 'compute2', 'updated_at': None, 'created_at': 1},
+             {'host': 'compute3'}], self.is_up)
+        self.assertEqual([('compute1', 3), ('compute2', 1)],
+                         sorted(snapshot.heartbeats()))
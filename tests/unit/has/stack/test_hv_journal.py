@@ -0,0 +1,126 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Test suite for hv_journal.
+"""
+import os
+
+import fixtures
+
+from hastack.has.stack.haservice import constants
+from hastack.has.stack import hv_journal
+from nova import test
+
+
+class StatusJournalTestCase(test.TestCase):
+    def setUp(self):
+        super(StatusJournalTestCase, self).setUp()
+        self.path = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                 'status.json')
+        self.journal = hv_journal.StatusJournal(self.path)
+        self.status, intact = self.journal.load()
+        self.assertTrue(intact)
+
+    def _load(self):
+        return hv_journal.StatusJournal(self.path).load()
+
+    def test_replay(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        self.status.set_ha_moving_inst_start('hostname1', 'inst1', 100.5)
+        self.status.set_ha('hostname2', constants.STATE_HA_STARTED)
+        self.status.set_ha('hostname2', constants.STATE_OK)
+        self.assertTrue(self.journal.flush())
+        self.assertFalse(self.journal.flush())
+        self.assertEqual(4, self.journal.records)
+
+        status, intact = self._load()
+        self.assertTrue(intact)
+        self.assertEqual(self.status.get_json(), status.get_json())
+
+    def test_unchanged_fields_not_recorded(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        self.status.set_ha_moving_insts('hostname1', {'inst1': 'host2'})
+        self.journal.flush()
+        self.status.set_ha_moving_insts('hostname1', {'inst1': 'host2'})
+        self.assertFalse(self.journal.flush())
+
+    def test_items_recorded_one_by_one(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_REBUILDING)
+        self.status.set_ha_moving_insts('hostname1', {'inst1': 'host2',
+                                                      'inst2': 'host3'})
+        self.journal.flush()
+        records = self.journal.records
+        self.status.set_ha_moving_insts('hostname1', {'inst2': 'host3',
+                                                      'inst3': 'host2'})
+        self.journal.flush()
+        # inst1 popped and inst3 set, inst2 left alone
+        self.assertEqual(records + 2, self.journal.records)
+
+        status, intact = self._load()
+        self.assertTrue(intact)
+        self.assertEqual({'inst2': 'host3', 'inst3': 'host2'},
+                         status.get_ha_moving_insts('hostname1'))
+        self.assertEqual(self.status.get_json(), status.get_json())
+
+    def test_items_copied(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        action = {'vm_uuid': 'inst1'}
+        self.status.set_ha_actions('hostname1', {'req-1': action})
+        self.journal.flush()
+        action['action_result'] = 'success'
+        self.status.set_ha_actions('hostname1', {'req-1': action})
+        self.journal.flush()
+
+        status, intact = self._load()
+        self.assertEqual({'req-1': action},
+                         status.get_ha_actions('hostname1'))
+
+    def test_compact(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        self.journal.flush()
+        self.journal.compact(self.status)
+        self.assertEqual(0, os.path.getsize(self.journal.journal_path))
+        self.status.set_ha_moving_insts('hostname1', {'inst1': 'host2'})
+        self.journal.flush()
+
+        status, intact = self._load()
+        self.assertEqual(self.status.get_json(), status.get_json())
+
+    def test_replay_skips_compacted_changes(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        self.journal.flush()
+        with open(self.journal.journal_path) as f:
+            journal = f.read()
+        self.status.set_ha('hostname1', constants.STATE_HA_REBUILDING)
+        self.journal.compact(self.status)
+        # the service stopped before the journal was truncated
+        with open(self.journal.journal_path, 'w') as f:
+            f.write(journal)
+
+        status, intact = self._load()
+        self.assertEqual(constants.STATE_HA_REBUILDING,
+                         status.get_ha('hostname1'))
+
+    def test_truncated_journal(self):
+        self.status.set_ha('hostname1', constants.STATE_HA_STARTED)
+        self.journal.flush()
+        with open(self.journal.journal_path, 'a') as f:
+            f.write('[2, "upd')
+
+        status, intact = self._load()
+        self.assertFalse(intact)
+        self.assertEqual(constants.STATE_HA_STARTED,
+                         status.get_ha('hostname1'))
@@ -53,7 +53,7 @@ class HypervisorStatusTestCase(test.TestCase):
         self.assertEqual(start, '20140716')
 
     def test_get_ha_failed_instances(self):
-        self.hv_status.ha_hvs.update({'hostname1': {}})
+        self.hv_status.set_ha('hostname1', constants.STATE_HA_STARTED)
         self.hv_status.set_ha_failed_instances('hostname1',
                                                ['uuid1', 'uuid2'])
         failed_insts = self.hv_status.get_ha_failed_instances('hostname1')
@@ -63,7 +63,7 @@ class HypervisorStatusTestCase(test.TestCase):
         self.hv_status.set_ha_failed_instances('hostname1',
                                                ['uuid1', 'uuid2'])
         self.assertEqual(
-            self.hv_status.ha_hvs['hostname1']['failed_instances'],
+            self.hv_status.ha_hvs['hostname1'].failed_instances,
             ['uuid1', 'uuid2'])
 
     def test_set_ha(self):
@@ -89,3 +89,36 @@ class HypervisorStatusTestCase(test.TestCase):
         managed_hosts = set(['hostname1'])
         self.hv_status.refresh(managed_hosts)
         self.assertFalse('hostname2' in self.hv_status.ha_hvs)
+
+    def test_ha_retries_and_actions(self):
+        self.assertEqual(self.hv_status.get_ha_retries('hostname2'), {})
+        self.hv_status.set_ha_retries('hostname2', {'inst1': 2})
+        self.hv_status.set_ha_actions('hostname2', {'req-1': {}})
+        self.assertEqual(self.hv_status.get_ha_retries('hostname2'),
+                         {'inst1': 2})
+        self.assertEqual(self.hv_status.get_ha_actions('hostname2'),
+                         {'req-1': {}})
+        self.assertEqual(self.hv_status.get_ha_actions('hostname3'), {})
+
+    def test_json_adapter(self):
+        json = {
+            'version': '2.0',
+            'ha': {
+                'hostname1': {
+                    'state': constants.STATE_HA_REBUILDING,
+                    'created_at': '2016-01-01T00:00:00.000000',
+                    'updated_at': '2016-01-01T00:00:01.500000',
+                    'moving_insts': {'inst1': 'hostname2'},
+                    'inst_start': {'inst1': 1451606400.5}
+                }
+            }
+        }
+        status = hv_status.HypervisorStatus(json)
+        record = status.ha_hvs['hostname1']
+        self.assertEqual(1451606401.5, record.updated_at)
+        self.assertIs(constants.STATE_HA_REBUILDING, record.state)
+        self.assertIsNone(record.failed_instances)
+        self.assertEqual(json, status.get_json())
+        self.assertEqual({'created_at': '2016-01-01T00:00:00.000000',
+                          'updated_at': '2016-01-01T00:00:01.500000'},
+                         status.get_ha_timestamp('hostname1'))
@@ -0,0 +1 @@
+# Copyright (c) 2016 Fiberhome
@@ -0,0 +1,73 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Test suite for openstack_utils.
+"""
+import mock
+
+import hastack.openstack.openstack_utils as openstack_utils
+from nova import test
+
+CATALOG = [{'type': 'compute', 'name': 'nova',
+            'endpoints': [{'region': 'RegionOne', 'interface': 'public',
+                           'url': 'http://nova'}]}]
+
+
+class ContextProviderTestCase(test.TestCase):
+    def setUp(self):
+        super(ContextProviderTestCase, self).setUp()
+        self.fallback = mock.Mock()
+        self.provider = openstack_utils.ContextProvider(self.fallback)
+        self.auth_plugin = mock.Mock()
+        self.access_info = self.auth_plugin.get_access.return_value
+        self.access_info.auth_token = 'token1'
+        self.access_info.service_catalog.catalog = CATALOG
+        self.access_info.will_expire_soon.return_value = False
+        self.session = mock.Mock()
+        self.stub_out('hastack.openstack.openstack_utils.create_auth_plugin',
+                      mock.Mock(return_value=self.auth_plugin))
+        self.stub_out('hastack.openstack.openstack_utils.'
+                      'create_client_session',
+                      mock.Mock(return_value=self.session))
+
+    def test_token_reused(self):
+        ctxt1 = self.provider.get_context()
+        ctxt2 = self.provider.get_context()
+        self.auth_plugin.get_access.assert_called_once_with(self.session)
+        openstack_utils.create_client_session.assert_called_once_with(
+            mock.ANY, mock.ANY, auth=self.auth_plugin)
+        self.assertEqual('token1', ctxt2.auth_token)
+        self.assertEqual(openstack_utils.v3_to_v2_catalog(CATALOG),
+                         ctxt2.service_catalog)
+        self.assertTrue(ctxt2.is_admin)
+        self.assertNotEqual(ctxt1.request_id, ctxt2.request_id)
+
+    def test_token_refreshed_before_expiry(self):
+        self.flags(ha_token_refresh_margin=120)
+        self.provider.get_context()
+        self.access_info.will_expire_soon.return_value = True
+        self.provider.get_context()
+        self.access_info.will_expire_soon.assert_called_with(120)
+        self.assertEqual(2, self.auth_plugin.get_access.call_count)
+        self.assertEqual(2, self.auth_plugin.invalidate.call_count)
+        # the session is still shared
+        self.assertEqual(1, openstack_utils.create_client_session.call_count)
+
+    def test_fallback(self):
+        self.auth_plugin.get_access.side_effect = Exception('unreachable')
+        self.assertEqual(self.fallback.return_value,
+                         self.provider.get_context())
+        self.auth_plugin.get_access.side_effect = None
+        self.assertEqual('token1', self.provider.get_context().auth_token)
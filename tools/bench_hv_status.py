@@ -0,0 +1,97 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Memory benchmark of the HypervisorStatus representation.
+
+Compares the HA status of hypervisors kept as the version 2.0 dicts with
+strtime() timestamps (what HypervisorStatus used to hold) with the
+HAHypervisorRecord objects.
+
+Usage: python -m hastack.tools.bench_hv_status [hypervisors] [vms]
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import uuid
+
+from oslo_utils import timeutils
+import six
+
+from hastack.has.stack.haservice import constants as ha_constants
+from hastack.has.stack import hv_status
+
+
+def _deep_size(obj, seen):
+    """Bytes held by an object and all the objects it references."""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += _deep_size(key, seen) + _deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for item in obj:
+            size += _deep_size(item, seen)
+    elif hasattr(obj, '__slots__'):
+        for field in obj.__slots__:
+            size += _deep_size(getattr(obj, field), seen)
+    return size
+
+
+def _make_doc(hypervisors, vms):
+    states = ha_constants.STATE_LIST_HA
+    now = time.time()
+    ha = {}
+    for i in range(hypervisors):
+        inst_uuids = [six.text_type(uuid.uuid4()) for _ in range(vms)]
+        ha['compute%d' % i] = {
+            # as parsed from JSON, each hypervisor has a copy of its state
+            'state': ''.join(states[i % len(states)]),
+            'created_at': timeutils.strtime(),
+            'updated_at': timeutils.strtime(),
+            'moving_insts': dict((inst_uuid, 'compute%d' % (i + 1))
+                                 for inst_uuid in inst_uuids),
+            'inst_start': dict((inst_uuid, now) for inst_uuid in inst_uuids),
+            'failed_instances': inst_uuids[:1]}
+    return {'version': hv_status.VERSION, 'ha': ha}
+
+
+def main(argv):
+    hypervisors = int(argv[1]) if len(argv) > 1 else 10000
+    vms = int(argv[2]) if len(argv) > 2 else 50
+    doc = _make_doc(hypervisors, vms)
+    status = hv_status.HypervisorStatus(doc)
+
+    # the instance uuids and host names are shared by both representations
+    shared = set()
+    for entry in doc['ha'].values():
+        for inst_uuid, host in entry['moving_insts'].items():
+            _deep_size(inst_uuid, shared)
+            _deep_size(host, shared)
+    dicts = _deep_size(doc['ha'], set(shared))
+    records = _deep_size(status.ha_hvs, set(shared))
+    print('hypervisors: %d, vms per hypervisor: %d' % (hypervisors, vms))
+    print('dicts:   %.1f MB, %.0f bytes/hypervisor'
+          % (dicts / 1048576.0, float(dicts) / hypervisors))
+    print('records: %.1f MB, %.0f bytes/hypervisor'
+          % (records / 1048576.0, float(records) / hypervisors))
+    print('saving:  %.1f%%' % (100.0 * (dicts - records) / dicts))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
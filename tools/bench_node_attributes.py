@@ -0,0 +1,124 @@
+# Copyright (c) 2016 Fiberhome
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark of the compute node attributes parsing per HA cycle.
+
+Compares parsing stats/metrics on every parallelism check and BMC probe
+(what the engine used to do) with the NodeAttributesCache.
+
+Every cycle the updated_at of a share of the nodes changes, as nova-compute
+saves its compute node when its resources change; the cache parses those
+nodes again. By default half of them change, i.e. every node reports a
+change every update_resources_interval (60 seconds) and the HA cycle runs
+every ha_period_interval (30 seconds).
+
+Usage: python -m hastack.tools.bench_node_attributes [nodes] [cycles]
+           [percent of the nodes changed per cycle]
+"""
+
+from __future__ import print_function
+
+import ast
+import datetime
+import itertools
+import sys
+import timeit
+
+from oslo_serialization import jsonutils
+
+from hastack.has.stack.haservice import constants as ha_constants
+from hastack.has.stack.haservice import node_cache
+
+
+def _make_nodes(count):
+    updated_at = datetime.datetime(2016, 1, 1)
+    nodes = []
+    for i in range(count):
+        stats = {ha_constants.PARALLEL_REBUILD: '5',
+                 ha_constants.PARALLEL_DEST_REBUILD: '10',
+                 'num_instances': str(i % 50),
+                 'num_vm_active': str(i % 50),
+                 'io_workload': '0'}
+        metrics = [{'name': 'bmc', 'value': '10.0.%d.%d' % (i // 256,
+                                                             i % 256)},
+                   {'name': 'user', 'value': 'admin'},
+                   {'name': 'password', 'value': 'secret'},
+                   {'name': 'cpu.frequency', 'value': 2400}]
+        nodes.append({'id': i,
+                      'hypervisor_hostname': 'compute%d' % i,
+                      'updated_at': updated_at,
+                      'stats': jsonutils.dumps(stats),
+                      'metrics': jsonutils.dumps(metrics)})
+    return nodes
+
+
+def _touch(nodes, changed, cycle):
+    """Change the updated_at of the next changed nodes."""
+    start = cycle * changed
+    for i in range(start, start + changed):
+        node = nodes[i % len(nodes)]
+        node['updated_at'] += datetime.timedelta(seconds=1)
+
+
+def _uncached_cycle(nodes):
+    for node in nodes:
+        stats = ast.literal_eval(node['stats'] or {})
+        int(stats.get(ha_constants.PARALLEL_REBUILD,
+                      ha_constants.DEFAULT_PARALLEL_REBUILD))
+        stats = ast.literal_eval(node['stats'] or {})
+        int(stats.get(ha_constants.PARALLEL_DEST_REBUILD,
+                      ha_constants.DEFAULT_PARALLEL_DEST_REBUILD))
+        for metric in jsonutils.loads(str(node['metrics'] or {})):
+            metric.get('name', '')
+
+
+def _cached_cycle(cache, nodes):
+    for node in nodes:
+        attrs = cache.get(node)
+        attrs.parallel_rebuild
+        attrs.parallel_dest_rebuild
+        attrs.bmc
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 5000
+    cycles = int(argv[2]) if len(argv) > 2 else 10
+    percent = float(argv[3]) if len(argv) > 3 else 50
+    changed = int(count * percent / 100)
+    nodes = _make_nodes(count)
+    cache = node_cache.NodeAttributesCache()
+    cycle_counter = itertools.count()
+
+    def uncached_cycle():
+        _touch(nodes, changed, next(cycle_counter))
+        _uncached_cycle(nodes)
+
+    def cached_cycle():
+        _touch(nodes, changed, next(cycle_counter))
+        _cached_cycle(cache, nodes)
+
+    uncached = timeit.timeit(uncached_cycle, number=cycles)
+    # fill the cache first, like the first cycle after a restart
+    _cached_cycle(cache, nodes)
+    cached = timeit.timeit(cached_cycle, number=cycles)
+    print('nodes: %d, cycles: %d, changed per cycle: %d'
+          % (count, cycles, changed))
+    print('uncached: %.2f ms/cycle' % (uncached * 1000 / cycles))
+    print('cached:   %.2f ms/cycle' % (cached * 1000 / cycles))
+    print('speedup:  %.1fx' % (uncached / cached))
+
+
+if __name__ == '__main__':
+    main(sys.argv)